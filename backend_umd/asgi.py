@@ -0,0 +1,4 @@
+from umd_app.asgi import create_asgi_app
+
+# ASGI entry point, e.g. `uvicorn asgi:app --workers 4` (see umd_app/asgi.py)
+app = create_asgi_app()
@@ -0,0 +1,132 @@
+"""Per-upload cost of the budget alert check as a month fills up.
+
+Uploads N bills into one branch and month through the upload endpoint, with
+the alert engine evaluating inline (ALERT_WORKERS=0) so its work is part of
+each request. For every window of uploads it reports the median request time
+and the SQL statements per upload, next to the time the old check (re-summing
+the period's budget and bills on every upload) takes at that point. It also
+lists the alerts raised, which should be one per threshold tier crossed.
+
+    cd backend_umd
+    python -m benchmarks.alert_upload --uploads 2000 --windows 10
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+
+from benchmarks.common import last_months, login, seed, timed, use_sqlite
+
+# The statements upload_utility_bill used to run for every bill
+LEGACY_CHECK = [
+    ("""
+        SELECT ISNULL(SUM(total_budget), 0)
+        FROM budget
+        WHERE branch_id = ? AND year = ? AND month = ? AND status = 1
+    """, "period"),
+    ("""
+        SELECT ISNULL(SUM(amount), 0)
+        FROM utility_bills
+        WHERE branch_id = ? AND year = ? AND month = ? AND status = 1
+    """, "period"),
+    ("""
+        SELECT budget_alert_threshold FROM branches WHERE branch_id = ?
+    """, "branch"),
+]
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+AMOUNT = 100
+
+
+def legacy_check(cursor, branch_id, year, month):
+    for sql, kind in LEGACY_CHECK:
+        cursor.execute(sql, (branch_id, year, month) if kind == "period" else (branch_id,))
+        cursor.fetchone()
+
+
+def run(db_path, uploads, windows):
+    os.environ['ALERT_WORKERS'] = '0'
+    os.environ['SQL_INSTRUMENTATION'] = '1'
+    os.environ.setdefault('SESSION_TYPE', 'memory')
+    from umd_app import create_app
+    from umd_app.db import pooled_connection
+
+    use_sqlite(db_path)
+    data = seed(branches=1, months=1, bills_per_month=0, budgets_per_month=0)
+    business = data["businesses"][0]
+    branch_id = business["branch_ids"][0]
+    year, month = last_months(1)[0]
+
+    app = create_app()
+    app.testing = True
+    admin = login(app.test_client(), business["admin_email"])
+    manager = login(app.test_client(), business["managers"][0])
+
+    # Sized so the month crosses the 90% and 100% tiers near the end of the run
+    budget = uploads * AMOUNT * 0.95
+    response = admin.post('/api/budget/add', json={
+        "branch_id": branch_id, "year": year, "month": month, "total_budget": budget})
+    if response.status_code != 201:
+        raise RuntimeError(f"add budget: {response.get_data(as_text=True)}")
+
+    window = max(1, uploads // windows)
+    results = []
+    durations, queries = [], []
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        for number in range(1, uploads + 1):
+            start = time.perf_counter()
+            response = manager.post('/api/utility/utility-bills/upload', data={
+                "utility_type_id": "1", "year": str(year), "month": str(month),
+                "units_used": "1", "amount": str(AMOUNT)}, content_type='multipart/form-data')
+            durations.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 201:
+                raise RuntimeError(f"upload {number}: {response.get_data(as_text=True)}")
+            match = _QUERIES.search(response.headers.get("Server-Timing", ""))
+            queries.append(int(match.group(1)) if match else None)
+
+            if number % window == 0 or number == uploads:
+                legacy_ms, _ = timed(lambda: legacy_check(cursor, branch_id, year, month))
+                counted = [q for q in queries if q is not None]
+                results.append({
+                    "bills_in_month": number,
+                    "upload_median_ms": round(statistics.median(durations), 3),
+                    "queries_per_upload": max(counted) if counted else None,
+                    "legacy_check_ms": legacy_ms,
+                })
+                durations, queries = [], []
+
+        cursor.execute("""
+            SELECT alert_type, message FROM alerts
+            WHERE branch_id = ? AND alert_type <> 'budget_reminder'
+            ORDER BY alertsid
+        """, (branch_id,))
+        alerts = [{"alert_type": row[0], "message": row[1]} for row in cursor.fetchall()]
+        cursor.close()
+
+    return {"uploads": uploads, "budget": budget, "windows": results, "alerts": alerts}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=2000)
+    parser.add_argument('--windows', type=int, default=10,
+                        help="number of reporting windows the uploads are split into")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.gettempdir(), 'umd_bench_alerts.db')
+    report = json.dumps(run(db_path, args.uploads, args.windows), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Load test of the main API endpoints, for tracking regressions per commit.
+
+Seeds a synthetic dataset into a throwaway SQLite database, then drives the
+real create_app() endpoints with concurrent clients (one Flask test client
+per thread, in-process, so no server is needed) and reports, per endpoint:
+requests, errors, requests/s, p50/p95/p99 latency and SQL statements per
+request (from the Server-Timing header of SQL_INSTRUMENTATION=1).
+
+    login          POST /api/auth/login
+    summary        POST /api/dashboard/summary              (admin)
+    compare        POST /api/dashboard/branches/compare     (admin)
+    expenses_all   POST /api/dashboard/expenses/all         (admin, page 1)
+    upload         POST /api/utility/utility-bills/upload   (manager)
+    alerts         GET  /api/alert/alerts                   (admin)
+
+Every client sends the same number of requests, so runs with the same
+arguments do the same work. The JSON report carries the commit and settings;
+pass an earlier report as --baseline to list endpoints whose p95 got slower
+by more than --tolerance (and exit 1 if any did):
+
+    cd backend_umd
+    python -m benchmarks.api_load --clients 8 --requests 50 --output results.json
+    python -m benchmarks.api_load --clients 8 --requests 50 --baseline results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import PASSWORD, last_months, percentiles, seed, use_sqlite
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+ENDPOINTS = ["login", "summary", "compare", "expenses_all", "upload", "alerts"]
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _requests(business, period):
+    year, month = period
+    admin = business["admin_email"]
+    manager = business["managers"][0]
+
+    def upload(client):
+        return client.post('/api/utility/utility-bills/upload', data={
+            "utility_type_id": "1", "year": str(year), "month": str(month),
+            "units_used": "1", "amount": "1", "media_type": "image",
+            "media_file": (io.BytesIO(b"\x89PNG\r\n\x1a\n" + b"0" * 4096), "bill.png"),
+        }, content_type='multipart/form-data')
+
+    # endpoint -> (user to log in as, or None for the login endpoint itself; request)
+    return {
+        "login": (None, lambda client: client.post(
+            '/api/auth/login', json={"email": manager, "password": PASSWORD})),
+        "summary": (admin, lambda client: client.post('/api/dashboard/summary', json={})),
+        "compare": (admin, lambda client: client.post('/api/dashboard/branches/compare', json={})),
+        "expenses_all": (admin, lambda client: client.post(
+            '/api/dashboard/expenses/all', json={"page": 1, "page_size": 20})),
+        "upload": (manager, upload),
+        "alerts": (admin, lambda client: client.get('/api/alert/alerts')),
+    }
+
+
+def run_endpoint(app, endpoint, user, send, clients, requests):
+    samples = []
+    failures = []
+    lock = threading.Lock()
+    ready = threading.Barrier(clients + 1)
+
+    def worker():
+        client = app.test_client()
+        if user is not None:
+            response = client.post('/api/auth/login', json={"email": user, "password": PASSWORD})
+            if response.status_code != 200:
+                failures.append(f"login {user}: {response.status_code}")
+        local = []
+        ready.wait()
+        for _ in range(requests):
+            start = time.perf_counter()
+            response = send(client)
+            elapsed = (time.perf_counter() - start) * 1000
+            response.get_data()
+            match = _QUERIES.search(response.headers.get("Server-Timing", ""))
+            local.append((response.status_code, elapsed, int(match.group(1)) if match else None))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if failures:
+        raise RuntimeError(f"{endpoint}: {failures[0]}")
+
+    ok = [ms for status, ms, _ in samples if status < 400]
+    queries = [q for status, _, q in samples if status < 400 and q is not None]
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "throughput_rps": round(len(ok) / elapsed, 1) if elapsed else None,
+        **percentiles(ok),
+        "queries_median": statistics.median(queries) if queries else None,
+        "queries_max": max(queries) if queries else None,
+    }
+
+
+def run(args):
+    os.environ['SQL_INSTRUMENTATION'] = '1'
+    os.environ.setdefault('SESSION_TYPE', 'memory')
+    os.environ.setdefault('SCHEDULER_ENABLED', '0')
+    os.environ.setdefault('CACHE_BACKEND', args.cache)
+    # The seeded hashes are cost 4; a different cost would rehash them on login
+    os.environ.setdefault('BCRYPT_ROUNDS', '4')
+    from umd_app import alert_engine, create_app
+
+    workdir = tempfile.mkdtemp(prefix="umd_bench_api_")
+    use_sqlite(os.path.join(workdir, "bench.db"))
+    data = seed(businesses=args.businesses, branches=args.branches, months=args.months,
+                bills_per_month=args.bills_per_month, alerts_per_month=args.alerts_per_month)
+    business = data["businesses"][0]
+
+    # Uploaded attachments land under the working directory
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        app = create_app()
+        app.testing = True
+        requests = _requests(business, last_months(1)[0])
+        results = {}
+        for endpoint in args.endpoints:
+            user, send = requests[endpoint]
+            results[endpoint] = run_endpoint(app, endpoint, user, send, args.clients, args.requests)
+        alert_engine.drain()
+    finally:
+        os.chdir(cwd)
+
+    return {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "settings": {
+            "clients": args.clients, "requests_per_client": args.requests,
+            "cache_backend": os.environ.get('CACHE_BACKEND'),
+        },
+        "dataset": {
+            "businesses": args.businesses, "branches_per_business": args.branches,
+            "months": args.months, "bills": data["bills"], "budgets": data["budgets"],
+            "alerts": data["alerts"],
+        },
+        "endpoints": results,
+    }
+
+
+def regressions(report, baseline, tolerance):
+    slower = []
+    for endpoint, result in report["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(endpoint)
+        if not before or not before.get("p95_ms") or result.get("p95_ms") is None:
+            continue
+        ratio = result["p95_ms"] / before["p95_ms"]
+        if ratio > 1 + tolerance:
+            slower.append({"endpoint": endpoint, "baseline_p95_ms": before["p95_ms"],
+                           "p95_ms": result["p95_ms"], "ratio": round(ratio, 2)})
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--businesses', type=int, default=1)
+    parser.add_argument('--branches', type=int, default=5, help="branches per business")
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--bills-per-month', type=int, default=30)
+    parser.add_argument('--alerts-per-month', type=int, default=3)
+    parser.add_argument('--clients', type=int, default=8, help="concurrent clients")
+    parser.add_argument('--requests', type=int, default=50, help="requests per client and endpoint")
+    parser.add_argument('--endpoints', nargs='+', default=ENDPOINTS, choices=ENDPOINTS)
+    parser.add_argument('--cache', default='none', choices=['none', 'memory'],
+                        help="CACHE_BACKEND for the run (unless already set)")
+    parser.add_argument('--baseline', help="earlier report to compare p95 latencies with")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed p95 slowdown against the baseline (0.2 = 20%%)")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    # The routes print debugging output; keep stdout for the report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report["regressions"] = regressions(report, json.load(f), args.tolerance)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    if report.get("regressions"):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import os
+import random
+import time
+from datetime import datetime
+
+import bcrypt
+
+# Shared helpers for the scripts in this package. They point the app at a
+# throwaway SQLite file (DB_BACKEND=sqlite), create the schema and fill it
+# with synthetic businesses, branches, budgets and bills.
+
+PASSWORD = "bench-pass"
+
+
+def use_sqlite(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    os.environ['DB_BACKEND'] = 'sqlite'
+    os.environ['DB_SQLITE_PATH'] = path
+
+    from umd_app import db
+    db.reset_pool()
+
+    import init_db
+    init_db.apply_schema()
+    init_db.seed_utility_types()
+
+
+def last_months(count, today=None):
+    today = today or datetime.now()
+    year, month = today.year, today.month
+    periods = []
+    for _ in range(count):
+        periods.append((year, month))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(periods))
+
+
+ALERT_KINDS = [
+    ("budget_warning", "medium", "Expenses reached 90% of budget"),
+    ("budget_exceeded", "High", "Expenses reached 100% of budget"),
+    ("missing_budget", "High", "No budget defined for this period"),
+]
+
+
+def seed(businesses=1, branches=3, months=12, bills_per_month=10,
+         budgets_per_month=1, alerts_per_month=0, seed_value=42):
+    """Insert synthetic data and rebuild the rollup.
+
+    Returns {"businesses": [{"business_id", "admin_email", "managers": [...],
+    "branch_ids": [...]}], "bills": n, "budgets": n, "alerts": n}.
+    """
+    from umd_app import rollup
+    from umd_app.db import pooled_connection
+
+    rng = random.Random(seed_value)
+    password = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(4)).decode()
+    periods = last_months(months)
+    result = {"businesses": [], "bills": 0, "budgets": 0, "alerts": 0}
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM utility_expense_types")
+        type_ids = [row[0] for row in cursor.fetchall()]
+
+        for b in range(businesses):
+            cursor.execute("""
+                INSERT INTO business (business_name, industry, email, contact_person, req_status)
+                OUTPUT INSERTED.business_id
+                VALUES (?, 'Retail', ?, 'Bench', 'approved')
+            """, (f"Bench {b}", f"owner{b}@bench.local"))
+            business_id = cursor.fetchone()[0]
+
+            admin_email = f"admin{b}@bench.local"
+            cursor.execute("""
+                INSERT INTO users (username, email, contact_no, userpassword, role_id, business_id)
+                OUTPUT INSERTED.user_id
+                VALUES (?, ?, '0', ?, 1, ?)
+            """, (f"admin{b}", admin_email, password, business_id))
+            admin_id = cursor.fetchone()[0]
+
+            info = {"business_id": business_id, "admin_email": admin_email,
+                    "managers": [], "branch_ids": []}
+            for r in range(branches):
+                manager_email = f"mgr{b}_{r}@bench.local"
+                cursor.execute("""
+                    INSERT INTO users (username, email, contact_no, userpassword, role_id, business_id)
+                    OUTPUT INSERTED.user_id
+                    VALUES (?, ?, '0', ?, 2, ?)
+                """, (f"mgr{b}_{r}", manager_email, password, business_id))
+                manager_id = cursor.fetchone()[0]
+
+                cursor.execute("""
+                    INSERT INTO branches (branch_name, blocation, business_id, handled_by)
+                    OUTPUT INSERTED.branch_id
+                    VALUES (?, 'Bench', ?, ?)
+                """, (f"Branch {b}-{r}", business_id, manager_id))
+                branch_id = cursor.fetchone()[0]
+                info["managers"].append(manager_email)
+                info["branch_ids"].append(branch_id)
+
+                budgets = []
+                bills = []
+                for year, month in periods:
+                    created = datetime(year, month, 1, 9, 0, 0)
+                    for _ in range(budgets_per_month):
+                        budgets.append((branch_id, year, month,
+                                        rng.randint(50, 150) * bills_per_month * 10,
+                                        admin_id, created))
+                    for i in range(bills_per_month):
+                        uploaded = datetime(year, month, 1 + i % 28, 8 + i % 10, i % 60, 0)
+                        bills.append((branch_id, rng.choice(type_ids), year, month,
+                                      rng.randint(1, 500), rng.randint(500, 1500),
+                                      manager_id, uploaded))
+
+                cursor.fast_executemany = True
+                cursor.executemany("""
+                    INSERT INTO budget (branch_id, year, month, total_budget, allocated_by, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, budgets)
+                cursor.executemany("""
+                    INSERT INTO utility_bills
+                        (branch_id, utility_type_id, year, month, units_used, amount, uploaded_by, uploaded_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, bills)
+                result["budgets"] += len(budgets)
+                result["bills"] += len(bills)
+
+                if alerts_per_month:
+                    # Alerts point at one of their period's bills when it has any
+                    cursor.execute("SELECT id, year, month FROM utility_bills WHERE branch_id = ?",
+                                   (branch_id,))
+                    period_bills = {}
+                    for bill_id, year, month in cursor.fetchall():
+                        period_bills.setdefault((int(year), int(month)), []).append(bill_id)
+                    alerts = []
+                    for year, month in periods:
+                        for i in range(alerts_per_month):
+                            alert_type, severity, message = ALERT_KINDS[i % len(ALERT_KINDS)]
+                            candidates = period_bills.get((year, month))
+                            alerts.append((branch_id, rng.choice(candidates) if candidates else None,
+                                           alert_type, severity, message,
+                                           int(rng.random() < 0.3), int(rng.random() < 0.5),
+                                           datetime(year, month, 1 + i % 28, 12, 0, 0)))
+                    cursor.executemany("""
+                        INSERT INTO alerts
+                            (branch_id, utility_bill_id, alert_type, severity, message,
+                             is_resolved, is_viewed, created_at)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    """, alerts)
+                    result["alerts"] += len(alerts)
+
+            result["businesses"].append(info)
+
+        rollup.rebuild(cursor)
+        conn.commit()
+        cursor.close()
+
+    return result
+
+
+def login(client, email):
+    response = client.post('/api/auth/login', json={"email": email, "password": PASSWORD})
+    if response.status_code != 200:
+        raise RuntimeError(f"login failed for {email}: {response.get_data(as_text=True)}")
+    return client
+
+
+def timed(fn, repeat=5):
+    # Best-of-N wall time in milliseconds, plus the last result
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best, 3), result
+
+
+def percentiles(values, points=(50, 95, 99)):
+    # Nearest-rank percentiles of a list of milliseconds
+    ordered = sorted(values)
+    if not ordered:
+        return {f"p{p}_ms": None for p in points}
+    return {f"p{p}_ms": round(ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))], 3)
+            for p in points}
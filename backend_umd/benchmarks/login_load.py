@@ -0,0 +1,155 @@
+"""Dashboard latency while a burst of logins is being hashed.
+
+Seeds a SQLite database whose passwords are hashed at --rounds, then starts
+the API in a child process (the threaded WSGI server, see server_modes) and
+runs --dashboard-clients posting /api/dashboard/summary alongside
+--login-clients logging in over and over, for --duration seconds:
+
+    baseline   dashboard clients only
+    inline     PASSWORD_WORKERS=0: bcrypt on the request threads
+    pool       PASSWORD_WORKERS=--workers, PASSWORD_QUEUE=--queue
+
+Prints JSON with requests/s and p50/p95/p99 latency of the dashboard and of
+successful logins per run, and how many logins were refused with 503:
+
+    cd backend_umd
+    python -m benchmarks.login_load --rounds 12 --login-clients 16 --duration 10
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+import bcrypt
+
+from benchmarks.common import PASSWORD, percentiles, seed, use_sqlite
+from benchmarks.server_modes import Client, _free_port, _start
+
+
+def _rehash_users(rounds):
+    from umd_app.db import pooled_connection
+    password = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(rounds)).decode()
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE users SET userpassword = ?", (password,))
+        conn.commit()
+        cursor.close()
+
+
+def run_load(port, business, dashboard_clients, login_clients, duration):
+    samples = []  # (kind, status, ms)
+    lock = threading.Lock()
+    ready = threading.Barrier(dashboard_clients + login_clients + 1)
+    stop = []
+
+    def dashboard_worker():
+        client = Client(port, business["admin_email"])
+        ready.wait()
+        local = []
+        while not stop:
+            start = time.perf_counter()
+            status, _ = client.request("POST", "/api/dashboard/summary", b"{}",
+                                       {"Content-Type": "application/json"})
+            local.append(("dashboard", status, (time.perf_counter() - start) * 1000))
+        with lock:
+            samples.extend(local)
+
+    def login_worker(email):
+        client = Client(port, email)
+        body = json.dumps({"email": email, "password": PASSWORD}).encode()
+        ready.wait()
+        local = []
+        while not stop:
+            start = time.perf_counter()
+            status, _ = client.request("POST", "/api/auth/login", body,
+                                       {"Content-Type": "application/json"})
+            local.append(("login", status, (time.perf_counter() - start) * 1000))
+        with lock:
+            samples.extend(local)
+
+    accounts = [business["admin_email"]] + business["managers"]
+    threads = [threading.Thread(target=dashboard_worker) for _ in range(dashboard_clients)]
+    threads += [threading.Thread(target=login_worker, args=(accounts[n % len(accounts)],))
+                for n in range(login_clients)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.append(True)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {}
+    for kind in ("dashboard", "login"):
+        rows = [row for row in samples if row[0] == kind]
+        if not rows:
+            continue
+        ok = [ms for _, status, ms in rows if status is not None and status < 400]
+        result[kind] = {"requests": len(rows), "errors": len(rows) - len(ok),
+                        "throughput_rps": round(len(ok) / elapsed, 1), **percentiles(ok)}
+        if kind == "login":
+            result[kind]["refused_503"] = sum(1 for row in rows if row[1] == 503)
+    return result
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="umd_bench_login_")
+    db_path = os.path.join(workdir, "bench.db")
+    use_sqlite(db_path)
+    data = seed(branches=4, months=12, bills_per_month=20)
+    _rehash_users(args.rounds)
+    business = data["businesses"][0]
+
+    runs = {
+        "baseline": ({"PASSWORD_WORKERS": str(args.workers)}, 0),
+        "inline": ({"PASSWORD_WORKERS": "0"}, args.login_clients),
+        "pool": ({"PASSWORD_WORKERS": str(args.workers), "PASSWORD_QUEUE": str(args.queue)},
+                 args.login_clients),
+    }
+    report = {"rounds": args.rounds, "server_threads": args.threads,
+              "dashboard_clients": args.dashboard_clients, "login_clients": args.login_clients,
+              "workers": args.workers, "queue": args.queue, "duration_s": args.duration,
+              "runs": {}}
+    for name in args.runs:
+        extra_env, login_clients = runs[name]
+        extra_env = dict(extra_env, BCRYPT_ROUNDS=str(args.rounds))
+        port = _free_port()
+        process = _start("wsgi", port, db_path, args.threads, "werkzeug", workdir, extra_env)
+        try:
+            report["runs"][name] = run_load(port, business, args.dashboard_clients,
+                                            login_clients, args.duration)
+        finally:
+            process.terminate()
+            process.wait(10)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', nargs='+', default=['baseline', 'inline', 'pool'],
+                        choices=['baseline', 'inline', 'pool'])
+    parser.add_argument('--rounds', type=int, default=12, help="bcrypt cost of the seeded passwords")
+    parser.add_argument('--dashboard-clients', type=int, default=8)
+    parser.add_argument('--login-clients', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=2, help="PASSWORD_WORKERS for the pool run")
+    parser.add_argument('--queue', type=int, default=32, help="PASSWORD_QUEUE for the pool run")
+    parser.add_argument('--threads', type=int, default=32,
+                        help="server threads and DB_POOL_SIZE")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
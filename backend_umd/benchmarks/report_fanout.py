@@ -0,0 +1,171 @@
+"""Regression benchmark for the budget/bill join fan-out in the report routes.
+
+The report queries used to LEFT JOIN budget and utility_bills in the same
+statement and SUM both sides, so every budget row was repeated once per bill
+and the intermediate result grew with budgets x bills. They now read
+per-period totals that were aggregated separately (branch_month_rollup).
+
+For each bill-history size this script seeds a fresh SQLite database, counts
+the rows the old join shape produced, times the old SQL next to the current
+endpoints, and prints the results as JSON:
+
+    cd backend_umd
+    python -m benchmarks.report_fanout --sizes 10 40 160 --months 12
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from benchmarks.common import login, seed, timed, use_sqlite
+
+# The pre-aggregation statements, kept here as the baseline to compare against
+LEGACY_QUERIES = {
+    "branch_performance": """
+        SELECT b.branch_id, b.branch_name,
+               ISNULL(SUM(bg.total_budget), 0) AS total_budget,
+               ISNULL(SUM(ub.amount), 0) AS total_expense
+        FROM branches b
+        LEFT JOIN budget bg ON b.branch_id = bg.branch_id
+        LEFT JOIN utility_bills ub ON b.branch_id = ub.branch_id
+        WHERE b.business_id = ? AND b.status = 1
+        GROUP BY b.branch_id, b.branch_name
+    """,
+    "profit_loss_summary": """
+        SELECT b.branch_id, b.branch_name,
+               ISNULL(SUM(bg.total_budget), 0) AS budget,
+               ISNULL(SUM(ub.amount), 0) AS expense
+        FROM branches b
+        LEFT JOIN budget bg ON bg.branch_id = b.branch_id
+            AND bg.status = 1 AND bg.year = ? AND bg.month = ?
+        LEFT JOIN utility_bills ub ON ub.branch_id = b.branch_id
+            AND ub.status = 1 AND ub.year = ? AND ub.month = ?
+        WHERE b.business_id = ?
+        GROUP BY b.branch_id, b.branch_name
+    """,
+    "budget_history": """
+        SELECT bg.year, bg.month, bg.total_budget, ISNULL(SUM(ub.amount), 0) AS total_spent
+        FROM budget bg
+        LEFT JOIN utility_bills ub
+            ON bg.branch_id = ub.branch_id AND bg.year = ub.year AND bg.month = ub.month
+        WHERE bg.branch_id = ?
+        GROUP BY bg.year, bg.month, bg.total_budget
+    """,
+}
+
+
+def joined_rows(cursor, sql, params):
+    # Size of the join before GROUP BY collapses it, i.e. the rows the
+    # database had to produce and aggregate
+    body = sql[sql.index("FROM"):sql.index("GROUP BY")]
+    cursor.execute(f"SELECT COUNT(*) {body}", params)
+    return cursor.fetchone()[0]
+
+
+def run_size(db_path, bills_per_month, months, branches, budgets_per_month):
+    from umd_app import create_app
+    from umd_app.db import pooled_connection
+
+    use_sqlite(db_path)
+    data = seed(branches=branches, months=months, bills_per_month=bills_per_month,
+                budgets_per_month=budgets_per_month)
+    business = data["businesses"][0]
+    business_id = business["business_id"]
+    branch_id = business["branch_ids"][0]
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT TOP 1 year, month FROM branch_month_rollup
+            WHERE branch_id = ? ORDER BY year DESC, month DESC
+        """, (branch_id,))
+        year, month = cursor.fetchone()
+        legacy_params = {
+            "branch_performance": (business_id,),
+            "profit_loss_summary": (year, month, year, month, business_id),
+            "budget_history": (branch_id,),
+        }
+
+        legacy = {}
+        for name, sql in LEGACY_QUERIES.items():
+            params = legacy_params[name]
+
+            def run(sql=sql, params=params):
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+
+            ms, _ = timed(run)
+            legacy[name] = {"ms": ms, "rows_processed": joined_rows(cursor, sql, params)}
+
+        # Join sizes of the current reads: each budget or branch row meets at most
+        # one rollup row per period
+        cursor.execute("SELECT COUNT(*) FROM branch_month_rollup r JOIN branches b "
+                       "ON b.branch_id = r.branch_id WHERE b.business_id = ?", (business_id,))
+        rollup_rows = cursor.fetchone()[0]
+        cursor.execute("SELECT COUNT(*) FROM budget WHERE branch_id = ?", (branch_id,))
+        branch_budget_rows = cursor.fetchone()[0]
+        cursor.close()
+
+    app = create_app()
+    app.testing = True
+    client = login(app.test_client(), business["admin_email"])
+    endpoints = {
+        "branch_performance": (
+            lambda: client.post('/api/dashboard/branches/compare'), rollup_rows),
+        "profit_loss_summary": (
+            lambda: client.get(f'/api/dashboard/reports/profit-loss/summary?year={year}&month={month}'),
+            branches),
+        "budget_history": (
+            lambda: client.get(f'/api/budget/budgets/history/{branch_id}'
+                               f'?role_id=1&business_id={business_id}&page_size=100'),
+            branch_budget_rows),
+    }
+    current = {}
+    for name, (call, rows) in endpoints.items():
+        ms, response = timed(call)
+        if response.status_code != 200:
+            raise RuntimeError(f"{name}: {response.status_code} {response.get_data(as_text=True)}")
+        current[name] = {"ms": ms, "rows_processed": rows}
+
+    return {
+        "bills_per_month": bills_per_month,
+        "bills": data["bills"],
+        "budgets": data["budgets"],
+        "legacy_sql": legacy,
+        "current_endpoint": current,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 40, 160],
+                        help="bills per branch per month to benchmark")
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--branches', type=int, default=3)
+    parser.add_argument('--budgets-per-month', type=int, default=2,
+                        help="budget rows per period (revisions fan out the old join)")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.gettempdir(), 'umd_bench_fanout.db')
+    results = [run_size(db_path, size, args.months, args.branches, args.budgets_per_month)
+               for size in args.sizes]
+
+    # Rows processed per bill: flat for the current reads, growing for the old join
+    for result in results:
+        for side in ("legacy_sql", "current_endpoint"):
+            for metrics in result[side].values():
+                metrics["rows_per_bill"] = round(metrics["rows_processed"] / result["bills"], 4)
+
+    report = json.dumps({"months": args.months, "branches": args.branches,
+                         "budgets_per_month": args.budgets_per_month,
+                         "results": results}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
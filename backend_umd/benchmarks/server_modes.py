@@ -0,0 +1,267 @@
+"""Throughput and latency of the API under the WSGI and ASGI server modes.
+
+Seeds a SQLite database, then for each mode starts the app in a child
+process on a local port and drives it with concurrent HTTP clients:
+
+    wsgi   the threaded WSGI server `python run.py` uses (werkzeug), or
+           gunicorn with gthread workers (--wsgi-server gunicorn)
+    asgi   uvicorn in front of umd_app.asgi.AsgiAdapter (needs uvicorn)
+
+Scenarios, each run for --duration seconds:
+
+    dashboard    admins posting /api/dashboard/summary
+    upload       managers uploading a bill with a 64 KB attachment
+    slow_upload  half the clients upload while trickling the body over
+                 ~0.5 s, the other half load the dashboard; shows whether
+                 slow uploads hold server threads the dashboard needs
+
+Prints JSON with requests, errors, requests/s and p50/p95/p99 latency per
+mode and scenario (and per request kind for slow_upload):
+
+    cd backend_umd
+    python -m benchmarks.server_modes --clients 32 --duration 10
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks.common import PASSWORD, last_months, percentiles, seed, use_sqlite
+
+ATTACHMENT = b"\x89PNG\r\n\x1a\n" + os.urandom(64 * 1024)
+TRICKLE_PARTS = 10
+TRICKLE_DELAY = 0.05
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(mode, port, threads, wsgi_server):
+    # Runs in the child process
+    if mode == "asgi":
+        import uvicorn
+        from umd_app.asgi import AsgiAdapter
+        from umd_app import create_app
+        uvicorn.run(AsgiAdapter(create_app(), threads=threads), host="127.0.0.1", port=port,
+                    log_level="warning", access_log=False)
+    elif wsgi_server == "gunicorn":
+        os.execvp("gunicorn", ["gunicorn", "-b", f"127.0.0.1:{port}", "-w", "1",
+                               "-k", "gthread", "--threads", str(threads), "run:app"])
+    else:
+        from werkzeug.serving import make_server
+        from umd_app import create_app
+        make_server("127.0.0.1", port, create_app(), threaded=True).serve_forever()
+
+
+def _start(mode, port, db_path, threads, wsgi_server, workdir, extra_env=None):
+    # BCRYPT_ROUNDS matches the cost of the seeded password hashes
+    env = dict(os.environ, DB_BACKEND="sqlite", DB_SQLITE_PATH=db_path,
+               DB_POOL_SIZE=str(threads), SESSION_TYPE="memory", SCHEDULER_ENABLED="0",
+               BCRYPT_ROUNDS="4", PYTHONPATH=os.getcwd())
+    env.update(extra_env or {})
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.server_modes", "--serve", mode, "--port", str(port),
+         "--threads", str(threads), "--wsgi-server", wsgi_server],
+        env=env, cwd=workdir, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{mode} server exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+class Client:
+    def __init__(self, port, email):
+        self.port = port
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        self.cookie = None
+        status, _ = self.request("POST", "/api/auth/login",
+                                 json.dumps({"email": email, "password": PASSWORD}).encode(),
+                                 {"Content-Type": "application/json"})
+        if status != 200:
+            raise RuntimeError(f"login failed for {email}: {status}")
+
+    def request(self, method, path, body=None, headers=None, trickle=False):
+        headers = dict(headers or {})
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        try:
+            if trickle:
+                headers["Content-Length"] = str(len(body))
+                self.conn.putrequest(method, path)
+                for name, value in headers.items():
+                    self.conn.putheader(name, value)
+                self.conn.endheaders()
+                step = len(body) // TRICKLE_PARTS + 1
+                for offset in range(0, len(body), step):
+                    self.conn.send(body[offset:offset + step])
+                    time.sleep(TRICKLE_DELAY)
+            else:
+                self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+            return None, b""
+        cookie = response.getheader("Set-Cookie")
+        if cookie:
+            self.cookie = cookie.split(";", 1)[0]
+        return response.status, data
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                     f'{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                     f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'.encode()
+                     + content + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+
+
+def _upload_body(year, month):
+    return _multipart(
+        {"utility_type_id": "1", "year": str(year), "month": str(month),
+         "units_used": "1", "amount": "1", "media_type": "image"},
+        {"media_file": ("bill.png", ATTACHMENT)})
+
+
+def dashboard(client, _):
+    return "dashboard", client.request("POST", "/api/dashboard/summary", b"{}",
+                                       {"Content-Type": "application/json"})[0]
+
+
+def upload(client, period, trickle=False):
+    body, headers = _upload_body(*period)
+    return "upload", client.request("POST", "/api/utility/utility-bills/upload",
+                                    body, headers, trickle=trickle)[0]
+
+
+def run_scenario(port, scenario, clients, duration, business, period):
+    # (client email, action) per client thread
+    plan = []
+    for number in range(clients):
+        manager = business["managers"][number % len(business["managers"])]
+        if scenario == "dashboard":
+            plan.append((business["admin_email"], dashboard))
+        elif scenario == "upload":
+            plan.append((manager, upload))
+        elif number % 2:
+            plan.append((manager, lambda c, p: upload(c, p, trickle=True)))
+        else:
+            plan.append((business["admin_email"], dashboard))
+
+    samples = []
+    lock = threading.Lock()
+    ready = threading.Barrier(clients + 1)
+    stop = []
+
+    def worker(email, action):
+        client = Client(port, email)
+        ready.wait()
+        local = []
+        while not stop:
+            start = time.perf_counter()
+            kind, status = action(client, period)
+            local.append((kind, status, (time.perf_counter() - start) * 1000))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=item) for item in plan]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.append(True)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    def summarize(rows):
+        ok = [ms for _, status, ms in rows if status is not None and status < 400]
+        return {"requests": len(rows), "errors": len(rows) - len(ok),
+                "throughput_rps": round(len(ok) / elapsed, 1), **percentiles(ok)}
+
+    result = summarize(samples)
+    if scenario == "slow_upload":
+        for kind in ("dashboard", "upload"):
+            result[kind] = summarize([row for row in samples if row[0] == kind])
+    return result
+
+
+def run(modes, scenarios, clients, duration, threads, wsgi_server):
+    workdir = tempfile.mkdtemp(prefix="umd_bench_modes_")
+    db_path = os.path.join(workdir, "bench.db")
+    use_sqlite(db_path)
+    data = seed(branches=4, months=12, bills_per_month=20)
+    business = data["businesses"][0]
+    period = last_months(1)[0]
+
+    report = {"clients": clients, "duration_s": duration, "server_threads": threads,
+              "modes": {}}
+    for mode in modes:
+        port = _free_port()
+        process = _start(mode, port, db_path, threads, wsgi_server, workdir)
+        try:
+            report["modes"][mode] = {
+                scenario: run_scenario(port, scenario, clients, duration, business, period)
+                for scenario in scenarios
+            }
+        finally:
+            process.terminate()
+            process.wait(10)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['wsgi', 'asgi'], choices=['wsgi', 'asgi'])
+    parser.add_argument('--scenarios', nargs='+', default=['dashboard', 'upload', 'slow_upload'],
+                        choices=['dashboard', 'upload', 'slow_upload'])
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--threads', type=int, default=10,
+                        help="server threads (gunicorn --threads / ASGI_THREADS) and DB_POOL_SIZE")
+    parser.add_argument('--wsgi-server', default='werkzeug', choices=['werkzeug', 'gunicorn'])
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--serve', choices=['wsgi', 'asgi'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.threads, args.wsgi_server)
+        return
+
+    report = json.dumps(run(args.modes, args.scenarios, args.clients, args.duration,
+                            args.threads, args.wsgi_server), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
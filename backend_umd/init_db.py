@@ -0,0 +1,50 @@
+import argparse
+import os
+
+from umd_app.db import get_backend, pooled_connection
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema')
+
+DEFAULT_UTILITY_TYPES = [
+    ("Electricity", "Energy"),
+    ("Gas", "Energy"),
+    ("Water", "Water"),
+    ("Internet", "Communication"),
+    ("Telephone", "Communication"),
+]
+
+
+def apply_schema():
+    backend = get_backend()
+    with open(os.path.join(SCHEMA_DIR, backend.schema_file), encoding='utf-8') as f:
+        script = f.read()
+    with pooled_connection() as conn:
+        backend.run_script(conn, script)
+    print(f"Applied {backend.schema_file} ({backend.name})")
+
+
+def seed_utility_types():
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM utility_expense_types")
+        if cursor.fetchone()[0]:
+            print("utility_expense_types already populated, skipping")
+            return
+        cursor.executemany("""
+            INSERT INTO utility_expense_types (utility_name, category) VALUES (?, ?)
+        """, DEFAULT_UTILITY_TYPES)
+        conn.commit()
+        cursor.close()
+    print(f"Seeded {len(DEFAULT_UTILITY_TYPES)} utility types")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Create the ExPilot tables for the configured DB_BACKEND.")
+    parser.add_argument('--seed-types', action='store_true',
+                        help="insert the default utility expense types")
+    args = parser.parse_args()
+
+    apply_schema()
+    if args.seed_types:
+        seed_utility_types()
@@ -0,0 +1,231 @@
+-- SQLite schema mirroring the SQL Server tables used by umd_app/routes.
+-- Applied by init_db.py when DB_BACKEND=sqlite.
+
+CREATE TABLE IF NOT EXISTS business (
+    business_id     INTEGER PRIMARY KEY AUTOINCREMENT,
+    business_name   VARCHAR(150) NOT NULL,
+    industry        VARCHAR(100),
+    email           VARCHAR(150),
+    contact_person  VARCHAR(100),
+    req_status      VARCHAR(20) NOT NULL DEFAULT 'pending',
+    status          INTEGER NOT NULL DEFAULT 1,
+    created_at      DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS pending_admins (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    username        VARCHAR(100) NOT NULL,
+    user_email      VARCHAR(150) NOT NULL,
+    contact_no      VARCHAR(30),
+    password        VARCHAR(255) NOT NULL,
+    business_id     INTEGER NOT NULL REFERENCES business (business_id),
+    created_at      DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS users (
+    user_id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    username            VARCHAR(100) NOT NULL UNIQUE,
+    email               VARCHAR(150) NOT NULL UNIQUE,
+    contact_no          VARCHAR(30),
+    userpassword        VARCHAR(255) NOT NULL,
+    role_id             INTEGER NOT NULL,
+    business_id         INTEGER REFERENCES business (business_id),
+    availablecurrently  INTEGER NOT NULL DEFAULT 1,
+    status              INTEGER NOT NULL DEFAULT 1,
+    created_at          DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TABLE IF NOT EXISTS branches (
+    branch_id               INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_name             VARCHAR(150) NOT NULL,
+    blocation               VARCHAR(255),
+    business_id             INTEGER NOT NULL REFERENCES business (business_id),
+    handled_by              INTEGER REFERENCES users (user_id),
+    status                  INTEGER NOT NULL DEFAULT 1,
+    budget_alert_threshold  INTEGER DEFAULT 90,
+    created_at              DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+-- A manager handles at most one branch
+CREATE UNIQUE INDEX IF NOT EXISTS ux_branches_handled_by
+    ON branches (handled_by) WHERE handled_by IS NOT NULL;
+CREATE INDEX IF NOT EXISTS ix_branches_business ON branches (business_id, status);
+
+CREATE TABLE IF NOT EXISTS utility_expense_types (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    utility_name    VARCHAR(100) NOT NULL,
+    category        VARCHAR(100)
+);
+
+CREATE TABLE IF NOT EXISTS budget (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_id       INTEGER NOT NULL REFERENCES branches (branch_id),
+    year            INTEGER NOT NULL,
+    month           INTEGER NOT NULL,
+    total_budget    DECIMAL(12, 2) NOT NULL,
+    allocated_by    INTEGER REFERENCES users (user_id),
+    status          INTEGER NOT NULL DEFAULT 1,
+    created_at      DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS ix_budget_branch_period ON budget (branch_id, year, month);
+CREATE INDEX IF NOT EXISTS ix_budget_branch_created ON budget (branch_id, created_at);
+
+CREATE TABLE IF NOT EXISTS utility_bills (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_id       INTEGER NOT NULL REFERENCES branches (branch_id),
+    utility_type_id INTEGER NOT NULL REFERENCES utility_expense_types (id),
+    year            INTEGER NOT NULL,
+    month           INTEGER NOT NULL,
+    units_used      DECIMAL(12, 2),
+    amount          DECIMAL(12, 2) NOT NULL,
+    uploaded_by     INTEGER REFERENCES users (user_id),
+    status          INTEGER NOT NULL DEFAULT 1,
+    uploaded_at     DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS ix_utility_bills_branch_period ON utility_bills (branch_id, year, month);
+CREATE INDEX IF NOT EXISTS ix_utility_bills_branch_uploaded ON utility_bills (branch_id, uploaded_at);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    alertsid        INTEGER PRIMARY KEY AUTOINCREMENT,
+    branch_id       INTEGER NOT NULL REFERENCES branches (branch_id),
+    utility_bill_id INTEGER REFERENCES utility_bills (id),
+    alert_type      VARCHAR(50) NOT NULL,
+    severity        VARCHAR(20),
+    message         VARCHAR(500),
+    is_resolved     INTEGER NOT NULL DEFAULT 0,
+    resolved_at     DATETIME,
+    is_viewed       INTEGER NOT NULL DEFAULT 0,
+    status          INTEGER NOT NULL DEFAULT 1,
+    created_at      DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS ix_alerts_branch ON alerts (branch_id, status, is_resolved);
+
+CREATE TABLE IF NOT EXISTS media (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    media_name      VARCHAR(255) NOT NULL,
+    media_path      VARCHAR(500) NOT NULL,
+    media_type      VARCHAR(50),
+    uploaded_by     INTEGER REFERENCES users (user_id),
+    business_id     INTEGER REFERENCES business (business_id),
+    branch_id       INTEGER REFERENCES branches (branch_id),
+    utility_bill_id INTEGER REFERENCES utility_bills (id),
+    status          INTEGER NOT NULL DEFAULT 1,
+    uploaded_at     DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS ix_media_utility_bill ON media (utility_bill_id);
+
+-- Running per-branch, per-month totals maintained by umd_app/rollup.py
+CREATE TABLE IF NOT EXISTS branch_month_rollup (
+    branch_id       INTEGER NOT NULL REFERENCES branches (branch_id),
+    year            INTEGER NOT NULL,
+    month           INTEGER NOT NULL,
+    budget_total    DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    expense_total   DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    bill_count      INTEGER NOT NULL DEFAULT 0,
+    alert_count     INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (branch_id, year, month)
+);
+
+-- Expense side of branch_month_rollup split by utility type
+CREATE TABLE IF NOT EXISTS branch_type_month_rollup (
+    branch_id       INTEGER NOT NULL REFERENCES branches (branch_id),
+    utility_type_id INTEGER NOT NULL REFERENCES utility_expense_types (id),
+    year            INTEGER NOT NULL,
+    month           INTEGER NOT NULL,
+    expense_total   DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    bill_count      INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (branch_id, utility_type_id, year, month)
+);
+
+-- Bill/budget change events for umd_app/alert_engine.py, written in the same
+-- transaction as the change so none are lost if the process dies
+CREATE TABLE IF NOT EXISTS alert_outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type      VARCHAR(20) NOT NULL,
+    branch_id       INTEGER NOT NULL REFERENCES branches (branch_id),
+    year            INTEGER NOT NULL,
+    month           INTEGER NOT NULL,
+    utility_bill_id INTEGER REFERENCES utility_bills (id),
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    claimed_at      DATETIME,
+    processed_at    DATETIME,
+    last_error      VARCHAR(500),
+    created_at      DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS ix_alert_outbox_pending ON alert_outbox (processed_at, id);
+
+-- Whether each alert rule currently stands fired for a branch and period;
+-- a rule fires when fired goes 0 -> 1 and is re-armed when its condition clears
+CREATE TABLE IF NOT EXISTS alert_rule_state (
+    branch_id       INTEGER NOT NULL REFERENCES branches (branch_id),
+    year            INTEGER NOT NULL,
+    month           INTEGER NOT NULL,
+    rule_key        VARCHAR(100) NOT NULL,
+    fired           INTEGER NOT NULL DEFAULT 1,
+    updated_at      DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (branch_id, year, month, rule_key)
+);
+
+-- Periodic jobs run by umd_app/scheduler.py. locked_by/locked_until is a
+-- lease: the worker process that sets it runs the job, the others skip it.
+CREATE TABLE IF NOT EXISTS scheduled_jobs (
+    name             VARCHAR(100) PRIMARY KEY,
+    interval_seconds INTEGER NOT NULL,
+    next_run_at      DATETIME NOT NULL,
+    last_run_at      DATETIME,
+    last_status      VARCHAR(500),
+    locked_by        VARCHAR(100),
+    locked_until     DATETIME
+);
+
+CREATE INDEX IF NOT EXISTS ix_alerts_type_created ON alerts (alert_type, created_at);
+
+-- Files of the content-addressed media store (umd_app/media_store.py), one
+-- per distinct content; ref_count is the number of active media rows using it
+CREATE TABLE IF NOT EXISTS media_blobs (
+    content_hash    CHAR(64) PRIMARY KEY,
+    media_path      VARCHAR(200) NOT NULL,
+    size_bytes      BIGINT NOT NULL,
+    ref_count       INTEGER NOT NULL DEFAULT 0,
+    created_at      DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    released_at     DATETIME
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ix_media_blobs_path ON media_blobs (media_path);
+CREATE INDEX IF NOT EXISTS ix_media_blobs_unreferenced ON media_blobs (released_at) WHERE ref_count = 0;
+
+-- Amount / units / period read from bill attachments by umd_app/extraction.py,
+-- waiting for a user to confirm them onto the bill
+CREATE TABLE IF NOT EXISTS bill_extractions (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    utility_bill_id INTEGER NOT NULL REFERENCES utility_bills (id),
+    media_id        INTEGER NOT NULL REFERENCES media (id),
+    status          VARCHAR(20) NOT NULL DEFAULT 'pending',
+    method          VARCHAR(20),
+    amount          DECIMAL(12, 2),
+    units_used      DECIMAL(12, 2),
+    year            INTEGER,
+    month           INTEGER,
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    claimed_at      DATETIME,
+    processed_at    DATETIME,
+    last_error      VARCHAR(500),
+    confirmed_by    INTEGER REFERENCES users (user_id),
+    confirmed_at    DATETIME,
+    created_at      DATETIME NOT NULL DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE INDEX IF NOT EXISTS ix_bill_extractions_bill ON bill_extractions (utility_bill_id, id);
+CREATE INDEX IF NOT EXISTS ix_bill_extractions_pending ON bill_extractions (id) WHERE processed_at IS NULL;
+
+-- Per-business data versions behind the dashboard ETags when no
+-- CACHE_BACKEND is configured (umd_app/cache.py)
+CREATE TABLE IF NOT EXISTS data_versions (
+    version_key     VARCHAR(100) NOT NULL PRIMARY KEY,
+    version         BIGINT NOT NULL
+);
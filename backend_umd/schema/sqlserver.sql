@@ -0,0 +1,299 @@
+-- SQL Server schema for the tables used by umd_app/routes.
+-- Every statement is guarded, so init_db.py can be re-run against an
+-- existing database to pick up newly added tables and indexes.
+
+IF OBJECT_ID('dbo.business', 'U') IS NULL
+CREATE TABLE dbo.business (
+    business_id     INT IDENTITY(1,1) PRIMARY KEY,
+    business_name   NVARCHAR(150) NOT NULL,
+    industry        NVARCHAR(100) NULL,
+    email           NVARCHAR(150) NULL,
+    contact_person  NVARCHAR(100) NULL,
+    req_status      NVARCHAR(20) NOT NULL DEFAULT 'pending',
+    status          BIT NOT NULL DEFAULT 1,
+    created_at      DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF OBJECT_ID('dbo.pending_admins', 'U') IS NULL
+CREATE TABLE dbo.pending_admins (
+    id              INT IDENTITY(1,1) PRIMARY KEY,
+    username        NVARCHAR(100) NOT NULL,
+    user_email      NVARCHAR(150) NOT NULL,
+    contact_no      NVARCHAR(30) NULL,
+    password        NVARCHAR(255) NOT NULL,
+    business_id     INT NOT NULL REFERENCES dbo.business (business_id),
+    created_at      DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF OBJECT_ID('dbo.users', 'U') IS NULL
+CREATE TABLE dbo.users (
+    user_id             INT IDENTITY(1,1) PRIMARY KEY,
+    username            NVARCHAR(100) NOT NULL UNIQUE,
+    email               NVARCHAR(150) NOT NULL UNIQUE,
+    contact_no          NVARCHAR(30) NULL,
+    userpassword        NVARCHAR(255) NOT NULL,
+    role_id             INT NOT NULL,
+    business_id         INT NULL REFERENCES dbo.business (business_id),
+    availablecurrently  BIT NOT NULL DEFAULT 1,
+    status              BIT NOT NULL DEFAULT 1,
+    created_at          DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF OBJECT_ID('dbo.branches', 'U') IS NULL
+CREATE TABLE dbo.branches (
+    branch_id               INT IDENTITY(1,1) PRIMARY KEY,
+    branch_name             NVARCHAR(150) NOT NULL,
+    blocation               NVARCHAR(255) NULL,
+    business_id             INT NOT NULL REFERENCES dbo.business (business_id),
+    handled_by              INT NULL REFERENCES dbo.users (user_id),
+    status                  BIT NOT NULL DEFAULT 1,
+    budget_alert_threshold  INT NULL DEFAULT 90,
+    created_at              DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ux_branches_handled_by')
+CREATE UNIQUE INDEX ux_branches_handled_by ON dbo.branches (handled_by) WHERE handled_by IS NOT NULL;
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_branches_business')
+CREATE INDEX ix_branches_business ON dbo.branches (business_id, status);
+GO
+
+IF OBJECT_ID('dbo.utility_expense_types', 'U') IS NULL
+CREATE TABLE dbo.utility_expense_types (
+    id              INT IDENTITY(1,1) PRIMARY KEY,
+    utility_name    NVARCHAR(100) NOT NULL,
+    category        NVARCHAR(100) NULL
+);
+GO
+
+IF OBJECT_ID('dbo.budget', 'U') IS NULL
+CREATE TABLE dbo.budget (
+    id              INT IDENTITY(1,1) PRIMARY KEY,
+    branch_id       INT NOT NULL REFERENCES dbo.branches (branch_id),
+    year            INT NOT NULL,
+    month           INT NOT NULL,
+    total_budget    DECIMAL(12, 2) NOT NULL,
+    allocated_by    INT NULL REFERENCES dbo.users (user_id),
+    status          BIT NOT NULL DEFAULT 1,
+    created_at      DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_budget_branch_period')
+CREATE INDEX ix_budget_branch_period ON dbo.budget (branch_id, year, month);
+GO
+
+-- Serves the month-to-date range filters in /api/dashboard/summary
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_budget_branch_created')
+CREATE INDEX ix_budget_branch_created ON dbo.budget (branch_id, created_at) INCLUDE (total_budget);
+GO
+
+IF OBJECT_ID('dbo.utility_bills', 'U') IS NULL
+CREATE TABLE dbo.utility_bills (
+    id              INT IDENTITY(1,1) PRIMARY KEY,
+    branch_id       INT NOT NULL REFERENCES dbo.branches (branch_id),
+    utility_type_id INT NOT NULL REFERENCES dbo.utility_expense_types (id),
+    year            INT NOT NULL,
+    month           INT NOT NULL,
+    units_used      DECIMAL(12, 2) NULL,
+    amount          DECIMAL(12, 2) NOT NULL,
+    uploaded_by     INT NULL REFERENCES dbo.users (user_id),
+    status          BIT NOT NULL DEFAULT 1,
+    uploaded_at     DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_utility_bills_branch_period')
+CREATE INDEX ix_utility_bills_branch_period ON dbo.utility_bills (branch_id, year, month) INCLUDE (amount, status);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_utility_bills_branch_uploaded')
+CREATE INDEX ix_utility_bills_branch_uploaded ON dbo.utility_bills (branch_id, uploaded_at) INCLUDE (amount, status);
+GO
+
+IF OBJECT_ID('dbo.alerts', 'U') IS NULL
+CREATE TABLE dbo.alerts (
+    alertsid        INT IDENTITY(1,1) PRIMARY KEY,
+    branch_id       INT NOT NULL REFERENCES dbo.branches (branch_id),
+    utility_bill_id INT NULL REFERENCES dbo.utility_bills (id),
+    alert_type      NVARCHAR(50) NOT NULL,
+    severity        NVARCHAR(20) NULL,
+    message         NVARCHAR(500) NULL,
+    is_resolved     BIT NOT NULL DEFAULT 0,
+    resolved_at     DATETIME NULL,
+    is_viewed       BIT NOT NULL DEFAULT 0,
+    status          BIT NOT NULL DEFAULT 1,
+    created_at      DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_alerts_branch')
+CREATE INDEX ix_alerts_branch ON dbo.alerts (branch_id, status, is_resolved);
+GO
+
+IF OBJECT_ID('dbo.media', 'U') IS NULL
+CREATE TABLE dbo.media (
+    id              INT IDENTITY(1,1) PRIMARY KEY,
+    media_name      NVARCHAR(255) NOT NULL,
+    media_path      NVARCHAR(500) NOT NULL,
+    media_type      NVARCHAR(50) NULL,
+    uploaded_by     INT NULL REFERENCES dbo.users (user_id),
+    business_id     INT NULL REFERENCES dbo.business (business_id),
+    branch_id       INT NULL REFERENCES dbo.branches (branch_id),
+    utility_bill_id INT NULL REFERENCES dbo.utility_bills (id),
+    status          BIT NOT NULL DEFAULT 1,
+    uploaded_at     DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_media_utility_bill')
+CREATE INDEX ix_media_utility_bill ON dbo.media (utility_bill_id);
+GO
+
+-- Running per-branch, per-month totals maintained by umd_app/rollup.py.
+-- Backfill with `flask --app run rollup rebuild` after creating it.
+IF OBJECT_ID('dbo.branch_month_rollup', 'U') IS NULL
+CREATE TABLE dbo.branch_month_rollup (
+    branch_id       INT NOT NULL REFERENCES dbo.branches (branch_id),
+    year            INT NOT NULL,
+    month           INT NOT NULL,
+    budget_total    DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    expense_total   DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    bill_count      INT NOT NULL DEFAULT 0,
+    alert_count     INT NOT NULL DEFAULT 0,
+    CONSTRAINT pk_branch_month_rollup PRIMARY KEY (branch_id, year, month)
+);
+GO
+
+-- Expense side of branch_month_rollup split by utility type
+IF OBJECT_ID('dbo.branch_type_month_rollup', 'U') IS NULL
+CREATE TABLE dbo.branch_type_month_rollup (
+    branch_id       INT NOT NULL REFERENCES dbo.branches (branch_id),
+    utility_type_id INT NOT NULL REFERENCES dbo.utility_expense_types (id),
+    year            INT NOT NULL,
+    month           INT NOT NULL,
+    expense_total   DECIMAL(14, 2) NOT NULL DEFAULT 0,
+    bill_count      INT NOT NULL DEFAULT 0,
+    CONSTRAINT pk_branch_type_month_rollup PRIMARY KEY (branch_id, utility_type_id, year, month)
+);
+GO
+
+-- Bill/budget change events for umd_app/alert_engine.py, written in the same
+-- transaction as the change so none are lost if the process dies
+IF OBJECT_ID('dbo.alert_outbox', 'U') IS NULL
+CREATE TABLE dbo.alert_outbox (
+    id              INT IDENTITY(1,1) PRIMARY KEY,
+    event_type      NVARCHAR(20) NOT NULL,
+    branch_id       INT NOT NULL REFERENCES dbo.branches (branch_id),
+    year            INT NOT NULL,
+    month           INT NOT NULL,
+    utility_bill_id INT NULL REFERENCES dbo.utility_bills (id),
+    attempts        INT NOT NULL DEFAULT 0,
+    claimed_at      DATETIME NULL,
+    processed_at    DATETIME NULL,
+    last_error      NVARCHAR(500) NULL,
+    created_at      DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_alert_outbox_pending')
+CREATE INDEX ix_alert_outbox_pending ON dbo.alert_outbox (id) WHERE processed_at IS NULL;
+GO
+
+-- Whether each alert rule currently stands fired for a branch and period;
+-- a rule fires when fired goes 0 -> 1 and is re-armed when its condition clears
+IF OBJECT_ID('dbo.alert_rule_state', 'U') IS NULL
+CREATE TABLE dbo.alert_rule_state (
+    branch_id       INT NOT NULL REFERENCES dbo.branches (branch_id),
+    year            INT NOT NULL,
+    month           INT NOT NULL,
+    rule_key        NVARCHAR(100) NOT NULL,
+    fired           BIT NOT NULL DEFAULT 1,
+    updated_at      DATETIME NOT NULL DEFAULT GETDATE(),
+    CONSTRAINT pk_alert_rule_state PRIMARY KEY (branch_id, year, month, rule_key)
+);
+GO
+
+-- Periodic jobs run by umd_app/scheduler.py. locked_by/locked_until is a
+-- lease: the worker process that sets it runs the job, the others skip it.
+IF OBJECT_ID('dbo.scheduled_jobs', 'U') IS NULL
+CREATE TABLE dbo.scheduled_jobs (
+    name             NVARCHAR(100) NOT NULL PRIMARY KEY,
+    interval_seconds INT NOT NULL,
+    next_run_at      DATETIME NOT NULL,
+    last_run_at      DATETIME NULL,
+    last_status      NVARCHAR(500) NULL,
+    locked_by        NVARCHAR(100) NULL,
+    locked_until     DATETIME NULL
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_alerts_type_created')
+CREATE INDEX ix_alerts_type_created ON dbo.alerts (alert_type, created_at) INCLUDE (branch_id, status);
+GO
+
+-- Files of the content-addressed media store (umd_app/media_store.py), one
+-- per distinct content; ref_count is the number of active media rows using it
+IF OBJECT_ID('dbo.media_blobs', 'U') IS NULL
+CREATE TABLE dbo.media_blobs (
+    content_hash    CHAR(64) NOT NULL PRIMARY KEY,
+    media_path      NVARCHAR(200) NOT NULL,
+    size_bytes      BIGINT NOT NULL,
+    ref_count       INT NOT NULL DEFAULT 0,
+    created_at      DATETIME NOT NULL DEFAULT GETDATE(),
+    released_at     DATETIME NULL
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_media_blobs_path')
+CREATE UNIQUE INDEX ix_media_blobs_path ON dbo.media_blobs (media_path);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_media_blobs_unreferenced')
+CREATE INDEX ix_media_blobs_unreferenced ON dbo.media_blobs (released_at) WHERE ref_count = 0;
+GO
+
+-- Amount / units / period read from bill attachments by umd_app/extraction.py,
+-- waiting for a user to confirm them onto the bill
+IF OBJECT_ID('dbo.bill_extractions', 'U') IS NULL
+CREATE TABLE dbo.bill_extractions (
+    id              INT IDENTITY(1,1) PRIMARY KEY,
+    utility_bill_id INT NOT NULL REFERENCES dbo.utility_bills (id),
+    media_id        INT NOT NULL REFERENCES dbo.media (id),
+    status          NVARCHAR(20) NOT NULL DEFAULT 'pending',
+    method          NVARCHAR(20) NULL,
+    amount          DECIMAL(12, 2) NULL,
+    units_used      DECIMAL(12, 2) NULL,
+    year            INT NULL,
+    month           INT NULL,
+    attempts        INT NOT NULL DEFAULT 0,
+    claimed_at      DATETIME NULL,
+    processed_at    DATETIME NULL,
+    last_error      NVARCHAR(500) NULL,
+    confirmed_by    INT NULL REFERENCES dbo.users (user_id),
+    confirmed_at    DATETIME NULL,
+    created_at      DATETIME NOT NULL DEFAULT GETDATE()
+);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_bill_extractions_bill')
+CREATE INDEX ix_bill_extractions_bill ON dbo.bill_extractions (utility_bill_id, id);
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'ix_bill_extractions_pending')
+CREATE INDEX ix_bill_extractions_pending ON dbo.bill_extractions (id) WHERE processed_at IS NULL;
+GO
+
+-- Per-business data versions behind the dashboard ETags when no
+-- CACHE_BACKEND is configured (umd_app/cache.py)
+IF OBJECT_ID('dbo.data_versions', 'U') IS NULL
+CREATE TABLE dbo.data_versions (
+    version_key     NVARCHAR(100) NOT NULL PRIMARY KEY,
+    version         BIGINT NOT NULL
+);
+GO
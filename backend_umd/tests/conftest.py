@@ -0,0 +1,100 @@
+import os
+import sys
+
+import bcrypt
+import pytest
+
+# Tests run against the SQLite backend (DB_BACKEND=sqlite) in a fresh file per
+# test, with sessions kept in memory, alerts and attachment
+# extraction run inline, no scheduler or preview threads and cheap bcrypt.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = "test-pass"
+
+TEST_SETTINGS = {
+    "SESSION_TYPE": "memory",
+    "SESSION_SWEEP_INTERVAL": "0",
+    "ALERT_WORKERS": "0",
+    "ALERT_OUTBOX_POLL": "0",
+    "SCHEDULER_ENABLED": "0",
+    "MEDIA_PREVIEW_WORKERS": "0",
+    "EXTRACTION_WORKERS": "0",
+    "EXTRACTION_POLL": "0",
+    "BCRYPT_ROUNDS": "4",
+    "PASSWORD_WORKERS": "0",
+}
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("DB_BACKEND", "sqlite")
+    monkeypatch.setenv("DB_SQLITE_PATH", str(tmp_path / "test.db"))
+    for name, value in TEST_SETTINGS.items():
+        monkeypatch.setenv(name, value)
+
+    from umd_app import db
+    db.reset_pool()
+    import init_db
+    init_db.apply_schema()
+    init_db.seed_utility_types()
+    yield db
+    db.reset_pool()
+
+
+@pytest.fixture
+def app(database):
+    from umd_app import create_app
+    app = create_app()
+    app.testing = True
+    return app
+
+
+@pytest.fixture
+def business(database):
+    """One business with an admin, a manager and the manager's branch."""
+    password = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(4)).decode()
+    with database.pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO business (business_name, industry, email, contact_person, req_status)
+            OUTPUT INSERTED.business_id
+            VALUES ('Acme', 'Retail', 'owner@acme.test', 'Owner', 'approved')
+        """)
+        business_id = cursor.fetchone()[0]
+        users = {}
+        for username, role_id in (("admin", 1), ("manager", 2)):
+            cursor.execute("""
+                INSERT INTO users (username, email, contact_no, userpassword, role_id, business_id)
+                OUTPUT INSERTED.user_id
+                VALUES (?, ?, '0', ?, ?, ?)
+            """, (username, f"{username}@acme.test", password, role_id, business_id))
+            users[username] = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO branches (branch_name, blocation, business_id, handled_by)
+            OUTPUT INSERTED.branch_id
+            VALUES ('Main', 'Town', ?, ?)
+        """, (business_id, users["manager"]))
+        branch_id = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+    return {"business_id": business_id, "branch_id": branch_id,
+            "admin_id": users["admin"], "manager_id": users["manager"]}
+
+
+def login(app, email):
+    client = app.test_client()
+    response = client.post('/api/auth/login', json={"email": email, "password": PASSWORD})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return client
+
+
+@pytest.fixture
+def admin(app, business):
+    return login(app, "admin@acme.test")
+
+
+@pytest.fixture
+def manager(app, business):
+    return login(app, "manager@acme.test")
@@ -0,0 +1,104 @@
+from datetime import timedelta
+
+from umd_app import alert_engine
+from umd_app.db import pooled_connection
+
+
+def execute(sql, params=()):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall() if cursor.description else None
+        conn.commit()
+        cursor.close()
+    return rows
+
+
+def enqueue(branch_id, month=3):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        outbox_id = alert_engine.enqueue(cursor, alert_engine.BILL, branch_id, 2024, month)
+        conn.commit()
+        cursor.close()
+    return outbox_id
+
+
+def add_bill(branch_id, amount, month=3):
+    # A bill and its rollup row, without going through the upload route
+    execute("""
+        INSERT INTO utility_bills (branch_id, utility_type_id, year, month, amount, status)
+        VALUES (?, 1, 2024, ?, ?, 1)
+    """, (branch_id, month, amount))
+    execute("""
+        INSERT INTO branch_month_rollup (branch_id, year, month, budget_total, expense_total,
+            bill_count, alert_count)
+        VALUES (?, 2024, ?, 0, ?, 1, 0)
+    """, (branch_id, month, amount))
+
+
+def test_uploads_alert_once_per_period(admin, manager, business):
+    branch_id = business["branch_id"]
+    admin.post('/api/budget/add', json={
+        "branch_id": branch_id, "year": 2024, "month": 3, "total_budget": 100})
+    for amount in (92, 3, 2):
+        response = manager.post('/api/utility/utility-bills/bulk', json={"bills": [
+            {"utility_type_id": 1, "year": 2024, "month": 3, "amount": amount}]})
+        assert response.status_code == 201
+    assert execute("SELECT alert_type FROM alerts WHERE branch_id = ?", (branch_id,)) == \
+        [("budget_warning",)]
+    assert execute("SELECT COUNT(*) FROM alert_outbox WHERE processed_at IS NULL") == [(0,)]
+
+
+def test_processing_is_idempotent(business):
+    add_bill(business["branch_id"], 10)
+    outbox_id = enqueue(business["branch_id"])
+    assert alert_engine.process(outbox_id) == ["missing_budget"]
+    assert alert_engine.process(outbox_id) == []
+    # A second event for the same period finds the rule already fired
+    assert alert_engine.process(enqueue(business["branch_id"])) == []
+    assert execute("SELECT COUNT(*) FROM alerts") == [(1,)]
+
+
+def test_failed_rows_are_retried(business, monkeypatch):
+    add_bill(business["branch_id"], 10)
+    outbox_id = enqueue(business["branch_id"])
+
+    def broken(cursor, outbox_id):
+        raise RuntimeError("database went away")
+    monkeypatch.setattr(alert_engine, "_evaluate_event", broken)
+    assert alert_engine.process(outbox_id) == []
+    assert execute("SELECT attempts, last_error, processed_at FROM alert_outbox") == \
+        [(1, "database went away", None)]
+    monkeypatch.undo()
+
+    # The claim keeps the row away from the poller until it times out
+    assert alert_engine.pending(grace=0) == []
+    execute("UPDATE alert_outbox SET claimed_at = ?",
+            (alert_engine._now() - timedelta(seconds=alert_engine.CLAIM_TIMEOUT + 1),))
+    assert alert_engine.pending(grace=0) == [outbox_id]
+    assert alert_engine.process(outbox_id) == ["missing_budget"]
+    assert alert_engine.pending(grace=0) == []
+
+
+def test_poller_leaves_fresh_rows_to_their_notify(business):
+    outbox_id = enqueue(business["branch_id"])
+    assert alert_engine.pending() == []
+    assert alert_engine.pending(grace=0) == [outbox_id]
+
+
+def test_budget_update_keeps_the_period_it_leaves_out(admin, business):
+    branch_id = business["branch_id"]
+    response = admin.post('/api/budget/add', json={
+        "branch_id": branch_id, "year": 2024, "month": 3, "total_budget": 100})
+    assert response.status_code == 201
+    budget_id = execute("SELECT id FROM budget")[0][0]
+
+    response = admin.patch(f'/api/budget/update/{budget_id}', json={"total_budget": 250})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert execute("SELECT year, month, total_budget FROM budget") == [(2024, 3, 250)]
+    assert execute("""
+        SELECT budget_total FROM branch_month_rollup WHERE year = 2024 AND month = 3
+    """) == [(250,)]
+
+    assert admin.patch(f'/api/budget/update/{budget_id}', json={"month": 13}).status_code == 400
+    assert admin.patch(f'/api/budget/update/{budget_id}', json={"year": "soon"}).status_code == 400
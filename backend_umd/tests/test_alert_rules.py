@@ -0,0 +1,78 @@
+from umd_app import alert_engine
+from umd_app.db import pooled_connection
+
+
+def alert_types(branch_id):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT alert_type FROM alerts WHERE branch_id = ? ORDER BY alertsid", (branch_id,))
+        rows = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+    return rows
+
+
+def add_bill(client, amount, month=3):
+    response = client.post('/api/utility/utility-bills/bulk', json={"bills": [
+        {"utility_type_id": 1, "year": 2024, "month": month, "amount": amount}]})
+    assert response.status_code == 201, response.get_data(as_text=True)
+
+
+def test_budget_rules_by_threshold():
+    rules = alert_engine.budget_rules(1000, 950, 2, 90)
+    assert rules["threshold:90"][0] == "budget_warning"
+    assert rules["threshold:100"] is None
+    assert rules["missing_budget"] is None
+
+    rules = alert_engine.budget_rules(1000, 1000, 2, 90)
+    assert rules["threshold:100"][0] == "budget_exceeded"
+    assert alert_engine.budget_rules(0, 50, 1, 90)["missing_budget"][0] == "missing_budget"
+    # No bills, nothing to warn about
+    assert not any(alert_engine.budget_rules(0, 0, 0, 90).values())
+
+
+def test_spike_against_previous_months(monkeypatch):
+    monkeypatch.setattr(alert_engine, "spike_factor", 2.0)
+    monkeypatch.setattr(alert_engine, "spike_min_amount", 20)
+    rules = alert_engine.spike_rules({1: ("Electricity", 300), 2: ("Gas", 15)},
+                                     {1: [100, 140], 2: [5]})
+    assert rules["spike:1"][0] == "expense_spike"
+    # Three times the average, but under the minimum increase
+    assert rules["spike:2"] is None
+    # No history, no spike
+    assert alert_engine.spike_rules({3: ("Water", 500)}, {}) == {"spike:3": None}
+
+
+def test_each_crossing_alerts_once(admin, manager, business):
+    branch_id = business["branch_id"]
+    response = admin.post('/api/budget/add', json={
+        "branch_id": branch_id, "year": 2024, "month": 3, "total_budget": 1000})
+    assert response.status_code == 201
+
+    add_bill(manager, 500)
+    assert alert_types(branch_id) == []
+
+    add_bill(manager, 450)   # 95%: crosses the 90% warning
+    add_bill(manager, 10)    # still over 90%, already alerted
+    assert alert_types(branch_id) == ["budget_warning"]
+
+    add_bill(manager, 200)   # over 100%
+    add_bill(manager, 1)
+    assert alert_types(branch_id) == ["budget_warning", "budget_exceeded"]
+
+
+def test_rule_rearms_when_condition_clears(admin, manager, business):
+    branch_id = business["branch_id"]
+    admin.post('/api/budget/add', json={
+        "branch_id": branch_id, "year": 2024, "month": 3, "total_budget": 1000})
+    add_bill(manager, 950)
+    assert alert_types(branch_id) == ["budget_warning"]
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM utility_bills WHERE branch_id = ?", (branch_id,))
+        bill_id = cursor.fetchone()[0]
+        cursor.close()
+    assert manager.delete(f'/api/utility/utility-bills/delete/{bill_id}').status_code == 200
+
+    add_bill(manager, 960)   # crosses again after the delete re-armed it
+    assert alert_types(branch_id) == ["budget_warning", "budget_warning"]
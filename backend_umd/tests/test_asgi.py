@@ -0,0 +1,120 @@
+import asyncio
+import json
+import threading
+
+from flask import Flask, Response, request
+
+from conftest import PASSWORD
+from umd_app.asgi import AsgiAdapter, create_asgi_app
+
+
+def http_scope(method, path, headers=(), query=b""):
+    return {"type": "http", "method": method, "path": path, "query_string": query,
+            "headers": [(k.encode(), v.encode()) for k, v in headers]}
+
+
+async def request_app(adapter, method="GET", path="/", body=b"", headers=(), chunk=None):
+    # Send the body in pieces of `chunk` bytes and collect what comes back
+    chunk = chunk or max(len(body), 1)
+    pieces = [body[i:i + chunk] for i in range(0, len(body), chunk)] or [b""]
+    incoming = [{"type": "http.request", "body": piece, "more_body": n < len(pieces) - 1}
+                for n, piece in enumerate(pieces)]
+    disconnected = asyncio.Event()
+    sent = []
+
+    async def receive():
+        if incoming:
+            return incoming.pop(0)
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await adapter(http_scope(method, path, headers), receive, send)
+    disconnected.set()
+    start = sent[0]
+    return (start["status"], dict(start["headers"]),
+            b"".join(message.get("body", b"") for message in sent[1:]))
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def sample_app():
+    app = Flask(__name__)
+
+    @app.post("/echo")
+    def echo():
+        return request.get_data()
+
+    @app.get("/chunks")
+    def chunks():
+        return Response((f"{n}," for n in range(3)), content_type="text/plain")
+
+    return app
+
+
+def test_requests_run_through_the_flask_app():
+    adapter = AsgiAdapter(sample_app(), threads=2, max_queue=0)
+    body = b"x" * 5000
+    status, headers, content = run(request_app(
+        adapter, "POST", "/echo", body, headers=[("content-length", str(len(body)))], chunk=1000))
+    assert status == 200
+    assert content == body
+    assert headers[b"content-length"] == b"5000"
+
+    status, _, content = run(request_app(adapter, "GET", "/chunks"))
+    assert (status, content) == (200, b"0,1,2,")
+
+
+def test_body_over_the_limit_is_refused():
+    adapter = AsgiAdapter(sample_app(), threads=1, max_queue=0, max_body=10)
+    status, _, _ = run(request_app(adapter, "POST", "/echo", b"y" * 50, chunk=20))
+    assert status == 413
+
+
+def test_answers_503_when_the_queue_is_full():
+    app = Flask(__name__)
+    release = threading.Event()
+    entered = threading.Event()
+
+    @app.get("/slow")
+    def slow():
+        entered.set()
+        release.wait(5)
+        return "done"
+
+    adapter = AsgiAdapter(app, threads=1, max_queue=1)
+
+    async def scenario():
+        first = asyncio.ensure_future(request_app(adapter, "GET", "/slow"))
+        second = asyncio.ensure_future(request_app(adapter, "GET", "/slow"))
+        while adapter._in_flight < 2:
+            await asyncio.sleep(0.01)
+        # One running, one waiting for the thread: the next is turned away
+        refused = await request_app(adapter, "GET", "/slow")
+        release.set()
+        return refused, await first, await second
+
+    refused, first, second = run(scenario())
+    assert refused[0] == 503
+    assert (first[0], first[2]) == (200, b"done")
+    assert (second[0], second[2]) == (200, b"done")
+    assert adapter._in_flight == 0
+
+
+def test_serves_the_umd_app(app, business):
+    adapter = create_asgi_app(app)
+    assert run(request_app(adapter, "GET", "/api/alert/poll"))[0] == 401
+
+    body = json.dumps({"email": "admin@acme.test", "password": PASSWORD}).encode()
+    status, headers, _ = run(request_app(adapter, "POST", "/api/auth/login", body, headers=[
+        ("content-type", "application/json"), ("content-length", str(len(body)))]))
+    assert status == 200
+    cookie = headers[b"set-cookie"].decode().split(";", 1)[0]
+    status, _, content = run(request_app(adapter, "GET", "/api/alert/poll",
+                                         headers=[("cookie", cookie)]))
+    assert status == 200
+    assert json.loads(content)["events"][0]["unread_count"] == 0
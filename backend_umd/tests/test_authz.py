@@ -0,0 +1,120 @@
+import pytest
+
+from umd_app import authz, cache
+from umd_app.db import pooled_connection
+
+
+def identity(business, user="manager"):
+    return {"user_id": business[f"{user}_id"], "business_id": business["business_id"]}
+
+
+def add_branch(business, handled_by=None, status=1):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO branches (branch_name, business_id, handled_by, status)
+            OUTPUT INSERTED.branch_id
+            VALUES ('Extra', ?, ?, ?)
+        """, (business["business_id"], handled_by, status))
+        branch_id = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+    return branch_id
+
+
+@pytest.fixture
+def counted_queries(monkeypatch):
+    calls = []
+    query = authz._query
+
+    def counting(user_id):
+        calls.append(user_id)
+        return query(user_id)
+    monkeypatch.setattr(authz, "_query", counting)
+    return calls
+
+
+@pytest.fixture(autouse=True)
+def fresh_contexts(monkeypatch):
+    monkeypatch.setattr(authz, "_contexts", cache.MemoryBackend())
+
+
+def test_context_access_rules():
+    ctx = authz.AuthzContext(5, 2, 1, {3: False, 7: True})
+    assert ctx.is_manager and not ctx.is_admin
+    assert ctx.branch_id == 7
+    assert ctx.can_access(3) and not ctx.can_access(3, active_only=True)
+    assert ctx.can_access(7, active_only=True)
+    assert not ctx.can_access(8)
+    assert authz.AuthzContext(1, 1, 1, {2: True}).branch_id is None
+
+
+def test_resolve_reads_branches(business):
+    inactive = add_branch(business, status=0)
+    admin = authz.resolve(identity(business, "admin"))
+    assert admin.branches == {business["branch_id"]: True, inactive: False}
+    manager = authz.resolve(identity(business))
+    assert manager.branches == {business["branch_id"]: True}
+    assert authz.resolve({"user_id": 999, "business_id": 1}) is None
+
+
+def test_resolve_is_cached_until_invalidated(business, counted_queries):
+    # No CACHE_BACKEND: contexts are kept in process, versions in the database
+    first = authz.resolve(identity(business))
+    assert authz.resolve(identity(business)).branches == first.branches
+    assert len(counted_queries) == 1
+
+    branch_id = add_branch(business, handled_by=business["admin_id"])
+    authz.invalidate(business["business_id"])
+    assert branch_id in authz.resolve(identity(business, "admin")).branches
+    authz.resolve(identity(business))
+    assert len(counted_queries) == 3
+
+
+def test_routes_check_access_through_the_context(app, manager, business):
+    other = add_branch(business)
+    response = manager.post('/api/utility/utility-bills/upload', data={
+        "branch_id": str(other), "utility_type_id": "1", "year": "2024", "month": "3",
+        "amount": "5"}, content_type='multipart/form-data')
+    # Managers always upload for their own branch
+    assert response.status_code == 201
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT branch_id FROM utility_bills")
+        assert [row[0] for row in cursor.fetchall()] == [business["branch_id"]]
+        cursor.close()
+
+    anonymous = app.test_client()
+    response = anonymous.post('/api/utility/utility-bills/upload', data={},
+                              content_type='multipart/form-data')
+    assert response.status_code == 401
+
+
+def test_admin_cannot_reach_other_businesses(admin, business):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO business (business_name, req_status) OUTPUT INSERTED.business_id
+            VALUES ('Other', 'approved')
+        """)
+        other_business = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO branches (branch_name, business_id) OUTPUT INSERTED.branch_id
+            VALUES ('Elsewhere', ?)
+        """, (other_business,))
+        foreign_branch = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+    response = admin.post('/api/utility/utility-bills/upload', data={
+        "branch_id": str(foreign_branch), "utility_type_id": "1", "year": "2024", "month": "3",
+        "amount": "5"}, content_type='multipart/form-data')
+    assert response.status_code == 403
+
+
+def test_uploads_need_an_active_branch(admin, business):
+    inactive = add_branch(business, status=0)
+    response = admin.post('/api/utility/utility-bills/upload', data={
+        "branch_id": str(inactive), "utility_type_id": "1", "year": "2024", "month": "3",
+        "amount": "5"}, content_type='multipart/form-data')
+    assert response.status_code == 403
+    assert response.get_json()["error"] == "This branch is inactive"
@@ -0,0 +1,86 @@
+from decimal import Decimal
+
+import pytest
+
+from umd_app import bill_parsing
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1,234.50", Decimal("1234.50")),
+    ("Rs 12 000", Decimal("12000")),
+    ("-3", Decimal("-3")),
+    ("n/a", None),
+    (None, None),
+])
+def test_parse_number(text, expected):
+    assert bill_parsing.parse_number(text) == expected
+
+
+def test_parse_amount_skips_dates():
+    assert bill_parsing.parse_amount("due by 15/04/2024: $123.45") == Decimal("123.45")
+    assert bill_parsing.parse_amount("nothing to pay") is None
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Billing period: March 2024", (2024, 3)),
+    ("from 2024-02-01 to 2024-02-29", (2024, 2)),
+    ("Read on 05/11/2023", (2023, 11)),
+    # Day first unless it cannot be
+    ("Read on 11/25/2023", (2023, 11)),
+    ("no date here", None),
+    ("month 13 of 2024-13-01", None),
+])
+def test_parse_period(text, expected):
+    assert bill_parsing.parse_period(text) == expected
+
+
+def test_from_text_reads_labelled_values():
+    text = """
+        City Power Company
+        Billing period: Feb 2024
+        Units consumed
+        1,250 kWh
+        Previous balance  $10.00
+        Total amount due: $187.40
+    """
+    assert bill_parsing.from_text(text) == {
+        "amount": Decimal("187.40"), "units_used": Decimal("1250"), "year": 2024, "month": 2}
+
+
+def test_from_csv_sums_columns(tmp_path):
+    path = tmp_path / "bill.csv"
+    path.write_text("Meter,Year,Month,Units Used,Amount Due\n"
+                    "A,2024,Mar,100,40.50\n"
+                    "B,2024,Mar,50,20\n", encoding="utf-8")
+    assert bill_parsing.from_csv(str(path)) == {
+        "amount": Decimal("60.50"), "units_used": Decimal("150"), "year": 2024, "month": 3}
+
+
+def test_from_csv_label_rows(tmp_path):
+    path = tmp_path / "summary.csv"
+    path.write_text("Billing period,April 2024\nTotal due,99.99\n", encoding="utf-8")
+    suggestion = bill_parsing.from_csv(str(path))
+    assert (suggestion["amount"], suggestion["year"], suggestion["month"]) == \
+        (Decimal("99.99"), 2024, 4)
+
+
+def test_parse_batch_reports_errors_per_file(tmp_path):
+    path = tmp_path / "bill.csv"
+    path.write_text("amount\n12\n", encoding="utf-8")
+    results = bill_parsing.parse_batch([
+        (1, str(path), "csv"),
+        (2, str(tmp_path / "missing.csv"), "csv"),
+        (3, str(path), "png"),
+    ])
+    assert results[0][:2] == (1, "csv") and results[0][2]["amount"] == Decimal("12")
+    assert results[1][0] == 2 and results[1][3].startswith("FileNotFoundError")
+    # Images need the OCR hook
+    assert results[2] == (3, None, None, None)
+
+
+def test_ocr_hook(tmp_path, monkeypatch):
+    monkeypatch.setitem(bill_parsing._ocr_functions, "fake:read",
+                        lambda path: "Amount due 45.00\nMay 2024")
+    method, suggestion = bill_parsing.parse_file(str(tmp_path / "scan.png"), "png", "fake:read")
+    assert method == "ocr"
+    assert (suggestion["amount"], suggestion["month"]) == (Decimal("45.00"), 5)
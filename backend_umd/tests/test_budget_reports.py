@@ -0,0 +1,36 @@
+from umd_app.db import pooled_connection
+
+
+def add_budget(client, branch_id, month, total):
+    response = client.post('/api/budget/add', json={
+        "branch_id": branch_id, "year": 2024, "month": month, "total_budget": total})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM budget")
+        budget_id = cursor.fetchone()[0]
+        cursor.close()
+    return budget_id
+
+
+def upload(client, month, amount):
+    response = client.post('/api/utility/utility-bills/upload', data={
+        "utility_type_id": "1", "year": "2024", "month": str(month), "amount": str(amount)},
+        content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_data(as_text=True)
+
+
+def test_spent_comes_from_the_budget_period(admin, manager, business):
+    branch_id = business["branch_id"]
+    march = add_budget(admin, branch_id, 3, 1000)
+    april = add_budget(admin, branch_id, 4, 500)
+    for amount in (600, 300, 200):
+        upload(manager, 3, amount)
+
+    spent = admin.get(f'/api/budget/budgets/{march}').get_json()["budget"]["total_spent"]
+    assert spent == 1100.0
+    assert admin.get(f'/api/budget/budgets/{april}').get_json()["budget"]["total_spent"] == 0.0
+
+    alerts = admin.get('/api/budget/budgets/alerts').get_json()["alerts"]
+    assert alerts == [{"branch": "Main", "year": 2024, "month": 3,
+                       "budget": 1000.0, "spent": 1100.0, "overspent": 100.0}]
@@ -0,0 +1,142 @@
+import io
+from decimal import Decimal
+
+import pytest
+
+from umd_app import bulk_import
+from umd_app.db import pooled_connection
+
+TYPES = {1: 1, "electricity": 1, 2: 2, "gas": 2}
+
+
+def bill_amounts(branch_id):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT amount FROM utility_bills WHERE branch_id = ? ORDER BY id", (branch_id,))
+        amounts = [float(row[0]) for row in cursor.fetchall()]
+        cursor.close()
+    return amounts
+
+
+def test_clean_row_accepts_names_and_text_numbers():
+    row = {"utility_name": " Gas ", "year": "2024", "month": "3", "amount": "12.50",
+           "units_used": ""}
+    assert bulk_import.clean_row(row, 7, TYPES) == (7, 2, 2024, 3, None, Decimal("12.50"))
+
+
+@pytest.mark.parametrize("row, message", [
+    ({"utility_type_id": 1, "year": 2024, "month": 3, "amount": 1}, "branch_id is required"),
+    ({"branch_id": 1, "year": 2024, "month": 3, "amount": 1}, "utility_type_id or utility_name"),
+    ({"branch_id": 1, "utility_name": "steam", "year": 2024, "month": 3, "amount": 1},
+     "Unknown utility type"),
+    ({"branch_id": 1, "utility_type_id": 9, "year": 2024, "month": 3, "amount": 1},
+     "Unknown utility_type_id"),
+    ({"branch_id": 1, "utility_type_id": 1, "year": 2024, "month": 13, "amount": 1},
+     "month must be between"),
+    ({"branch_id": 1, "utility_type_id": 1, "year": 2024, "month": 3, "amount": "abc"},
+     "must be numbers"),
+    ({"branch_id": 1, "utility_type_id": 1, "year": 2024, "month": 3, "amount": 0},
+     "greater than zero"),
+    ({"branch_id": 1, "utility_type_id": 1, "year": 2024, "month": 3, "amount": 1,
+      "units_used": "-4"}, "must not be negative"),
+    ({"branch_id": "x", "utility_type_id": 1, "year": 2024, "month": 3, "amount": 1},
+     "whole number"),
+    ("not a row", "must be an object"),
+])
+def test_clean_row_rejects(row, message):
+    with pytest.raises(ValueError, match=message):
+        bulk_import.clean_row(row, None, TYPES)
+
+
+def alert_count(branch_id):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM alerts WHERE branch_id = ?", (branch_id,))
+        count = cursor.fetchone()[0]
+        cursor.close()
+    return count
+
+
+def test_valid_rows_are_inserted_and_bad_rows_reported(manager, business):
+    response = manager.post('/api/utility/utility-bills/bulk', json={"bills": [
+        {"utility_type_id": 1, "year": 2024, "month": 3, "amount": 40},
+        {"utility_type_id": 1, "year": 2024, "month": 14, "amount": 10},
+        {"utility_name": "water", "year": 2024, "month": 3, "amount": "2.5"},
+    ]})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    body = response.get_json()
+    assert (body["inserted"], body["failed"]) == (2, 1)
+    assert body["errors"] == [{"row": 2, "error": "month must be between 1 and 12"}]
+    # No budget for March: one missing_budget alert for the period, not one per bill
+    assert body["alert_checks_queued"] == 1
+    assert alert_count(business["branch_id"]) == 1
+    assert bill_amounts(business["branch_id"]) == [40.0, 2.5]
+
+
+def test_csv_file_upload(admin, business):
+    csv_file = (f"branch_id,utility_name,year,month,units_used,amount\n"
+                f"{business['branch_id']},Electricity,2024,1,100,75.25\n"
+                f"{business['branch_id']},Gas,2024,1,,30\n").encode("utf-8-sig")
+    response = admin.post('/api/utility/utility-bills/bulk', data={
+        "bills_file": (io.BytesIO(csv_file), "bills.csv")}, content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_data(as_text=True)
+    assert response.get_json()["inserted"] == 2
+    assert bill_amounts(business["branch_id"]) == [75.25, 30.0]
+
+
+def test_rows_for_other_businesses_are_denied(admin, business):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO business (business_name, req_status) OUTPUT INSERTED.business_id
+            VALUES ('Other', 'approved')
+        """)
+        other_business = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO branches (branch_name, business_id) OUTPUT INSERTED.branch_id
+            VALUES ('Elsewhere', ?)
+        """, (other_business,))
+        foreign_branch = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+
+    response = admin.post('/api/utility/utility-bills/bulk', json=[
+        {"branch_id": foreign_branch, "utility_type_id": 1, "year": 2024, "month": 3, "amount": 5},
+        {"branch_id": 999, "utility_type_id": 1, "year": 2024, "month": 3, "amount": 5},
+    ])
+    assert response.status_code == 400
+    assert response.get_json()["errors"] == [
+        {"row": 1, "error": "You do not have access to this branch"},
+        {"row": 2, "error": "You do not have access to this branch"}]
+    assert bill_amounts(foreign_branch) == []
+
+
+def test_rows_for_inactive_branches_are_denied(admin, manager, business):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE branches SET status = 0 WHERE branch_id = ?", (business["branch_id"],))
+        conn.commit()
+        cursor.close()
+
+    for client, row in ((admin, {"branch_id": business["branch_id"]}), (manager, {})):
+        response = client.post('/api/utility/utility-bills/bulk', json=[
+            {**row, "utility_type_id": 1, "year": 2024, "month": 3, "amount": 5}])
+        assert response.status_code == 400
+        assert response.get_json()["errors"] == [{"row": 1, "error": "This branch is inactive"}]
+    assert bill_amounts(business["branch_id"]) == []
+
+
+def test_unreadable_batches_are_rejected(admin):
+    assert admin.post('/api/utility/utility-bills/bulk', json={"bills": []}).status_code == 400
+    response = admin.post('/api/utility/utility-bills/bulk', data={
+        "bills_file": (io.BytesIO(b"{not json"), "bills.json")}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "bills_file is not valid JSON"
+    response = admin.post('/api/utility/utility-bills/bulk', data={
+        "bills_file": (io.BytesIO(b"a"), "bills.xlsx")}, content_type='multipart/form-data')
+    assert response.status_code == 400
+    response = admin.post('/api/utility/utility-bills/bulk', data={
+        "bills_file": (io.BytesIO(b"amount\n\xff\xfe12\n"), "bills.csv")},
+        content_type='multipart/form-data')
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "bills_file must be UTF-8 CSV"
@@ -0,0 +1,130 @@
+import time
+
+import pytest
+
+from umd_app import cache, create_app
+from conftest import login
+
+
+@pytest.fixture
+def cached_app(database, business, monkeypatch):
+    monkeypatch.setattr(cache, "_backend", None)
+    monkeypatch.setenv("CACHE_BACKEND", "memory")
+    return create_app()
+
+
+def upload(client, amount):
+    response = client.post('/api/utility/utility-bills/upload', data={
+        "utility_type_id": "1", "year": "2024", "month": "3", "amount": str(amount)},
+        content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()["bill_id"]
+
+
+def test_memory_backend_lru_and_ttl():
+    backend = cache.MemoryBackend(max_entries=2)
+    backend.set("a", 1, ttl=60)
+    backend.set("b", 2, ttl=60)
+    assert backend.get("a") == 1      # "a" is now the most recent
+    backend.set("c", 3, ttl=60)
+    assert (backend.get("a"), backend.get("b"), backend.get("c")) == (1, None, 3)
+    backend.set("d", 4, ttl=-1)
+    assert backend.get("d") is None
+
+
+def test_versions_only_move_forward():
+    backend = cache.MemoryBackend(max_entries=1)
+    first = backend.get_version("data:1")
+    assert backend.get_version("data:1") == first
+    bumped = backend.bump_version("data:1")
+    assert bumped > first
+    # Filling the LRU does not evict versions
+    backend.set("x", 1, 60)
+    backend.set("y", 1, 60)
+    assert backend.get_version("data:1") == bumped
+
+
+def test_redis_backend():
+    fakeredis = pytest.importorskip("fakeredis")
+    backend = cache.RedisBackend(client=fakeredis.FakeRedis())
+    backend.set("k", {"body": "x"}, ttl=60)
+    assert backend.get("k") == {"body": "x"}
+    version = backend.get_version("data:1")
+    assert backend.get_version("data:1") == version
+    time.sleep(0.001)
+    assert backend.bump_version("data:1") > version
+    backend.clear()
+    assert backend.get("k") is None
+
+
+def test_off_by_default(app, admin):
+    response = admin.post('/api/dashboard/summary')
+    assert response.status_code == 200
+    assert "X-Cache" not in response.headers
+
+
+def test_writes_invalidate_cached_responses(cached_app):
+    admin = login(cached_app, "admin@acme.test")
+    manager = login(cached_app, "manager@acme.test")
+    upload(manager, 10)
+
+    first = admin.post('/api/dashboard/summary')
+    assert first.headers["X-Cache"] == "MISS"
+    second = admin.post('/api/dashboard/summary')
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.get_json() == first.get_json()
+    # Each role scope has its own entry
+    assert manager.post('/api/dashboard/summary').headers["X-Cache"] == "MISS"
+
+    upload(manager, 5)
+    third = admin.post('/api/dashboard/summary')
+    assert third.headers["X-Cache"] == "MISS"
+    assert third.get_json()["total_expenses"] == first.get_json()["total_expenses"] + 5
+
+
+def test_deleting_a_bill_invalidates_its_business(cached_app):
+    admin = login(cached_app, "admin@acme.test")
+    manager = login(cached_app, "manager@acme.test")
+    bill_id = upload(manager, 10)
+
+    admin.post('/api/dashboard/summary')
+    assert admin.post('/api/dashboard/summary').headers["X-Cache"] == "HIT"
+    assert manager.delete(f'/api/utility/utility-bills/delete/{bill_id}').status_code == 200
+    response = admin.post('/api/dashboard/summary')
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.get_json()["total_expenses"] == 0
+
+
+def test_repeat_get_is_not_modified_until_data_changes(cached_app):
+    admin = login(cached_app, "admin@acme.test")
+    manager = login(cached_app, "manager@acme.test")
+
+    first = admin.get('/api/dashboard/expenses/filters')
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    repeat = admin.get('/api/dashboard/expenses/filters', headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.get_data() == b""
+    # Another role scope never shares the tag
+    assert manager.get('/api/dashboard/expenses/filters').headers["ETag"] != etag
+
+    upload(manager, 10)
+    changed = admin.get('/api/dashboard/expenses/filters', headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_etags_work_without_a_cache_backend(app, admin, manager):
+    first = admin.get('/api/dashboard/expenses/filters')
+    etag = first.headers["ETag"]
+    assert "X-Cache" not in first.headers
+    assert admin.get('/api/dashboard/expenses/filters',
+                     headers={"If-None-Match": etag}).status_code == 304
+
+    # The version lives in the database, so every worker sees the bump
+    upload(manager, 10)
+    changed = admin.get('/api/dashboard/expenses/filters', headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from dateutil.relativedelta import relativedelta
+
+from umd_app.db import pooled_connection
+
+
+def execute(sql, params=()):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        conn.commit()
+        cursor.close()
+
+
+def test_summary_counts_this_month_only(admin, manager, business):
+    branch_id = business["branch_id"]
+    now = datetime.now()
+    last_month = now - relativedelta(months=1)
+    execute("INSERT INTO branches (branch_name, business_id) VALUES ('Second', ?)",
+            (business["business_id"],))
+    execute("INSERT INTO budget (branch_id, year, month, total_budget) VALUES (?, ?, ?, 800)",
+            (branch_id, now.year, now.month))
+    for amount, uploaded_at in ((120, now), (30, now), (999, last_month)):
+        execute("""
+            INSERT INTO utility_bills (branch_id, utility_type_id, year, month, amount, uploaded_at)
+            VALUES (?, 1, ?, ?, ?, ?)
+        """, (branch_id, uploaded_at.year, uploaded_at.month, amount, uploaded_at))
+    execute("INSERT INTO alerts (branch_id, alert_type) VALUES (?, 'budget_warning')", (branch_id,))
+
+    response = admin.post('/api/dashboard/summary')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.get_json() == {"total_branches": 2, "monthly_budget": 800.0,
+                                   "total_expenses": 150.0, "active_alerts": 1}
+
+    response = manager.post('/api/dashboard/summary')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.get_json() == {"total_branches": 1, "monthly_budget": 800.0,
+                                   "total_expenses": 150.0, "active_alerts": 1}
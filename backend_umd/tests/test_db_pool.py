@@ -0,0 +1,83 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from umd_app.db import ConnectionPool, PoolTimeoutError
+
+
+def make_pool(tmp_path, **kwargs):
+    path = str(tmp_path / "pool.db")
+    opened = []
+
+    def connect():
+        conn = sqlite3.connect(path, check_same_thread=False)
+        opened.append(conn)
+        return conn
+
+    def ping(conn):
+        conn.execute("SELECT 1")
+
+    return ConnectionPool(connect, ping=ping, **kwargs), opened
+
+
+def test_released_connection_is_reused(tmp_path):
+    pool, opened = make_pool(tmp_path, max_size=2)
+    first = pool.acquire()
+    raw = first._entry.raw
+    first.close()
+    first.close()  # closing twice hands it back once
+
+    second = pool.acquire()
+    assert second._entry.raw is raw
+    assert len(opened) == 1
+    second.close()
+    assert pool.stats()["idle"] == 1
+    assert pool.stats()["in_use"] == 0
+
+
+def test_checkout_times_out_when_exhausted(tmp_path):
+    pool, _ = make_pool(tmp_path, max_size=1, timeout=0.05)
+    held = pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.05
+    assert pool.stats()["timeouts"] == 1
+    held.close()
+    pool.acquire().close()
+
+
+def test_waiter_gets_connection_when_released(tmp_path):
+    pool, opened = make_pool(tmp_path, max_size=1, timeout=5)
+    held = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    assert not got
+    held.close()
+    waiter.join(2)
+    assert got and got[0]._entry.raw is opened[0]
+    got[0].close()
+    assert pool.stats()["waits"] == 1
+
+
+def test_release_rolls_back_uncommitted_work(tmp_path):
+    pool, _ = make_pool(tmp_path, max_size=1)
+    with pool.acquire() as conn:
+        conn.execute("CREATE TABLE t (x INTEGER)")
+        conn.commit()
+        conn.execute("INSERT INTO t VALUES (1)")
+    with pool.acquire() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+
+
+def test_closed_pool_refuses_checkout(tmp_path):
+    pool, _ = make_pool(tmp_path)
+    pool.acquire().close()
+    pool.close()
+    assert pool.stats()["size"] == 0
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire()
@@ -0,0 +1,123 @@
+import json
+import queue
+
+import pytest
+
+from umd_app import events
+from umd_app.db import pooled_connection
+
+
+@pytest.fixture(autouse=True)
+def fresh_events(monkeypatch):
+    # Business ids repeat across test databases; start every test with empty buffers
+    monkeypatch.setattr(events, "_buffers", {})
+    monkeypatch.setattr(events, "_subscribers", {})
+
+
+def other_branch(business):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO branches (branch_name, business_id) OUTPUT INSERTED.branch_id
+            VALUES ('Other', ?)
+        """, (business["business_id"],))
+        branch_id = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+    return branch_id
+
+
+def sse_events(body):
+    parsed = []
+    for block in body.split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line
+                      and not line.startswith(":"))
+        if "event" in fields:
+            parsed.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def test_long_poll_returns_new_alerts(manager, business):
+    response = manager.get('/api/alert/poll')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["events"] == [{"type": "unread_count", "unread_count": 0}]
+
+    response = manager.post('/api/utility/utility-bills/bulk', json={"bills": [
+        {"utility_type_id": 1, "year": 2024, "month": 3, "amount": 10}]})
+    assert response.status_code == 201
+
+    response = manager.get(f'/api/alert/poll?since={body["cursor"]}&timeout=0')
+    body = response.get_json()
+    assert [event["type"] for event in body["events"]] == ["alerts", "unread_count"]
+    assert body["events"][0]["alerts"][0]["type"] == "missing_budget"
+    assert body["events"][1]["unread_count"] == 1
+    # Nothing newer than the returned cursor
+    response = manager.get(f'/api/alert/poll?since={body["cursor"]}&timeout=0')
+    assert response.get_json()["events"] == []
+
+
+def test_managers_only_see_their_branches(admin, manager, business):
+    since = events._next_id()
+    elsewhere = other_branch(business)
+    events.alerts_created(business["business_id"], [
+        (elsewhere, None, "missing_budget", "High", "No budget"),
+        (business["branch_id"], None, "budget_warning", "medium", "90%")])
+
+    def alert_branches(client):
+        body = client.get(f'/api/alert/poll?since={since}&timeout=0').get_json()
+        return [event["branch_id"] for event in body["events"] if event["type"] == "alerts"]
+    assert alert_branches(manager) == [business["branch_id"]]
+    assert sorted(alert_branches(admin)) == sorted([elsewhere, business["branch_id"]])
+
+
+def test_stream_replays_missed_alerts(manager, business, monkeypatch):
+    monkeypatch.setattr(events, "stream_max", 0)
+    since = events._next_id()
+    events.alerts_created(business["business_id"], [
+        (business["branch_id"], None, "budget_warning", "medium", "90%")])
+
+    response = manager.get('/api/alert/stream', headers={"Last-Event-ID": str(since)})
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/event-stream")
+    assert response.headers["Cache-Control"] == "no-cache"
+    streamed = sse_events(response.get_data(as_text=True))
+    assert [kind for _, kind, _ in streamed] == ["alerts", "unread_count"]
+    assert streamed[0][2]["alerts"][0]["message"] == "90%"
+    assert streamed[0][0] < streamed[1][0]
+
+    # A fresh connection only gets the current count
+    response = manager.get('/api/alert/stream')
+    assert [kind for _, kind, _ in sse_events(response.get_data(as_text=True))] == ["unread_count"]
+
+
+def test_requires_login(app):
+    client = app.test_client()
+    assert client.get('/api/alert/stream').status_code == 401
+    assert client.get('/api/alert/poll').status_code == 401
+
+
+def test_redis_backend_relays_between_processes():
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    listener = events.RedisBackend(client=fakeredis.FakeRedis(server=server))
+    publisher = events.RedisBackend(client=fakeredis.FakeRedis(server=server))
+
+    target = events.subscribe(7)
+    listener.start()
+    try:
+        # The listener subscribes in its own thread; publish until it is there
+        for _ in range(50):
+            publisher.publish({"id": 1, "business_id": 7, "branch_id": None,
+                               "type": "unread_count", "data": {"unread_count": 3}})
+            try:
+                event = target.get(timeout=0.1)
+                break
+            except queue.Empty:
+                continue
+        else:
+            pytest.fail("event never arrived")
+    finally:
+        events.unsubscribe(7, target)
+    assert event["data"] == {"unread_count": 3}
+    assert events.recent(7, 0)[0]["id"] == 1
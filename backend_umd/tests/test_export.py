@@ -0,0 +1,84 @@
+import csv
+import io
+import json
+
+from umd_app import export
+from umd_app.db import pool_stats, pooled_connection
+
+
+def add_bills(business):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO branches (branch_name, business_id) OUTPUT INSERTED.branch_id
+            VALUES ('Second', ?)
+        """, (business["business_id"],))
+        other_branch = cursor.fetchone()[0]
+        for branch_id, month, amount in ((business["branch_id"], 1, "10.50"),
+                                         (business["branch_id"], 2, "20.00"),
+                                         (other_branch, 2, "99.00")):
+            cursor.execute("""
+                INSERT INTO utility_bills (branch_id, utility_type_id, year, month, amount, uploaded_by)
+                VALUES (?, 1, 2024, ?, ?, ?)
+            """, (branch_id, month, amount, business["manager_id"]))
+        cursor.execute("""
+            INSERT INTO budget (branch_id, year, month, total_budget, allocated_by)
+            VALUES (?, 2024, 2, 500, ?)
+        """, (business["branch_id"], business["admin_id"]))
+        conn.commit()
+        cursor.close()
+
+
+def test_expense_export_is_scoped_csv(admin, manager, business):
+    add_bills(business)
+
+    response = admin.get('/api/dashboard/expenses/export')
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert 'filename="utility_bills.csv"' in response.headers["Content-Disposition"]
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(r["branch_name"], float(r["amount"])) for r in rows] == [
+        ("Main", 10.5), ("Main", 20), ("Second", 99)]
+    assert rows[0]["uploaded_by"] == "manager"
+
+    # Managers only see their own branch, whatever branch_id they ask for
+    response = manager.get('/api/dashboard/expenses/export?month=2&branch_id=999')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [(r["branch_name"], r["month"]) for r in rows] == [("Main", "2")]
+    # The stream gave its connection back once it finished
+    assert pool_stats()["in_use"] == 0
+
+
+def test_export_holds_no_connection_between_batches(admin, business, monkeypatch):
+    add_bills(business)
+    monkeypatch.setattr(export, "FETCH_SIZE", 2)
+
+    response = admin.get('/api/dashboard/expenses/export?format=ndjson')
+    chunks = response.response
+    first = next(chunks)
+    assert [json.loads(line)["amount"] for line in first.splitlines()] == [10.5, 20.0]
+    assert pool_stats()["in_use"] == 0
+    rest = "".join(chunk.decode() if isinstance(chunk, bytes) else chunk for chunk in chunks)
+    assert [json.loads(line)["amount"] for line in rest.splitlines()] == [99.0]
+    response.close()
+
+
+def test_budget_export_ndjson(admin, manager, business):
+    add_bills(business)
+    response = admin.get('/api/budget/budgets/export?format=ndjson')
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert len(lines) == 1
+    assert lines[0]["total_budget"] == 500.0
+    assert lines[0]["allocated_by"] == "admin"
+    assert manager.get('/api/budget/budgets/export?format=ndjson').get_data() == \
+        response.get_data()
+
+
+def test_export_rejects_bad_requests(app, admin):
+    assert admin.get('/api/dashboard/expenses/export?format=xml').status_code == 400
+    assert admin.get('/api/budget/budgets/export?format=xlsx').status_code == 400
+    anonymous = app.test_client()
+    assert anonymous.get('/api/dashboard/expenses/export').status_code == 401
+    assert anonymous.get('/api/budget/budgets/export').status_code == 401
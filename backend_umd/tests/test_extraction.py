@@ -0,0 +1,98 @@
+import io
+from datetime import timedelta
+
+import pytest
+
+from test_rollup import drift, rollup_row
+from umd_app import extraction
+from umd_app.db import pooled_connection
+
+BILL_CSV = b"Meter,Year,Month,Units Used,Amount Due\nA,2024,Feb,150,60.50\n"
+
+
+def execute(sql, params=()):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(sql, params)
+        conn.commit()
+        cursor.close()
+
+
+@pytest.fixture
+def bill_id(manager):
+    response = manager.post('/api/utility/utility-bills/upload', data={
+        "utility_type_id": "1", "year": "2024", "month": "3", "amount": "5",
+        "media_file": (io.BytesIO(BILL_CSV), "export.csv")}, content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()["bill_id"]
+
+
+def test_upload_suggests_values_from_the_attachment(manager, bill_id):
+    response = manager.get(f'/api/utility/utility-bills/{bill_id}/extraction')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body["status"], body["method"]) == ("suggested", "csv")
+    assert body["suggested"] == {"amount": 60.5, "units_used": 150.0, "year": 2024, "month": 2}
+    # Nothing applied until someone confirms
+    assert body["current"]["amount"] == 5.0
+
+
+def test_confirm_moves_the_bill_and_its_totals(manager, business, bill_id):
+    branch_id = business["branch_id"]
+    response = manager.post(f'/api/utility/utility-bills/{bill_id}/extraction/confirm',
+                            json={"units_used": 149})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    body = response.get_json()
+    assert (body["amount"], body["units_used"], body["month"]) == (60.5, 149.0, 2)
+
+    assert rollup_row(branch_id, 2024, 3)[1:3] == [0, 0]
+    assert float(rollup_row(branch_id, 2024, 2)[1]) == 60.5
+    assert drift() == []
+
+    # Only once
+    response = manager.post(f'/api/utility/utility-bills/{bill_id}/extraction/confirm', json={})
+    assert response.status_code == 409
+
+
+@pytest.mark.parametrize("body, message", [
+    ({"amount": "lots"}, "must be numbers"),
+    ({"amount": -5}, "greater than zero"),
+    ({"units_used": -1}, "cannot be negative"),
+    ({"year": "soon"}, "whole numbers"),
+    ({"month": 0}, "between 1 and 12"),
+])
+def test_confirm_rejects_bad_values(manager, bill_id, body, message):
+    response = manager.post(f'/api/utility/utility-bills/{bill_id}/extraction/confirm', json=body)
+    assert response.status_code == 400
+    assert message in response.get_json()["error"]
+    # Still waiting to be confirmed
+    body = manager.get(f'/api/utility/utility-bills/{bill_id}/extraction').get_json()
+    assert body["status"] == "suggested"
+
+
+def test_failures_are_retried_then_given_up(manager, business, bill_id, monkeypatch):
+    def broken(jobs):
+        return [(job[0], None, None, "OSError: disk") for job in jobs]
+    monkeypatch.setattr(extraction, "_parse", broken)
+    execute("""
+        INSERT INTO bill_extractions (utility_bill_id, media_id)
+        SELECT utility_bill_id, media_id FROM bill_extractions
+    """)
+    latest = extraction.pending(grace=0)
+    assert len(latest) == 1
+    for attempt in range(extraction.MAX_ATTEMPTS):
+        assert extraction.pending(grace=0) == latest
+        status = extraction.process(latest)
+        # The claim keeps the row from being retried until it times out
+        assert extraction.process(latest) == {}
+        execute("UPDATE bill_extractions SET claimed_at = ?",
+                (extraction._now() - timedelta(seconds=extraction.CLAIM_TIMEOUT + 1),))
+    assert status == {latest[0]: "failed"}
+    assert extraction.pending(grace=0) == []
+
+    body = manager.get(f'/api/utility/utility-bills/{bill_id}/extraction').get_json()
+    assert (body["status"], body["error"]) == ("failed", "OSError: disk")
+
+
+def test_requires_login(app, bill_id):
+    assert app.test_client().get(f'/api/utility/utility-bills/{bill_id}/extraction').status_code == 401
@@ -0,0 +1,55 @@
+import json
+import logging
+
+import pytest
+
+from umd_app import create_app, instrumentation
+
+
+class Records(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def slow_log(monkeypatch):
+    # init_app() switches the module on for the process; put it back afterwards
+    monkeypatch.setattr(instrumentation, "enabled", False)
+    monkeypatch.setattr(instrumentation, "slow_query_ms", 200.0)
+    monkeypatch.setattr(instrumentation.slow_log, "handlers", [])
+    monkeypatch.setattr(instrumentation.slow_log, "propagate", True)
+    records = Records()
+    instrumentation.slow_log.addHandler(records)
+    return records
+
+
+def test_off_by_default(app, admin, slow_log):
+    response = admin.post('/api/dashboard/summary')
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+    assert slow_log.messages == []
+
+
+def test_server_timing_and_slow_query_log(database, business, monkeypatch, slow_log):
+    monkeypatch.setenv("SQL_INSTRUMENTATION", "1")
+    monkeypatch.setenv("SLOW_QUERY_MS", "0")  # every statement counts as slow
+    app = create_app()
+    client = app.test_client()
+    client.post('/api/auth/login', json={"email": "admin@acme.test", "password": "test-pass"})
+    del slow_log.messages[:]
+
+    response = client.post('/api/dashboard/summary')
+    assert response.status_code == 200
+    timing = response.headers["Server-Timing"]
+    assert timing.startswith("db;dur=") and 'desc="1 queries"' in timing and "app;dur=" in timing
+
+    entries = [json.loads(message) for message in slow_log.messages]
+    assert len(entries) == 1
+    assert entries[0]["event"] == "slow_query"
+    assert entries[0]["route"] == "dashboard_bp.get_dashboard_summary"
+    assert entries[0]["rows"] == 1
+    assert "\n" not in entries[0]["sql"] and entries[0]["sql"].startswith("WITH biz AS")
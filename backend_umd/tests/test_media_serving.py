@@ -0,0 +1,118 @@
+import hashlib
+import io
+
+import pytest
+
+from conftest import login
+from umd_app import authz, cache, media_serving, media_store
+from umd_app.db import pooled_connection
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 4
+
+
+@pytest.fixture(autouse=True)
+def fresh_rows(monkeypatch):
+    # Media ids repeat across test databases
+    monkeypatch.setattr(media_serving, "_rows", cache.MemoryBackend())
+
+
+def upload(client, content, name):
+    response = client.post('/api/utility/utility-bills/upload', data={
+        "utility_type_id": "1", "year": "2024", "month": "3", "amount": "5",
+        "media_file": (io.BytesIO(content), name)}, content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_data(as_text=True)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT MAX(id) FROM media")
+        media_id = cursor.fetchone()[0]
+        cursor.close()
+    return media_id
+
+
+def test_attachment_is_cached_as_immutable(manager, business):
+    media_id = upload(manager, PDF, "scan.pdf")
+    response = manager.get(f'/api/utility/media/{media_id}')
+    assert response.status_code == 200
+    assert response.data == PDF
+    assert response.mimetype == "application/pdf"
+    assert response.headers["ETag"] == f'"{hashlib.sha256(PDF).hexdigest()}"'
+    cache_control = response.headers["Cache-Control"]
+    assert "private" in cache_control and "immutable" in cache_control
+    assert "max-age=31536000" in cache_control
+
+    response = manager.get(f'/api/utility/media/{media_id}',
+                           headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_range_requests(manager, business):
+    media_id = upload(manager, PDF, "scan.pdf")
+    response = manager.get(f'/api/utility/media/{media_id}', headers={"Range": "bytes=9-18"})
+    assert response.status_code == 206
+    assert response.data == PDF[9:19]
+    assert response.headers["Content-Range"] == f"bytes 9-18/{len(PDF)}"
+
+    response = manager.get(f'/api/utility/media/{media_id}',
+                           headers={"Range": f"bytes={len(PDF) + 10}-"})
+    assert response.status_code == 416
+
+
+def test_only_users_of_the_branch_see_it(app, manager, business):
+    media_id = upload(manager, PDF, "scan.pdf")
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE branches SET handled_by = NULL")
+        conn.commit()
+        cursor.close()
+    # What the branch routes do after changing handled_by
+    authz.invalidate(business["business_id"])
+    other = login(app, "manager@acme.test")
+    assert other.get(f'/api/utility/media/{media_id}').status_code == 404
+    assert login(app, "admin@acme.test").get(f'/api/utility/media/{media_id}').status_code == 200
+    assert app.test_client().get(f'/api/utility/media/{media_id}').status_code == 401
+
+
+def test_replaced_attachment_is_gone_for_every_worker(manager, business):
+    media_id = upload(manager, PDF, "scan.pdf")
+    assert manager.get(f'/api/utility/media/{media_id}').status_code == 200
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT utility_bill_id FROM media WHERE id = ?", (media_id,))
+        bill_id = cursor.fetchone()[0]
+        cursor.close()
+
+    response = manager.patch(f'/api/utility/utility-bills/{bill_id}/media', data={
+        "media_type": "pdf", "media_file": (io.BytesIO(PDF + b"v2"), "scan.pdf")},
+        content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    # The cached row is keyed by the data version the replacement moved on
+    assert manager.get(f'/api/utility/media/{media_id}').status_code == 404
+
+
+def test_front_server_sends_the_bytes(manager, business, monkeypatch):
+    media_id = upload(manager, PDF, "scan.pdf")
+    monkeypatch.setattr(media_serving, "sendfile", "x-accel-redirect")
+    response = manager.get(f'/api/utility/media/{media_id}')
+    assert response.status_code == 200
+    assert response.data == b""
+    content_hash = hashlib.sha256(PDF).hexdigest()
+    assert response.headers["X-Accel-Redirect"] == \
+        media_serving.accel_prefix + media_store.blob_path(content_hash, "pdf")
+
+
+def test_preview_once_generated(manager, business):
+    image = pytest.importorskip("PIL.Image")
+    png = io.BytesIO()
+    image.new("RGB", (1200, 800), (200, 30, 30)).save(png, "PNG")
+    media_id = upload(manager, png.getvalue(), "meter.png")
+
+    response = manager.get(f'/api/utility/media/{media_id}/preview')
+    assert response.status_code == 202
+    media_serving.generate_preview(media_serving.lookup(media_id, business["business_id"])[0])
+
+    response = manager.get(f'/api/utility/media/{media_id}/preview')
+    assert response.status_code == 200
+    assert response.mimetype == "image/jpeg"
+    with image.open(io.BytesIO(response.data)) as preview:
+        assert max(preview.size) == media_serving.preview_size
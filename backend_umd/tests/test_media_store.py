@@ -0,0 +1,150 @@
+import hashlib
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from umd_app import media_store
+from umd_app.db import pooled_connection
+
+PDF = b"%PDF-1.4\n" + b"x" * 1000
+
+
+@pytest.fixture
+def store(database, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_store, "root", str(tmp_path / "media"))
+    return media_store
+
+
+def stored(store, content, ext="pdf"):
+    """Save, place and reference one upload, as the upload route does."""
+    blob = store.save(FileStorage(io.BytesIO(content), f"bill.{ext}"), ext)
+    store.place(blob)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        media_path = store.add_ref(cursor, blob)
+        conn.commit()
+        cursor.close()
+    store.discard(blob)
+    return media_path
+
+
+def blob_row(content_hash):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT ref_count, released_at FROM media_blobs WHERE content_hash = ?",
+                       (content_hash,))
+        row = cursor.fetchone()
+        cursor.close()
+    return row
+
+
+def release(store, media_path, now=None):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        store.release(cursor, [media_path], now)
+        conn.commit()
+        cursor.close()
+
+
+def collect(store, cutoff, dry_run=False):
+    with pooled_connection() as conn:
+        return store.collect_unreferenced(conn, cutoff, dry_run=dry_run)
+
+
+def test_same_content_is_stored_once(store):
+    content_hash = hashlib.sha256(PDF).hexdigest()
+    first = stored(store, PDF)
+    second = stored(store, PDF)
+
+    assert first == second == f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.pdf"
+    assert open(store.full_path(first), "rb").read() == PDF
+    assert blob_row(content_hash)[0] == 2
+    # The temp files are gone once the uploads are recorded
+    assert os.listdir(os.path.join(store.root, media_store.TMP_DIR)) == []
+
+
+def test_content_must_match_extension(store):
+    with pytest.raises(media_store.InvalidMedia):
+        store.save(FileStorage(io.BytesIO(b"not a pdf"), "bill.pdf"), "pdf")
+    with pytest.raises(media_store.InvalidMedia):
+        store.save(FileStorage(io.BytesIO(b""), "bill.csv"), "csv")
+    assert os.listdir(os.path.join(store.root, media_store.TMP_DIR)) == []
+
+
+def test_gc_deletes_only_unreferenced_blobs(store):
+    content_hash = hashlib.sha256(PDF).hexdigest()
+    media_path = stored(store, PDF)
+    stored(store, PDF)
+    kept = stored(store, b"a,b\n1,2\n", "csv")
+    released_at = datetime.now() - timedelta(hours=1)
+
+    release(store, media_path, released_at)
+    assert blob_row(content_hash) == (1, None)
+    assert collect(store, datetime.now()) == (0, 0)
+
+    release(store, media_path, released_at)
+    assert blob_row(content_hash)[0] == 0
+    # Inside the grace period nothing is collected
+    assert collect(store, released_at - timedelta(minutes=1)) == (0, 0)
+    assert collect(store, datetime.now(), dry_run=True) == (1, len(PDF))
+    assert os.path.exists(store.full_path(media_path))
+
+    assert collect(store, datetime.now()) == (1, len(PDF))
+    assert blob_row(content_hash) is None
+    assert not os.path.exists(store.full_path(media_path))
+    assert os.path.exists(store.full_path(kept))
+
+
+def test_reupload_after_gc_restores_the_file(store):
+    media_path = stored(store, PDF)
+    release(store, media_path, datetime.now() - timedelta(hours=1))
+    assert collect(store, datetime.now())[0] == 1
+
+    assert stored(store, PDF) == media_path
+    assert open(store.full_path(media_path), "rb").read() == PDF
+    assert blob_row(hashlib.sha256(PDF).hexdigest()) == (1, None)
+
+
+def upload(client, content, name="scan.pdf"):
+    return client.post('/api/utility/utility-bills/upload', data={
+        "utility_type_id": "1", "year": "2024", "month": "3", "amount": "5",
+        "media_file": (io.BytesIO(content), name)}, content_type='multipart/form-data')
+
+
+def test_replacing_an_attachment_releases_the_old_file(store, manager, business):
+    response = upload(manager, PDF)
+    assert response.status_code == 201, response.get_data(as_text=True)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM utility_bills")
+        bill_id = cursor.fetchone()[0]
+        cursor.close()
+
+    replacement = PDF + b"v2"
+    response = manager.patch(f'/api/utility/utility-bills/{bill_id}/media', data={
+        "media_type": "pdf", "media_file": (io.BytesIO(replacement), "scan.pdf")}, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert blob_row(hashlib.sha256(PDF).hexdigest())[0] == 0
+    assert blob_row(hashlib.sha256(replacement).hexdigest()) == (1, None)
+
+
+def test_upload_checks_content_and_size(store, manager, monkeypatch):
+    response = upload(manager, b"MZ" + b"x" * 100)
+    assert response.status_code == 400
+    assert "pdf" in response.get_json()["error"].lower()
+
+    monkeypatch.setattr(media_store, "max_bytes", 500)
+    response = upload(manager, PDF)
+    assert response.status_code == 413
+    assert "error" in response.get_json()
+
+    # Neither request left a bill or a file behind
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM utility_bills")
+        assert cursor.fetchone()[0] == 0
+        cursor.close()
+    assert os.listdir(os.path.join(store.root, media_store.TMP_DIR)) == []
@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("prometheus_client")
+
+from umd_app import create_app, db, instrumentation, metrics  # noqa: E402
+
+
+@pytest.fixture
+def metrics_app(database, business, monkeypatch):
+    # create_app() switches both modules on for the process; undo that afterwards
+    monkeypatch.setattr(metrics, "enabled", False)
+    monkeypatch.setattr(instrumentation, "enabled", False)
+    monkeypatch.setattr(db, "_acquire_hooks", [])
+    monkeypatch.setenv("METRICS_ENABLED", "1")
+    return create_app()
+
+
+def sample(text, name, **labels):
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f"{name}{{{wanted}}} " if labels else f"{name} "
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return 0.0
+
+
+def test_metrics_off_by_default(app):
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_request_db_and_alert_metrics(metrics_app):
+    client = metrics_app.test_client()
+    before = client.get('/metrics').get_data(as_text=True)
+
+    client.post('/api/auth/login', json={"email": "manager@acme.test", "password": "test-pass"})
+    assert client.post('/api/dashboard/summary').status_code == 200
+    response = client.post('/api/utility/utility-bills/upload', data={
+        "utility_type_id": "1", "year": "2024", "month": "3", "amount": "10"},
+        content_type='multipart/form-data')
+    assert response.status_code == 201
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain")
+    after = response.get_data(as_text=True)
+
+    def delta(name, **labels):
+        return sample(after, name, **labels) - sample(before, name, **labels)
+
+    summary = {"endpoint": "dashboard_bp.get_dashboard_summary", "method": "POST"}
+    assert delta("umd_http_requests_total", **summary, status="200") == 1
+    assert delta("umd_http_request_duration_seconds_count", **summary) == 1
+    assert delta("umd_db_queries_per_request_sum",
+                 endpoint="dashboard_bp.get_dashboard_summary") == 1
+    assert delta("umd_db_connection_acquire_seconds_count") >= 3
+    # No budget for the period yet
+    assert delta("umd_alerts_created_total", alert_type="missing_budget") == 1
+    # Scrapes are not counted as requests
+    assert "endpoint=\"metrics\"" not in after
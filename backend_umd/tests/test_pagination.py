@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+
+from umd_app import pagination
+from umd_app.db import pooled_connection
+
+
+def test_cursor_round_trips():
+    uploaded_at = datetime(2024, 3, 5, 14, 30, 15, 250000)
+    token = pagination.encode_cursor(uploaded_at, 42)
+    assert "=" not in token
+    assert pagination.decode_cursor(token) == (uploaded_at, 42)
+    # Rows from the driver may hand back the timestamp as text
+    assert pagination.decode_cursor(pagination.encode_cursor("2024-03-05 14:30:15", "7")) == \
+        (datetime(2024, 3, 5, 14, 30, 15), 7)
+
+
+@pytest.mark.parametrize("token", ["", "not-a-cursor", "bnVsbA", None])
+def test_invalid_cursor_is_rejected(token):
+    with pytest.raises(pagination.InvalidCursor):
+        pagination.decode_cursor(token)
+
+
+def test_keyset_page_sets_next_cursor_only_when_more_rows():
+    rows = [(3, datetime(2024, 1, 3)), (2, datetime(2024, 1, 2)), (1, datetime(2024, 1, 1))]
+    page, next_cursor = pagination.keyset_page(rows, 2, uploaded_at_index=1)
+    assert page == rows[:2]
+    assert pagination.decode_cursor(next_cursor) == (datetime(2024, 1, 2), 2)
+    assert pagination.keyset_page(rows, 3, uploaded_at_index=1) == (rows, None)
+
+
+def test_page_size_is_clamped():
+    assert pagination.page_size_from({}) == pagination.DEFAULT_PAGE_SIZE
+    assert pagination.page_size_from({"page_size": 0}) == pagination.DEFAULT_PAGE_SIZE
+    assert pagination.page_size_from({"page_size": -5}) == 1
+    assert pagination.page_size_from({"page_size": 10000}) == pagination.MAX_PAGE_SIZE
+    with pytest.raises(pagination.InvalidCursor):
+        pagination.page_size_from({"page_size": "ten"})
+
+
+def test_cursor_pages_cover_every_bill_once(admin, business):
+    # Bills sharing an uploaded_at must still split cleanly across pages
+    stamps = [datetime(2024, 3, 1, 9, 0, 0)] * 4 + [datetime(2024, 3, 2, 9, 0, 0)] * 3
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        for n, uploaded_at in enumerate(stamps):
+            cursor.execute("""
+                INSERT INTO utility_bills (branch_id, utility_type_id, year, month, units_used,
+                    amount, uploaded_at, status)
+                VALUES (?, 1, 2024, 3, 1, ?, ?, 1)
+            """, (business["branch_id"], n + 1, uploaded_at))
+        cursor.execute("SELECT id FROM utility_bills ORDER BY uploaded_at DESC, id DESC")
+        expected = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        cursor.close()
+
+    seen, token = [], None
+    while True:
+        response = admin.post('/api/utility/utility-bills/all',
+                              json={"cursor": token, "page_size": 3})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        body = response.get_json()
+        assert len(body["utilities"]) <= 3
+        seen += [bill["id"] for bill in body["utilities"]]
+        token = body["next_cursor"]
+        if token is None:
+            break
+    assert seen == expected
+
+    response = admin.post('/api/utility/utility-bills/all', json={"cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_expense_pages_and_totals(admin, manager, business):
+    for amount in range(1, 6):
+        response = manager.post('/api/utility/utility-bills/upload', data={
+            "utility_type_id": "1", "year": "2024", "month": "3", "amount": str(amount)},
+            content_type='multipart/form-data')
+        assert response.status_code == 201, response.get_data(as_text=True)
+
+    body = admin.post('/api/dashboard/expenses/all', json={"page": 1, "page_size": 2}).get_json()
+    assert body["total_pages"] == 3
+    # Later pages are not counted again unless asked
+    body = admin.post('/api/dashboard/expenses/all', json={"page": 3, "page_size": 2}).get_json()
+    assert "total_pages" not in body
+    assert [e["amount"] for e in body["expenses"]] == [1.0]
+    body = admin.post('/api/dashboard/expenses/all', json={
+        "page": 3, "page_size": 2, "utility_type_id": 1, "include_total": True}).get_json()
+    assert body["total_pages"] == 3
+
+    amounts, token = [], None
+    while True:
+        body = admin.post('/api/dashboard/expenses/all', json={
+            "cursor": token, "page_size": 2, "include_total": True}).get_json()
+        assert body["total_estimate"] == 5
+        amounts += [e["amount"] for e in body["expenses"]]
+        token = body["next_cursor"]
+        if token is None:
+            break
+    assert amounts == [5.0, 4.0, 3.0, 2.0, 1.0]
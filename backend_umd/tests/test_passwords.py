@@ -0,0 +1,92 @@
+import threading
+
+import pytest
+
+from conftest import PASSWORD
+from umd_app import passwords
+from umd_app.db import pooled_connection
+
+
+def sign_in(client, password, email="manager@acme.test"):
+    return client.post('/api/auth/login', json={"email": email, "password": password})
+
+
+def stored_hash(email):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT userpassword FROM users WHERE email = ?", (email,))
+        hashed = cursor.fetchone()[0]
+        cursor.close()
+    return hashed
+
+
+def test_hash_and_check(app):
+    hashed = passwords.hash_password("s3cret")
+    assert hashed.startswith("$2b$04$")
+    assert passwords.check_password("s3cret", hashed)
+    assert not passwords.check_password("wrong", hashed)
+    assert not passwords.check_password("s3cret", "plain text")
+    assert not passwords.check_password("s3cret", None)
+    assert not passwords.needs_rehash(hashed)
+    assert passwords.needs_rehash(hashed.replace("$04$", "$10$", 1))
+
+
+def test_failed_logins_are_throttled(app, business, monkeypatch):
+    monkeypatch.setattr(passwords, "max_account_failures", 2)
+    client = app.test_client()
+    assert sign_in(client, "wrong").status_code == 401
+    assert sign_in(client, "wrong").status_code == 401
+
+    # Even the right password is refused until the window has passed
+    response = sign_in(client, PASSWORD)
+    assert response.status_code == 429
+    assert 0 < int(response.headers["Retry-After"]) <= passwords.window
+    # Other accounts are not affected
+    assert sign_in(client, PASSWORD, "admin@acme.test").status_code == 200
+
+
+def test_success_clears_the_account_failures(app, business, monkeypatch):
+    monkeypatch.setattr(passwords, "max_account_failures", 2)
+    client = app.test_client()
+    assert sign_in(client, "wrong").status_code == 401
+    assert sign_in(client, PASSWORD).status_code == 200
+    assert sign_in(client, "wrong").status_code == 401
+    assert sign_in(client, PASSWORD).status_code == 200
+
+
+def test_login_rehashes_at_the_configured_cost(app, business, monkeypatch):
+    monkeypatch.setattr(passwords, "rounds", 5)
+    assert stored_hash("manager@acme.test").startswith("$2b$04$")
+    assert sign_in(app.test_client(), PASSWORD).status_code == 200
+    assert stored_hash("manager@acme.test").startswith("$2b$05$")
+    assert sign_in(app.test_client(), PASSWORD).status_code == 200
+
+
+def test_full_pool_answers_503(app, business, monkeypatch):
+    monkeypatch.setattr(passwords, "workers", 1)
+    monkeypatch.setattr(passwords, "_slots", threading.BoundedSemaphore(1))
+    assert passwords.check_password(PASSWORD, stored_hash("manager@acme.test"))
+
+    # Every slot taken by sign-ins in progress
+    passwords._slots.acquire()
+    try:
+        with pytest.raises(passwords.PasswordPoolBusy):
+            passwords.hash_password("s3cret")
+        response = sign_in(app.test_client(), PASSWORD)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        passwords._slots.release()
+    assert sign_in(app.test_client(), PASSWORD).status_code == 200
+
+
+def test_redis_throttle():
+    fakeredis = pytest.importorskip("fakeredis")
+    throttle = passwords.RedisThrottle(client=fakeredis.FakeRedis())
+    assert throttle.get("account:a") == (0, 0)
+    throttle.hit("account:a", 60)
+    throttle.hit("account:a", 60)
+    failures, remaining = throttle.get("account:a")
+    assert failures == 2 and 0 < remaining <= 60
+    throttle.reset("account:a")
+    assert throttle.get("account:a") == (0, 0)
@@ -0,0 +1,152 @@
+from decimal import Decimal
+
+from conftest import login
+from umd_app import rollup
+from umd_app.db import pooled_connection
+
+
+def drift():
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        found = rollup.find_drift(rollup.compute_from_source(cursor), rollup.load_rollup(cursor))
+        cursor.close()
+    return found
+
+
+def rollup_row(branch_id, year, month):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        row = rollup.load_rollup(cursor).get((branch_id, year, month))
+        cursor.close()
+    return row
+
+
+def upload(client, year, month, amount):
+    data = {"utility_type_id": "1", "year": str(year), "month": str(month),
+            "units_used": "10", "amount": str(amount)}
+    response = client.post('/api/utility/utility-bills/upload', data=data,
+                           content_type='multipart/form-data')
+    assert response.status_code == 201, response.get_data(as_text=True)
+    return response.get_json()["bill_id"]
+
+
+def test_apply_delta_creates_then_adds(database, business):
+    branch_id = business["branch_id"]
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        rollup.apply_delta(cursor, branch_id, 2024, 3, budget=100, expense="12.50", bills=1)
+        rollup.apply_delta(cursor, branch_id, 2024, 3, expense=7.5, bills=1, alerts=1)
+        rollup.apply_delta(cursor, branch_id, None, 3, expense=1000)  # no period: ignored
+        conn.commit()
+        cursor.close()
+    assert rollup_row(branch_id, 2024, 3) == [Decimal(100), Decimal(20), 2, 1]
+
+
+def test_find_drift_reports_differences():
+    expected = {(1, 2024, 1): [Decimal(10), Decimal(5), 1, 0]}
+    assert rollup.find_drift(expected, {(1, 2024, 1): [Decimal("10.001"), Decimal(5), 1, 0]}) == []
+    assert rollup.find_drift(expected, {}) == [
+        ((1, 2024, 1), [Decimal(10), Decimal(5), 1, 0], [Decimal(0), Decimal(0), 0, 0])]
+
+
+def test_write_paths_keep_rollup_in_step(admin, manager, business):
+    branch_id = business["branch_id"]
+
+    # add: budget, single uploads and a bulk batch
+    response = admin.post('/api/budget/add', json={
+        "branch_id": branch_id, "year": 2024, "month": 3, "total_budget": 1000})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    upload(manager, 2024, 3, 400)
+    bill_id = upload(manager, 2024, 3, 650)
+    upload(manager, 2024, 1, 5)
+    response = manager.post('/api/utility/utility-bills/bulk', json={"bills": [
+        {"utility_type_id": 2, "year": 2024, "month": 3, "amount": 25},
+        {"utility_type_id": 3, "year": 2024, "month": 4, "amount": 30},
+    ]})
+    assert response.status_code == 201, response.get_data(as_text=True)
+    assert drift() == []
+    assert rollup_row(branch_id, 2024, 3)[:3] == [Decimal(1000), Decimal(1075), 3]
+
+    # update: move the budget to another period
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM budget WHERE branch_id = ?", (branch_id,))
+        budget_id = cursor.fetchone()[0]
+        cursor.close()
+    response = admin.patch(f'/api/budget/update/{budget_id}', json={
+        "total_budget": 600, "year": 2024, "month": 4})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert drift() == []
+
+    # delete
+    response = manager.delete(f'/api/utility/utility-bills/delete/{bill_id}')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert manager.delete(f'/api/utility/utility-bills/delete/{bill_id}').status_code == 404
+    assert drift() == []
+    assert rollup_row(branch_id, 2024, 3)[:3] == [Decimal(0), Decimal(425), 2]
+    assert rollup_row(branch_id, 2024, 4)[0] == Decimal(600)
+
+
+def test_bills_of_other_businesses_cannot_be_deleted(app, manager, business):
+    bill_id = upload(manager, 2024, 3, 40)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO business (business_name, req_status) OUTPUT INSERTED.business_id
+            VALUES ('Other', 'approved')
+        """)
+        other_business = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO users (username, email, userpassword, role_id, business_id)
+            SELECT 'intruder', 'intruder@other.test', userpassword, 1, ?
+            FROM users WHERE email = 'admin@acme.test'
+        """, (other_business,))
+        conn.commit()
+        cursor.close()
+
+    intruder = login(app, "intruder@other.test")
+    response = intruder.delete(f'/api/utility/utility-bills/delete/{bill_id}')
+    assert response.status_code == 404
+    assert app.test_client().delete(f'/api/utility/utility-bills/delete/{bill_id}').status_code == 401
+    assert rollup_row(business["branch_id"], 2024, 3)[1:3] == [Decimal(40), 1]
+
+
+def test_branch_performance_reads_the_session_branch(admin, manager, business):
+    upload(manager, 2024, 3, 40)
+    response = manager.post('/api/dashboard/branch-performance', json={})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    [row] = response.get_json()["branch_performance"]
+    assert (row["branch_id"], row["total_expense"]) == (business["branch_id"], 40.0)
+
+    # Admins have no branch in their session
+    response = admin.post('/api/dashboard/branch-performance',
+                          json={"branch_id": business["branch_id"]})
+    assert response.get_json() == {"branch_performance": []}
+
+
+def test_budget_recommendation_hides_unknown_branches(admin, manager, business):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO branches (branch_name, business_id) OUTPUT INSERTED.branch_id
+            VALUES ('Second', ?)
+        """, (business["business_id"],))
+        second = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO business (business_name, req_status) OUTPUT INSERTED.business_id
+            VALUES ('Other', 'approved')
+        """)
+        cursor.execute("""
+            INSERT INTO branches (branch_name, business_id) OUTPUT INSERTED.branch_id
+            VALUES ('Elsewhere', ?)
+        """, (cursor.fetchone()[0],))
+        foreign = cursor.fetchone()[0]
+        conn.commit()
+        cursor.close()
+
+    path = '/api/dashboard/reports/budget-recommendation/{}'
+    assert admin.get(path.format(999)).status_code == 404
+    assert admin.get(path.format(foreign)).status_code == 404
+    assert manager.get(path.format(foreign)).status_code == 404
+    assert manager.get(path.format(second)).status_code == 403
+    assert admin.get(path.format(second)).status_code != 403
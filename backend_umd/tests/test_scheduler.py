@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+
+from umd_app import scheduler
+from umd_app.db import pooled_connection
+
+
+def acquire(owner, now, force=False):
+    scheduler._owner = owner
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        won = scheduler._acquire(cursor, "job", now, force)
+        conn.commit()
+        cursor.close()
+    return won
+
+
+def add_job(now):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO scheduled_jobs (name, interval_seconds, next_run_at) VALUES ('job', 60, ?)
+        """, (now,))
+        conn.commit()
+        cursor.close()
+
+
+def test_only_one_owner_takes_the_lease(database, monkeypatch):
+    monkeypatch.setattr(scheduler, "_owner", scheduler._owner)
+    now = scheduler._now()
+    add_job(now)
+
+    assert acquire("host-a:1", now)
+    assert not acquire("host-b:2", now)
+    # Not even when forced, while the lease is held
+    assert not acquire("host-b:2", now, force=True)
+
+    # Once the lease has run out, the other owner may take over
+    later = now + timedelta(seconds=scheduler.LEASE_SECONDS + 1)
+    assert acquire("host-b:2", later)
+    assert not acquire("host-a:1", later)
+
+
+def test_job_not_taken_before_it_is_due(database, monkeypatch):
+    monkeypatch.setattr(scheduler, "_owner", scheduler._owner)
+    now = scheduler._now()
+    add_job(now + timedelta(minutes=5))
+    assert not acquire("host-a:1", now)
+    assert acquire("host-a:1", now, force=True)
+
+
+def test_run_job_runs_once_per_period(database, monkeypatch):
+    runs = []
+    monkeypatch.setattr(scheduler, "_jobs", {})
+    scheduler.job("counter", 3600)(lambda cursor, now: (runs.append(now) or "ok", None))
+
+    assert scheduler.run_job("counter") == "ok"
+    # next_run_at moved an hour on; a second process finds nothing due
+    monkeypatch.setattr(scheduler, "_owner", "other:2")
+    assert scheduler.run_job("counter") is None
+    assert len(runs) == 1
+
+
+def test_budget_reminders_once_a_month_after_allocation(admin, manager, business):
+    branch_id = business["branch_id"]
+    response = admin.post('/api/budget/add', json={
+        "branch_id": branch_id, "year": 2024, "month": 3, "total_budget": 100})
+    assert response.status_code == 201
+    now = scheduler._now()
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        # Adding the budget no longer writes a reminder of its own
+        cursor.execute("SELECT COUNT(*) FROM alerts")
+        assert cursor.fetchone()[0] == 0
+        assert scheduler.due_budget_reminders(cursor, now) == []
+
+        # Allocations older than the previous month are not read at all
+        cursor.execute("UPDATE budget SET created_at = ?", (now - relativedelta(months=3),))
+        assert scheduler.due_budget_reminders(cursor, now) == []
+
+        cursor.execute("UPDATE budget SET created_at = ?", (now - relativedelta(months=1),))
+        assert scheduler.due_budget_reminders(cursor, now) == [(branch_id, business["business_id"])]
+        assert scheduler.budget_reminders(cursor, now)[0] == "1 reminders"
+        conn.commit()
+        assert scheduler.due_budget_reminders(cursor, now) == []
+        cursor.close()
+
+    for client in (admin, manager):
+        response = client.get('/api/alert/budget-reminders/today')
+        assert response.status_code == 200, response.get_data(as_text=True)
+        assert [alert["message"] for alert in response.get_json()["alerts"]] == \
+            [scheduler.REMINDER_MESSAGE]
+
+
+def test_failed_job_is_logged_and_retried(database, monkeypatch, caplog):
+    monkeypatch.setattr(scheduler, "_jobs", {})
+
+    @scheduler.job("broken", 3600)
+    def broken(cursor, now):
+        raise RuntimeError("no budget table")
+
+    with caplog.at_level("ERROR", logger="umd_app.scheduler"):
+        assert scheduler.run_job("broken") is None
+    assert "Scheduled job broken failed" in caplog.text
+    # Still due, so the next tick tries again
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT next_run_at <= ?, last_status, locked_by FROM scheduled_jobs WHERE name = 'broken'
+        """, (scheduler._now(),))
+        assert tuple(cursor.fetchone()) == (1, "error: no budget table", None)
+        cursor.close()
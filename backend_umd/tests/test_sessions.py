@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from umd_app import sessions
+from conftest import login
+
+
+def make_store(kind, tmp_path):
+    if kind == "memory":
+        return sessions.MemoryStore()
+    if kind == "sqlite":
+        return sessions.SQLiteStore(str(tmp_path / "sessions" / "sessions.sqlite3"))
+    fakeredis = pytest.importorskip("fakeredis")
+    return sessions.RedisStore(client=fakeredis.FakeRedis())
+
+
+@pytest.mark.parametrize("kind", ["memory", "sqlite", "redis"])
+def test_store_invalidates_by_user_and_sweeps(kind, tmp_path):
+    store = make_store(kind, tmp_path)
+    later = time.time() + 60
+    store.set("a1", "{}", 1, later)
+    store.set("a2", "{}", 1, later)
+    store.set("b1", '{"x": 1}', 2, later)
+    assert store.get("b1") == ('{"x": 1}', later)
+
+    assert store.delete_user(1) == 2
+    assert store.get("a1") is None and store.get("a2") is None
+    assert store.get("b1") is not None
+
+    if kind != "redis":  # Redis expires keys itself
+        store.set("old", "{}", 3, time.time() - 1)
+        assert store.get("old") is None
+        assert store.sweep() == 1
+    store.delete("b1")
+    assert store.get("b1") is None
+
+
+def test_session_lives_on_the_server(app, business):
+    client = login(app, "manager@acme.test")
+    cookie = client.get_cookie("session")
+    # The cookie is only an id
+    assert "manager" not in cookie.value
+    assert client.get('/api/auth/me').get_json()["user"]["user_id"] == business["manager_id"]
+
+
+def test_login_rotates_session_id(app, business):
+    client = app.test_client()
+    client.get('/api/auth/me')
+    client.set_cookie("session", "planted-id")
+    client.post('/api/auth/login', json={"email": "manager@acme.test", "password": "test-pass"})
+    assert client.get_cookie("session").value != "planted-id"
+
+
+def test_updating_a_user_ends_their_sessions(app, admin, business):
+    manager = login(app, "manager@acme.test")
+    other_device = login(app, "manager@acme.test")
+
+    response = admin.put(f'/api/auth/update-user/{business["manager_id"]}',
+                         json={"contact_no": "555"})
+    assert response.status_code == 200
+    assert manager.get('/api/auth/me').get_json()["user"] is None
+    assert other_device.get('/api/auth/me').get_json()["user"] is None
+    # The admin making the change stays logged in
+    assert admin.get('/api/auth/me').get_json()["user"]["user_id"] == business["admin_id"]
+
+
+def test_invalidate_user_without_a_store(monkeypatch):
+    monkeypatch.setattr(sessions, "_store", None)
+    assert sessions.invalidate_user(1) == 0
+
+
+def test_sweeper_starts_with_the_first_request(database, monkeypatch):
+    swept = []
+    monkeypatch.setattr(sessions, "_sweep_forever", lambda store, interval: swept.append(interval))
+    monkeypatch.setattr(sessions, "_sweeper_pid", None)
+    monkeypatch.setenv("SESSION_SWEEP_INTERVAL", "60")
+    from umd_app import create_app
+    client = create_app().test_client()
+    # Not in the process that built the app, which may be a preforking master
+    assert swept == []
+    client.get('/api/alert/poll')
+    client.get('/api/alert/poll')
+    deadline = time.monotonic() + 2
+    while not swept and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert swept == [60.0]
@@ -0,0 +1,82 @@
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+from umd_app.db_backends.sqlite import translate
+
+
+def squash(sql):
+    return " ".join(sql.split())
+
+
+def test_isnull_and_casts():
+    sql = translate("SELECT ISNULL(SUM(amount), 0), CAST(created_at AS DATE), "
+                    "CAST(? AS DATETIME) FROM t")
+    assert squash(sql) == "SELECT IFNULL(SUM(amount), 0), DATE(created_at), ? FROM t"
+
+
+def test_offset_fetch_keeps_parameter_order():
+    sql = translate("SELECT id FROM t ORDER BY id OFFSET ? ROWS FETCH NEXT ? ROWS ONLY")
+    assert squash(sql) == "SELECT id FROM t ORDER BY id LIMIT ?, ?"
+    sql = translate("SELECT id FROM t ORDER BY id OFFSET 0 ROWS FETCH FIRST 10 ROWS ONLY")
+    assert squash(sql) == "SELECT id FROM t ORDER BY id LIMIT 0, 10"
+
+
+def test_output_inserted_becomes_returning():
+    sql = translate("""
+        INSERT INTO media (a, b)
+        OUTPUT INSERTED.id
+        VALUES (?, COALESCE(?, 1))
+    """)
+    assert squash(sql) == "INSERT INTO media (a, b) VALUES (?, COALESCE(?, 1)) RETURNING id"
+
+
+def test_select_top_becomes_limit():
+    assert squash(translate("SELECT TOP 5 id FROM t ORDER BY id;")) == \
+        "SELECT id FROM t ORDER BY id LIMIT 5"
+    assert squash(translate("SELECT TOP (500) id FROM t")) == "SELECT id FROM t LIMIT 500"
+
+
+def test_nested_top_is_rejected():
+    with pytest.raises(sqlite3.NotSupportedError):
+        translate("SELECT * FROM (SELECT TOP 1 id FROM t) x")
+
+
+def test_plain_sql_is_unchanged():
+    sql = "SELECT id FROM t WHERE status = ?"
+    assert translate(sql) == sql
+
+
+def test_sql_server_statements_run_on_sqlite(database):
+    with database.pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO business (business_name, req_status)
+            OUTPUT INSERTED.business_id
+            VALUES (?, 'approved')
+        """, ("Acme",))
+        business_id = cursor.fetchone()[0]
+        cursor.executemany("INSERT INTO branches (branch_name, business_id) VALUES (?, ?)",
+                           [("North", business_id), ("South", business_id)])
+        cursor.execute("""
+            SELECT TOP 1 branch_name, YEAR(GETDATE()), ISNULL(handled_by, 0)
+            FROM branches WHERE business_id = ? ORDER BY branch_name DESC
+        """, business_id)
+        name, year, handled_by = cursor.fetchone()
+        conn.commit()
+        cursor.close()
+    assert (name, handled_by) == ("South", 0)
+    assert year >= 2024
+
+
+def test_decimals_are_bound_exactly(database):
+    with database.pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT ?, ? + ?", (Decimal("0.1"), Decimal("0.1"), Decimal("0.2")))
+        text, total = cursor.fetchone()
+        cursor.close()
+    assert text == "0.1"
+    assert total == pytest.approx(0.3)
+    # Other sqlite3 users in the process keep the default adapters
+    assert (Decimal, sqlite3.PrepareProtocol) not in sqlite3.adapters
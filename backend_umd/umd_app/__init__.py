@@ -2,10 +2,13 @@ from dotenv import load_dotenv
 from flask import Flask
 from datetime import timedelta
 from flask_cors import CORS
-from flask import session
-# from flask_session import Session
 import os
 from flask import send_from_directory
+from flask import jsonify
+from umd_app import (alert_engine, authz, cache, events, extraction, instrumentation,
+                     media_serving, media_store, metrics, passwords, scheduler, sessions)
+from umd_app.db import PoolTimeoutError
+from umd_app.rollup import rollup_cli
 from umd_app.routes.alert_routes import alert_bp
 from umd_app.routes.utilityroutes import utility_bp
 from umd_app.routes.budget_routes import budget_bp
@@ -21,16 +24,15 @@ def create_app():
     app = Flask(__name__)
 
     app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads', 'media')
+    # Whole request bodies; attachments alone are capped by MEDIA_MAX_BYTES
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 25 * 1024 * 1024))
 
     app.secret_key = 'c1nn@m0n!@#'
-    app.PERMANENT_SESSION_LIFETIME = timedelta(days=1)
-
-    app.config['SESSION_TYPE'] = 'filesystem'
-    app.config['SESSION_FILE_DIR'] = './flask_sessions'
-    app.config['SESSION_FILE_THRESHOLD'] = 100
-    app.config['SESSION_PERMANENT'] = True
-    # must be False unless you explicitly sign
-    app.config['SESSION_USE_SIGNER'] = False
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=1)
+
+    # Server-side sessions: sqlite (default), redis, memory or cookie
+    app.config['SESSION_TYPE'] = os.getenv('SESSION_TYPE', 'sqlite')
+    app.config['SESSION_FILE_DIR'] = os.getenv('SESSION_FILE_DIR', './flask_sessions')
     app.config['SESSION_COOKIE_HTTPONLY'] = True
 
 
@@ -47,6 +49,10 @@ def create_app():
         # response.headers.add("Access-Control-Allow-Credentials", "true")
         return response
 
+    @app.errorhandler(PoolTimeoutError)
+    def handle_pool_timeout(e):
+        return jsonify({"error": str(e)}), 503
+
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(business_bp, url_prefix='/api/business')
     app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
@@ -55,5 +61,32 @@ def create_app():
     app.register_blueprint(utility_bp, url_prefix='/api/utility')
     app.register_blueprint(alert_bp, url_prefix='/api/alert')
 
+    app.cli.add_command(rollup_cli)
+
+    sessions.init_app(app)
+    # bcrypt pool (PASSWORD_WORKERS), BCRYPT_ROUNDS and failed-login throttling
+    passwords.init_app(app)
+
+    # SQL timing, Server-Timing headers and the slow-query log (off by default)
+    instrumentation.init_app(app, count_queries=metrics.wanted(app))
+    # Prometheus /metrics (off by default)
+    metrics.init_app(app)
+    # Dashboard/report response cache (CACHE_BACKEND, off by default)
+    cache.init_app(app)
+    # Per-process cache of resolved access contexts (AUTHZ_CACHE_TTL)
+    authz.init_app(app)
+    # Alert push channel for /api/alert/stream (EVENTS_BACKEND)
+    events.init_app(app)
+    # Budget alert workers and outbox recovery (ALERT_WORKERS=0 evaluates inline)
+    alert_engine.init_app(app)
+    # Periodic jobs such as budget reminders (SCHEDULER_ENABLED)
+    scheduler.init_app(app)
+    # Content-addressed attachment store, streamed uploads and the `media` commands
+    media_store.init_app(app)
+    # Cache headers, X-Sendfile/X-Accel-Redirect and previews for attachments
+    media_serving.init_app(app)
+    # Amount/units/period suggestions read from attachments (EXTRACTION_WORKERS)
+    extraction.init_app(app)
+
     return app
 
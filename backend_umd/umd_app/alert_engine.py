@@ -0,0 +1,391 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+from umd_app import cache, config, events, metrics, rollup
+from umd_app.db import IntegrityError, get_connection
+
+# Budget alerts are evaluated off the request path.
+#
+# The write routes call enqueue() inside their own transaction, which adds a
+# row to alert_outbox, and notify() once it has committed, which hands the
+# row id to a pool of worker threads. A worker claims the row, evaluates the
+# period from branch_month_rollup and writes any alert together with the
+# outbox row's processed_at. Rows whose notify() was lost (crash, restart,
+# another worker process) are picked up by a poller that also runs once at
+# startup.
+#
+# Rules are evaluated from running totals (branch_month_rollup and its
+# per-utility-type split), so the cost of an evaluation does not grow with
+# the number of bills in the period:
+#   missing_budget    the period has bills but no budget
+#   threshold:<pct>   expenses reached pct% of the budget; the tiers are the
+#                     branch's budget_alert_threshold plus ALERT_THRESHOLD_TIERS
+#   overrun           expenses exceed the budget by ALERT_OVERRUN_AMOUNT or more
+#   spike:<type id>   a utility type's month is ALERT_SPIKE_FACTOR times its
+#                     average over the previous ALERT_SPIKE_MONTHS months
+#
+# alert_rule_state remembers which rules stand fired for a branch and period.
+# A rule raises an alert only on the transition from not met to met, so each
+# crossing alerts exactly once however many bills follow; when its condition
+# clears (a bill deleted, the budget raised) it is re-armed.
+#
+# ALERT_WORKERS=0 evaluates inline right after the commit instead (handy for
+# scripts and tests).
+
+log = logging.getLogger("umd_app.alert_engine")
+
+BILL = "bill"
+BUDGET = "budget"
+
+MAX_ATTEMPTS = 5
+# Seconds before a claimed but unfinished row may be retried
+CLAIM_TIMEOUT = 60
+# Seconds a fresh row is left to its notify() before the poller takes it
+POLL_GRACE = 10
+
+workers = 2
+poll_interval = 30.0
+
+_queue = queue.Queue()
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+# Rule settings, see init_app()
+threshold_tiers = (100,)
+overrun_amount = 0.0
+spike_factor = 0.0
+spike_months = 3
+spike_min_amount = 0.0
+
+
+def _fmt(value):
+    return f"{value:.2f}"
+
+
+def budget_rules(total_budget, total_expenses, bill_count, threshold):
+    """Evaluate the period-level rules.
+
+    Returns {rule_key: alert or None} for every rule that applies, where an
+    alert is (alert_type, severity, message) if the rule's condition holds.
+    """
+    results = {}
+    # Nothing to warn about for a period without bills
+    has_bills = bill_count > 0
+    results["missing_budget"] = (
+        ('missing_budget', 'High', "No budget defined for this period")
+        if has_bills and total_budget <= 0 else None)
+
+    for tier in sorted({threshold, *threshold_tiers}):
+        met = has_bills and total_budget > 0 and total_expenses >= (tier / 100) * total_budget
+        if not met:
+            results[f"threshold:{tier}"] = None
+        elif tier >= 100:
+            results[f"threshold:{tier}"] = (
+                'budget_exceeded', 'High',
+                f"Expenses reached {tier}% of budget ({_fmt(total_expenses)}/{_fmt(total_budget)})")
+        else:
+            results[f"threshold:{tier}"] = (
+                'budget_warning', 'medium',
+                f"Expenses reached {tier}% of budget ({_fmt(total_expenses)}/{_fmt(total_budget)})")
+
+    if overrun_amount > 0:
+        over = total_expenses - total_budget
+        results["overrun"] = (
+            ('budget_overrun', 'High',
+             f"Expenses are {_fmt(over)} over the budget of {_fmt(total_budget)}")
+            if has_bills and total_budget > 0 and over >= overrun_amount else None)
+    return results
+
+
+def spike_rules(current, history):
+    """Per-utility-type spike rules.
+
+    current maps utility type -> (name, this month's expense); history maps
+    utility type -> the expenses of up to spike_months earlier months.
+    """
+    results = {}
+    for type_id, (name, amount) in current.items():
+        previous = history.get(type_id) or []
+        average = sum(previous) / len(previous) if previous else 0
+        met = (average > 0 and amount >= spike_factor * average
+               and amount - average >= spike_min_amount)
+        results[f"spike:{type_id}"] = (
+            ('expense_spike', 'medium',
+             f"{name} expenses of {_fmt(amount)} are {amount / average:.1f}x "
+             f"the {len(previous)}-month average of {_fmt(average)}")
+            if met else None)
+    return results
+
+
+def _month_index(year, month):
+    return int(year) * 12 + int(month) - 1
+
+
+def _type_totals(cursor, branch_id, year, month):
+    # This period and the spike_months before it, from the per-type rollup
+    end = _month_index(year, month)
+    start = end - spike_months
+    cursor.execute("""
+        SELECT r.utility_type_id, uet.utility_name, r.year, r.month, r.expense_total, r.bill_count
+        FROM branch_type_month_rollup r
+        JOIN utility_expense_types uet ON uet.id = r.utility_type_id
+        WHERE r.branch_id = ? AND r.year BETWEEN ? AND ?
+    """, (branch_id, start // 12, end // 12))
+    current, history = {}, {}
+    for type_id, name, row_year, row_month, expense, bills in cursor.fetchall():
+        index = _month_index(row_year, row_month)
+        if not bills or not start <= index <= end:
+            continue
+        if index == end:
+            current[type_id] = (name, float(expense))
+        else:
+            history.setdefault(type_id, []).append(float(expense))
+    return current, history
+
+
+def enqueue(cursor, event_type, branch_id, year, month, utility_bill_id=None):
+    """Record a change event in the caller's transaction; returns the outbox id."""
+    cursor.execute("""
+        INSERT INTO alert_outbox (event_type, branch_id, year, month, utility_bill_id)
+        OUTPUT INSERTED.id
+        VALUES (?, ?, ?, ?, ?)
+    """, (event_type, branch_id, int(year), int(month), utility_bill_id))
+    return cursor.fetchone()[0]
+
+
+def notify(*outbox_ids):
+    # Call after the enqueueing transaction has committed
+    if workers <= 0:
+        for outbox_id in outbox_ids:
+            process(outbox_id)
+        return
+    _ensure_started()
+    for outbox_id in outbox_ids:
+        _queue.put(outbox_id)
+
+
+def _now():
+    return datetime.now().replace(microsecond=0)
+
+
+def _claim(cursor, outbox_id):
+    now = _now()
+    cursor.execute("""
+        UPDATE alert_outbox
+        SET claimed_at = ?, attempts = attempts + 1
+        WHERE id = ? AND processed_at IS NULL AND attempts < ?
+            AND (claimed_at IS NULL OR claimed_at < ?)
+    """, (now, outbox_id, MAX_ATTEMPTS, now - timedelta(seconds=CLAIM_TIMEOUT)))
+    return cursor.rowcount == 1
+
+
+def _evaluate_event(cursor, outbox_id):
+    cursor.execute("""
+        SELECT o.branch_id, o.year, o.month, o.utility_bill_id,
+               b.business_id, b.budget_alert_threshold,
+               r.budget_total, r.expense_total, r.bill_count
+        FROM alert_outbox o
+        JOIN branches b ON b.branch_id = o.branch_id
+        LEFT JOIN branch_month_rollup r
+            ON r.branch_id = o.branch_id AND r.year = o.year AND r.month = o.month
+        WHERE o.id = ?
+    """, (outbox_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None, []
+    (branch_id, year, month, bill_id, business_id,
+     threshold, total_budget, total_expenses, bill_count) = row
+
+    threshold = threshold if threshold is not None else 90
+    results = budget_rules(float(total_budget or 0), float(total_expenses or 0),
+                           bill_count or 0, threshold)
+    if spike_factor > 0:
+        results.update(spike_rules(*_type_totals(cursor, branch_id, year, month)))
+
+    cursor.execute("""
+        SELECT rule_key, fired FROM alert_rule_state
+        WHERE branch_id = ? AND year = ? AND month = ?
+    """, (branch_id, year, month))
+    fired = {rule_key: bool(state) for rule_key, state in cursor.fetchall()}
+
+    crossed = []
+    for rule_key, alert in results.items():
+        if alert and not fired.get(rule_key):
+            if _fire(cursor, branch_id, year, month, rule_key, rule_key in fired):
+                crossed.append((rule_key, alert))
+        elif not alert and fired.get(rule_key):
+            cursor.execute("""
+                UPDATE alert_rule_state SET fired = 0, updated_at = GETDATE()
+                WHERE branch_id = ? AND year = ? AND month = ? AND rule_key = ?
+            """, (branch_id, year, month, rule_key))
+
+    # A jump across several threshold tiers at once alerts for the highest only
+    tiers = [key for key, _ in crossed if key.startswith("threshold:")]
+    if len(tiers) > 1:
+        highest = max(tiers, key=lambda key: int(key.split(":")[1]))
+        crossed = [(key, alert) for key, alert in crossed
+                   if not key.startswith("threshold:") or key == highest]
+    if not crossed:
+        return business_id, []
+
+    if bill_id is None:
+        # Budget events and batch uploads point the alert at the period's latest bill
+        cursor.execute("""
+            SELECT MAX(id) FROM utility_bills
+            WHERE branch_id = ? AND year = ? AND month = ? AND status = 1
+        """, (branch_id, year, month))
+        bill_id = cursor.fetchone()[0]
+    rows = [(branch_id, bill_id, *alert) for _, alert in crossed]
+    cursor.executemany("""
+        INSERT INTO alerts (branch_id, utility_bill_id, alert_type, severity, message)
+        VALUES (?, ?, ?, ?, ?)
+    """, rows)
+    rollup.apply_delta(cursor, branch_id, year, month, alerts=len(crossed))
+    return business_id, rows
+
+
+def _fire(cursor, branch_id, year, month, rule_key, known):
+    # Flip the rule to fired; only one concurrent evaluation can win the flip
+    if known:
+        cursor.execute("""
+            UPDATE alert_rule_state SET fired = 1, updated_at = GETDATE()
+            WHERE branch_id = ? AND year = ? AND month = ? AND rule_key = ? AND fired = 0
+        """, (branch_id, year, month, rule_key))
+        return cursor.rowcount == 1
+    try:
+        cursor.execute("""
+            INSERT INTO alert_rule_state (branch_id, year, month, rule_key, fired)
+            VALUES (?, ?, ?, ?, 1)
+        """, (branch_id, year, month, rule_key))
+        return True
+    except IntegrityError:
+        return False
+
+
+def process(outbox_id):
+    """Evaluate one outbox event and return the alert types it raised.
+
+    Safe to call more than once for the same id.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if not _claim(cursor, outbox_id):
+            conn.commit()
+            return []
+        conn.commit()
+
+        try:
+            business_id, alerts = _evaluate_event(cursor, outbox_id)
+            cursor.execute(
+                "UPDATE alert_outbox SET processed_at = ?, last_error = NULL WHERE id = ?",
+                (_now(), outbox_id))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log.exception("Alert evaluation failed for outbox row %s", outbox_id)
+            cursor.execute("UPDATE alert_outbox SET last_error = ? WHERE id = ?",
+                           (str(e)[:500], outbox_id))
+            conn.commit()
+            return []
+    finally:
+        cursor.close()
+        conn.close()
+
+    alert_types = [alert[2] for alert in alerts]
+    for alert_type in alert_types:
+        metrics.alert_created(alert_type)
+    if alerts:
+        cache.data_changed(business_id)
+        events.alerts_created(business_id, alerts)
+    return alert_types
+
+
+def pending(limit=500, grace=POLL_GRACE):
+    # Unprocessed rows that nobody is (still) working on
+    now = _now()
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT TOP {int(limit)} id FROM alert_outbox
+            WHERE processed_at IS NULL AND attempts < ?
+                AND created_at <= ?
+                AND (claimed_at IS NULL OR claimed_at < ?)
+            ORDER BY id
+        """, (MAX_ATTEMPTS, now - timedelta(seconds=grace),
+              now - timedelta(seconds=CLAIM_TIMEOUT)))
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _work():
+    while True:
+        outbox_id = _queue.get()
+        try:
+            process(outbox_id)
+        except Exception:
+            log.exception("Alert worker failed on outbox row %s", outbox_id)
+        finally:
+            _queue.task_done()
+
+
+def _poll():
+    grace = 0  # on startup, take over whatever a previous process left behind
+    while True:
+        try:
+            for outbox_id in pending(grace=grace):
+                _queue.put(outbox_id)
+        except Exception:
+            log.exception("Alert outbox poll failed")
+        grace = POLL_GRACE
+        time.sleep(poll_interval)
+
+
+def _ensure_started():
+    # Threads are started lazily (and again after a fork), so pre-forking
+    # servers get a worker pool in each child rather than only in the master
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        for number in range(workers):
+            threading.Thread(target=_work, name=f"alert-worker-{number}", daemon=True).start()
+        if poll_interval > 0:
+            threading.Thread(target=_poll, name="alert-outbox-poller", daemon=True).start()
+        _started_pid = os.getpid()
+
+
+def drain(timeout=10.0):
+    """Wait until queued events are processed (tests and benchmarks)."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not _queue.unfinished_tasks
+
+
+def init_app(app):
+    global workers, poll_interval, threshold_tiers, overrun_amount
+    global spike_factor, spike_months, spike_min_amount
+    workers = int(config.setting(app, "ALERT_WORKERS", 2))
+    poll_interval = float(config.setting(app, "ALERT_OUTBOX_POLL", 30))
+
+    tiers = config.setting(app, "ALERT_THRESHOLD_TIERS", "100")
+    if isinstance(tiers, str):
+        tiers = [tier for tier in tiers.replace(" ", "").split(",") if tier]
+    threshold_tiers = tuple(int(tier) for tier in tiers)
+    overrun_amount = float(config.setting(app, "ALERT_OVERRUN_AMOUNT", 0))
+    spike_factor = float(config.setting(app, "ALERT_SPIKE_FACTOR", 0))
+    spike_months = max(1, int(config.setting(app, "ALERT_SPIKE_MONTHS", 3)))
+    spike_min_amount = float(config.setting(app, "ALERT_SPIKE_MIN_AMOUNT", 0))
+    if workers > 0:
+        _ensure_started()
@@ -0,0 +1,229 @@
+import asyncio
+import contextvars
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# ASGI front for the Flask app, for running it under an async server
+# (uvicorn, hypercorn, ...) instead of a threaded WSGI server:
+#
+#     uvicorn asgi:app --workers 4
+#
+# The routes stay synchronous. What changes is where the waiting happens:
+#   - request bodies (bill uploads) are read on the event loop and spooled to
+#     a temporary file, so a slow client holds no thread while it uploads;
+#   - the Flask app, and with it every pyodbc call, runs on a bounded thread
+#     pool (ASGI_THREADS, by default DB_POOL_SIZE) so requests queue for a
+#     thread instead of queueing for a database connection while holding one;
+#     past ASGI_MAX_QUEUE waiting requests the adapter answers 503;
+#   - streamed bodies (exports) are pulled from the pool one chunk at a time,
+#     and bodies that can be iterated asynchronously (the alert event stream)
+#     are sent straight from the event loop, so an open stream costs no thread.
+
+SPOOL_SIZE = 1024 * 1024
+
+
+class AsgiAdapter:
+    def __init__(self, wsgi_app, threads=None, max_queue=None, max_body=None):
+        self.wsgi_app = wsgi_app
+        config = getattr(wsgi_app, "config", {})
+        self.threads = int(threads or config.get(
+            "ASGI_THREADS", os.getenv("ASGI_THREADS", os.getenv("DB_POOL_SIZE", 10))))
+        self.max_queue = int(max_queue if max_queue is not None else config.get(
+            "ASGI_MAX_QUEUE", os.getenv("ASGI_MAX_QUEUE", 100)))
+        self.max_body = max_body if max_body is not None else config.get("MAX_CONTENT_LENGTH")
+        self._executor = None
+        self._in_flight = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.threads, thread_name_prefix="asgi")
+        return self._executor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Unsupported ASGI scope type {scope['type']!r}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        if self._in_flight >= self.threads + self.max_queue:
+            await _plain_response(send, 503, b"Server busy, try again shortly.")
+            return
+
+        body = await self._read_body(scope, receive)
+        if body is None:
+            await _plain_response(send, 413, b"Request body too large.")
+            return
+
+        self._in_flight += 1
+        try:
+            await self._run(scope, body, receive, send)
+        finally:
+            self._in_flight -= 1
+            body.close()
+
+    async def _read_body(self, scope, receive):
+        declared = _header(scope, b"content-length")
+        if self.max_body and declared and declared.isdigit() and int(declared) > self.max_body:
+            return None
+        body = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        size = 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if self.max_body and size > self.max_body:
+                body.close()
+                return None
+            body.write(chunk)
+            if not message.get("more_body"):
+                break
+        body.seek(0)
+        return body
+
+    async def _run(self, scope, body, receive, send):
+        loop = asyncio.get_running_loop()
+        # One context per request, carried across the pool's threads, so
+        # Flask's request context survives a streamed body being pulled from
+        # different threads
+        context = contextvars.copy_context()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started.get("sent"):
+                raise exc_info[1].with_traceback(exc_info[2])
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1"))
+                                  for k, v in headers]
+
+        def call(fn, *args):
+            return loop.run_in_executor(self.executor, context.run, fn, *args)
+
+        environ = _environ(scope, body)
+        app_iter = await call(self.wsgi_app, environ, start_response)
+        try:
+            await send({"type": "http.response.start", "status": started["status"],
+                        "headers": started["headers"]})
+            started["sent"] = True
+            if hasattr(app_iter, "__aiter__"):
+                await _send_until_disconnect(_aiter_chunks(app_iter), receive, send)
+            elif any(key == b"content-length" for key, _ in started["headers"]):
+                # An ordinary, already rendered response: one hop for the whole body
+                for chunk in await call(list, app_iter):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                await _send_until_disconnect(_pooled_chunks(app_iter, call), receive, send)
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(app_iter, "close"):
+                await call(app_iter.close)
+
+
+async def _aiter_chunks(app_iter):
+    async for chunk in app_iter:
+        yield chunk
+
+
+async def _pooled_chunks(app_iter, call):
+    iterator = iter(app_iter)
+    done = object()
+    while True:
+        chunk = await call(next, iterator, done)
+        if chunk is done:
+            return
+        yield chunk
+
+
+async def _send_until_disconnect(chunks, receive, send):
+    # Stop producing (and release the stream's resources) once the client
+    # goes away, rather than writing into a closed connection until it ends
+    async def watch():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    watcher = asyncio.ensure_future(watch())
+    try:
+        async for chunk in chunks:
+            if watcher.done():
+                break
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+    finally:
+        watcher.cancel()
+        await chunks.aclose()
+
+
+async def _plain_response(send, status, body):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", ()):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    path = scope.get("root_path", "") + scope["path"]
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "REQUEST_URI": path,
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+        "asgi.scope": scope,
+    }
+    for key, value in scope.get("headers", ()):
+        name = key.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            environ["CONTENT_LENGTH"] = value
+        else:
+            name = "HTTP_" + name
+            environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def create_asgi_app(app=None):
+    if app is None:
+        from umd_app import create_app
+        app = create_app()
+    return AsgiAdapter(app)
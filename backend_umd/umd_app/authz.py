@@ -0,0 +1,137 @@
+import logging
+import os
+from functools import wraps
+
+from flask import g, jsonify, session
+
+from umd_app import cache
+from umd_app.db import get_connection
+
+# Authorization context: who the logged-in user is as far as access checks go
+# (role, business, the branches they may act on), resolved from the database
+# in one query and shared by everything that handles the request.
+#
+# Routes decorated with @authz.load_context read it from g.authz instead of
+# re-querying branches.handled_by / branches.business_id themselves. Each
+# process keeps resolved contexts for AUTHZ_CACHE_TTL seconds, keyed by the
+# business's "authz" data version (see cache.get_version, which works with or
+# without a CACHE_BACKEND); the branch and user routes call
+# invalidate(business_id) after changing handled_by, branch status or a
+# user's role, and every worker stops using the old contexts at once.
+
+log = logging.getLogger("umd_app.authz")
+
+AUTHZ = "authz"
+
+
+class AuthzContext:
+    def __init__(self, user_id, role_id, business_id, branches):
+        self.user_id = user_id
+        self.role_id = role_id
+        self.business_id = business_id
+        # branch_id -> active (branches.status = 1); every branch of the
+        # business for an admin, the branches they handle for a manager
+        self.branches = branches
+
+    @property
+    def is_admin(self):
+        return self.role_id == 1
+
+    @property
+    def is_manager(self):
+        return self.role_id == 2
+
+    @property
+    def branch_ids(self):
+        return sorted(self.branches)
+
+    @property
+    def active_branch_ids(self):
+        return sorted(b for b, active in self.branches.items() if active)
+
+    @property
+    def branch_id(self):
+        # The branch a manager works on (None for admins or unassigned managers)
+        if not self.is_manager or not self.branches:
+            return None
+        active = self.active_branch_ids
+        return active[0] if active else self.branch_ids[0]
+
+    def can_access(self, branch_id, active_only=False):
+        if branch_id not in self.branches:
+            return False
+        return self.branches[branch_id] or not active_only
+
+_contexts = cache.MemoryBackend()
+ttl = 30
+
+
+def init_app(app):
+    global _contexts, ttl
+    ttl = float(app.config.get("AUTHZ_CACHE_TTL", os.getenv("AUTHZ_CACHE_TTL", 30)))
+    _contexts = cache.MemoryBackend()
+
+
+def _query(user_id):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT u.role_id, u.business_id, b.branch_id, b.status
+            FROM users u
+            LEFT JOIN branches b
+                ON b.business_id = u.business_id
+                AND (u.role_id = 1 OR b.handled_by = u.user_id)
+            WHERE u.user_id = ?
+        """, (user_id,))
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if not rows:
+        return None
+    role_id, business_id = rows[0][0], rows[0][1]
+    branches = {row[2]: row[3] == 1 for row in rows if row[2] is not None}
+    return AuthzContext(user_id, role_id, business_id, branches)
+
+
+def resolve(identity):
+    """Return the AuthzContext for a session identity, or None if the user is gone."""
+    user_id = identity.get("user_id")
+    business_id = identity.get("business_id")
+    key = None
+    if business_id and ttl > 0:
+        try:
+            key = f"{business_id}:{cache.get_version(AUTHZ, business_id)}:{user_id}"
+            hit = _contexts.get(key)
+            if hit is not None:
+                return hit
+        except Exception as e:
+            log.warning("Authz cache lookup failed: %s", e)
+            key = None
+
+    context = _query(user_id)
+    if context is not None and key is not None:
+        _contexts.set(key, context, ttl)
+    return context
+
+
+def invalidate(business_id):
+    # Called after commits that change branches.handled_by, branch status or users
+    return cache.bump_version(AUTHZ, business_id)
+
+
+def load_context(view):
+    """Resolve the caller's AuthzContext once into g.authz before the view runs."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        identity = session.get('user')
+        if not identity or not identity.get("user_id"):
+            return jsonify({"error": "Session expired or unauthorized"}), 401
+        if g.get("authz") is None:
+            g.authz = resolve(identity)
+        if g.authz is None:
+            return jsonify({"error": "Session expired or unauthorized"}), 401
+        return view(*args, **kwargs)
+    return wrapper
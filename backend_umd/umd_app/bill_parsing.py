@@ -0,0 +1,235 @@
+import csv
+import importlib
+import itertools
+import re
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # optional: PDFs are only read through the OCR hook without it
+    PdfReader = None
+
+# Reading the amount, units used and billing period out of an attached bill.
+#
+# Pure functions with no app or database access: umd_app/extraction.py runs
+# parse_batch() in worker processes.
+#   .csv        a header row naming amount/units/period columns (summed over
+#               the rows), or "label,value" rows read like text
+#   .pdf        the text layer (needs pypdf), or the OCR hook for scans
+#   .jpg/.png   the OCR hook
+# The OCR hook is "module:function", a callable taking a file path and
+# returning the recognized text (e.g. a wrapper around a local tesseract).
+
+PDF_PAGES = 3
+MAX_CSV_ROWS = 10000
+
+# Most specific first: the first label found with a value wins
+AMOUNT_LABELS = ("total amount due", "amount due", "total due", "amount payable",
+                 "total payable", "balance due", "total charges", "current charges",
+                 "total amount", "net amount", "amount", "total", "charges", "cost")
+UNITS_LABELS = ("units consumed", "units used", "consumption", "usage", "units",
+                "kwh", "quantity", "volume")
+PERIOD_LABELS = ("billing period", "bill period", "service period", "billing month",
+                 "period", "statement date", "bill date", "billing date", "invoice date",
+                 "month", "date")
+
+_MONTHS = {name: number for number, names in enumerate(
+    (("jan", "january"), ("feb", "february"), ("mar", "march"), ("apr", "april"),
+     ("may",), ("jun", "june"), ("jul", "july"), ("aug", "august"),
+     ("sep", "sept", "september"), ("oct", "october"), ("nov", "november"),
+     ("dec", "december")), start=1) for name in names}
+
+_UNIT_WORDS = r"kwh|kw\s?h|units?|m3|m³|cubic\s+met(?:er|re)s?|therms?|ccf|gallons?|lit(?:er|re)s?|gb"
+_UNITS = re.compile(r"(\d[\d,]*(?:\.\d+)?)[ \t]*(?:" + _UNIT_WORDS + r")\b", re.I)
+_MONEY = re.compile(
+    r"(?P<currency>[$€£₹]|\b(?:rs\.?|usd|eur|gbp|inr|pkr)\s*)?"
+    r"(?P<number>-?\d{1,3}(?:,\d{3})+(?:\.\d{1,2})?|-?\d+\.\d{1,2}|-?\d+)\b", re.I)
+_NUMBER = re.compile(r"-?\d[\d,]*(?:\.\d+)?")
+_MONTH_YEAR = re.compile(r"\b(" + "|".join(sorted(_MONTHS, key=len, reverse=True)) +
+                         r")[a-z]*\.?[\s,'-]*(\d{4})\b", re.I)
+_ISO_DATE = re.compile(r"\b(\d{4})[-/.](\d{1,2})(?:[-/.](\d{1,2}))?\b")
+_DMY_DATE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](\d{4})\b")
+_ANY_DATE = re.compile(_ISO_DATE.pattern + "|" + _DMY_DATE.pattern + "|" + _MONTH_YEAR.pattern,
+                       re.I)
+
+
+def parse_number(text):
+    if text is None:
+        return None
+    match = _NUMBER.search(str(text).replace(" ", ""))
+    if not match:
+        return None
+    try:
+        return Decimal(match.group(0).replace(",", ""))
+    except InvalidOperation:
+        return None
+
+
+def parse_amount(text):
+    # Dates next to the amount ("due by 15/04/2024: $123.45") are not amounts
+    text = _ANY_DATE.sub(" ", str(text))
+    matches = list(_MONEY.finditer(text))
+    if not matches:
+        return None
+    # Prefer a figure with a currency or cents, else the last number
+    best = next((m for m in reversed(matches) if m.group("currency") or "." in m.group("number")),
+                matches[-1])
+    return Decimal(best.group("number").replace(",", ""))
+
+
+def parse_period(text):
+    """(year, month) of the last date in text, or None."""
+    text = str(text)
+    found = []
+    for match in _MONTH_YEAR.finditer(text):
+        found.append((match.start(), int(match.group(2)), _MONTHS[match.group(1).lower()]))
+    for match in _ISO_DATE.finditer(text):
+        found.append((match.start(), int(match.group(1)), int(match.group(2))))
+    for match in _DMY_DATE.finditer(text):
+        first, second = int(match.group(1)), int(match.group(2))
+        # Day first unless that cannot be right
+        month = first if second > 12 else second
+        found.append((match.start(), int(match.group(3)), month))
+    found = [(pos, year, month) for pos, year, month in found
+             if 1 <= month <= 12 and 1900 < year < 2200]
+    if not found:
+        return None
+    _, year, month = max(found)
+    return year, month
+
+
+def _labelled(lines, labels, parse):
+    # For each label in order, the first line carrying it with a value after
+    # it (or on the next line, as table layouts put it)
+    for label in labels:
+        for number, line in enumerate(lines):
+            index = line.find(label)
+            if index < 0:
+                continue
+            value = parse(line[index + len(label):])
+            if value is None and number + 1 < len(lines):
+                value = parse(lines[number + 1])
+            if value is not None:
+                return value
+    return None
+
+
+def from_text(text):
+    lines = [" ".join(line.split()).lower() for line in str(text).splitlines()]
+    lines = [line for line in lines if line]
+    suggestion = {"amount": _labelled(lines, AMOUNT_LABELS, parse_amount)}
+
+    # "Units consumed: 1,234", else "1,234 kWh", else a looser label
+    units = _labelled(lines, UNITS_LABELS[:2], parse_number)
+    if units is None:
+        match = _UNITS.search("\n".join(lines))
+        units = Decimal(match.group(1).replace(",", "")) if match else None
+    if units is None:
+        units = _labelled(lines, UNITS_LABELS[2:], parse_number)
+    suggestion["units_used"] = units
+
+    period = _labelled(lines, PERIOD_LABELS, parse_period)
+    if period is None:
+        period = parse_period("\n".join(lines[:20]))
+    suggestion["year"], suggestion["month"] = period or (None, None)
+    return suggestion
+
+
+def _column(header, labels, skip=()):
+    for label in labels:
+        for index, name in enumerate(header):
+            if label in name and not any(word in name for word in skip):
+                return index
+    return None
+
+
+def from_csv(path):
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as f:
+        rows = [row for row in itertools.islice(csv.reader(f), MAX_CSV_ROWS)
+                if any(cell.strip() for cell in row)]
+    if not rows:
+        return {"amount": None, "units_used": None, "year": None, "month": None}
+
+    header = [cell.strip().lower() for cell in rows[0]]
+    amount_col = _column(header, AMOUNT_LABELS)
+    units_col = _column(header, UNITS_LABELS)
+    if len(rows) < 2 or (amount_col is None and units_col is None):
+        # "label,value" rows, e.g. a bill summary exported from a portal
+        return from_text("\n".join(": ".join(row) for row in rows))
+
+    data = rows[1:]
+
+    def total(column):
+        if column is None:
+            return None
+        values = [parse_number(row[column]) for row in data if column < len(row)]
+        values = [value for value in values if value is not None]
+        return sum(values) if values else None
+
+    year_col = _column(header, ("year",))
+    month_col = _column(header, ("month",), skip=("year",))
+    periods = Counter()
+    for row in data:
+        period = None
+        if year_col is not None and month_col is not None and max(year_col, month_col) < len(row):
+            year, month = parse_number(row[year_col]), row[month_col].strip().lower()
+            month = _MONTHS.get(month[:3]) or parse_number(month)
+            if year and month:
+                period = int(year), int(month)
+        if period is None:
+            period = parse_period(" ".join(cell for i, cell in enumerate(row)
+                                           if i not in (amount_col, units_col)))
+        if period:
+            periods[period] += 1
+    year, month = periods.most_common(1)[0][0] if periods else (None, None)
+    return {"amount": total(amount_col), "units_used": total(units_col),
+            "year": year, "month": month}
+
+
+def pdf_text(path):
+    if PdfReader is None:
+        return ""
+    reader = PdfReader(path)
+    return "\n".join(page.extract_text() or "" for page in reader.pages[:PDF_PAGES])
+
+
+_ocr_functions = {}
+
+
+def run_ocr(hook, path):
+    function = _ocr_functions.get(hook)
+    if function is None:
+        module, _, name = hook.partition(":")
+        function = getattr(importlib.import_module(module), name or "ocr")
+        _ocr_functions[hook] = function
+    return function(path) or ""
+
+
+def parse_file(path, ext, ocr=None):
+    """(method, suggestion dict) for one file, or (None, None) when there is
+    nothing it can be read with."""
+    ext = ext.lower()
+    if ext == "csv":
+        return "csv", from_csv(path)
+    if ext == "pdf":
+        text = pdf_text(path)
+        if text.strip():
+            return "pdf_text", from_text(text)
+    if ext in ("pdf", "jpg", "jpeg", "png") and ocr:
+        return "ocr", from_text(run_ocr(ocr, path))
+    return None, None
+
+
+def parse_batch(jobs, ocr=None):
+    """Parse [(job id, path, ext)] in one go; returns [(job id, method,
+    suggestion, error)]. One worker call per batch keeps the per-file
+    overhead down when a month's bills arrive together."""
+    results = []
+    for job_id, path, ext in jobs:
+        try:
+            method, suggestion = parse_file(path, ext, ocr)
+            results.append((job_id, method, suggestion, None))
+        except Exception as e:
+            results.append((job_id, None, None, f"{type(e).__name__}: {e}"))
+    return results
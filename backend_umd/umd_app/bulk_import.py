@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+from decimal import Decimal, InvalidOperation
+
+# Parsing and per-row validation for /api/utility/utility-bills/bulk. A batch
+# is a CSV or JSON file (multipart field "bills_file") or a JSON body, either
+# a list of bills or {"bills": [...]}. Each bill has utility_type_id (or
+# utility_name), year, month, amount, optional units_used, and branch_id
+# unless the uploader is a branch manager.
+
+MAX_ROWS = 5000
+
+
+class BatchError(ValueError):
+    # The batch as a whole could not be read
+    pass
+
+
+def _rows_from_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    try:
+        return list(csv.DictReader(text))
+    except (UnicodeDecodeError, csv.Error):
+        raise BatchError("bills_file must be UTF-8 CSV")
+    finally:
+        text.detach()
+
+
+def read_batch(req):
+    file = req.files.get('bills_file')
+    if file:
+        extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+        if extension == 'csv':
+            rows = _rows_from_csv(file.stream)
+        elif extension == 'json':
+            try:
+                rows = json.load(file.stream)
+            except ValueError:
+                raise BatchError("bills_file is not valid JSON")
+        else:
+            raise BatchError("bills_file must be a .csv or .json file")
+    else:
+        rows = req.get_json(silent=True)
+
+    if isinstance(rows, dict):
+        rows = rows.get('bills')
+    if not isinstance(rows, list) or not rows:
+        raise BatchError("No bills found in the request")
+    if len(rows) > MAX_ROWS:
+        raise BatchError(f"A batch can hold at most {MAX_ROWS} bills")
+    return rows
+
+
+def _int(raw, field):
+    value = raw.get(field)
+    if value in (None, ''):
+        return None
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{field} must be a whole number")
+
+
+def clean_row(raw, default_branch_id, utility_types):
+    """Validate one batch row.
+
+    utility_types maps both type ids and lower-cased type names to the id.
+    Returns (branch_id, utility_type_id, year, month, units_used, amount) or
+    raises ValueError with a message for the client.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("Row must be an object with bill fields")
+
+    branch_id = default_branch_id or _int(raw, 'branch_id')
+    if not branch_id:
+        raise ValueError("branch_id is required")
+
+    utility_type_id = _int(raw, 'utility_type_id')
+    if utility_type_id is None and raw.get('utility_name'):
+        utility_type_id = utility_types.get(str(raw['utility_name']).strip().lower())
+        if utility_type_id is None:
+            raise ValueError(f"Unknown utility type '{raw['utility_name']}'")
+    if utility_type_id is None:
+        raise ValueError("utility_type_id or utility_name is required")
+    if utility_type_id not in utility_types:
+        raise ValueError(f"Unknown utility_type_id {utility_type_id}")
+
+    year = _int(raw, 'year')
+    month = _int(raw, 'month')
+    if not year or not month:
+        raise ValueError("year and month are required")
+    if not 1 <= month <= 12:
+        raise ValueError("month must be between 1 and 12")
+
+    try:
+        amount = Decimal(str(raw.get('amount')).strip())
+        units_used = raw.get('units_used')
+        units_used = Decimal(str(units_used).strip()) if units_used not in (None, '') else None
+    except InvalidOperation:
+        raise ValueError("amount and units_used must be numbers")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("amount must be greater than zero")
+
+    if units_used is not None and (not units_used.is_finite() or units_used < 0):
+        raise ValueError("units_used must not be negative")
+    return branch_id, utility_type_id, year, month, units_used, amount
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+from flask import current_app, request, session
+
+from umd_app.db import IntegrityError, pooled_connection
+
+# Response cache for the dashboard and report endpoints.
+#
+# Cached bodies are keyed by (endpoint, business_id, role scope, arguments)
+# plus the business's current data version. Routes that write bills, budgets,
+# branches or alerts call data_changed(business_id) after committing, which
+# moves the version on; entries cached under the old version are never read
+# again and age out through the TTL / LRU bound.
+#
+# CACHE_BACKEND picks where entries and versions live:
+#   none    caching off (default)
+#   memory  per-process LRU - fine for a single worker
+#   redis   a Redis-compatible server (Redis, Valkey, KeyDB, ...) shared by
+#           every worker; configure maxmemory-policy allkeys-lru to bound it
+#
+# The same versions drive conditional_get(), which answers repeat GETs with
+# 304 Not Modified before the view (and its SQL) runs. With CACHE_BACKEND=none
+# the versions live in the data_versions table instead, so every worker still
+# agrees on them and ETags keep working without a cache server.
+
+log = logging.getLogger("umd_app.cache")
+
+DATA = "data"
+
+
+class MemoryBackend:
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        # Versions are kept apart from the LRU: evicting one would let an old
+        # version (and whatever was cached under it) come back
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_version(self, key):
+        with self._lock:
+            return self._versions.setdefault(key, time.time_ns())
+
+    def bump_version(self, key):
+        with self._lock:
+            version = max(time.time_ns(), self._versions.get(key, 0) + 1)
+            self._versions[key] = version
+            return version
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+
+class RedisBackend:
+    def __init__(self, url=None, client=None, prefix="umd:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self._client = client
+        self._prefix = prefix
+
+    def get(self, key):
+        raw = self._client.get(self._prefix + key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl):
+        self._client.set(self._prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, key):
+        self._client.delete(self._prefix + key)
+
+    def get_version(self, key):
+        # Versions are clock-based tokens rather than counters starting at 0,
+        # so a version key lost to eviction never reuses an old value
+        key = self._prefix + "version:" + key
+        version = self._client.get(key)
+        if version is None:
+            self._client.set(key, time.time_ns(), nx=True)
+            version = self._client.get(key)
+        return int(version)
+
+    def bump_version(self, key):
+        version = time.time_ns()
+        self._client.set(self._prefix + "version:" + key, version)
+        return version
+
+    def clear(self):
+        for key in self._client.scan_iter(self._prefix + "*"):
+            self._client.delete(key)
+
+
+class DatabaseVersions:
+    """Data versions in the data_versions table, used when caching is off."""
+
+    def get_version(self, key):
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT version FROM data_versions WHERE version_key = ?", (key,))
+            row = cursor.fetchone()
+            cursor.close()
+        return int(row[0]) if row else 0
+
+    def bump_version(self, key):
+        # Clock-based like the other backends; a missing row reads as 0
+        version = time.time_ns()
+        update_sql = "UPDATE data_versions SET version = ? WHERE version_key = ?"
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(update_sql, (version, key))
+            if not cursor.rowcount:
+                try:
+                    cursor.execute("INSERT INTO data_versions (version, version_key) VALUES (?, ?)",
+                                   (version, key))
+                except IntegrityError:
+                    # Another request created the row between our UPDATE and INSERT
+                    cursor.execute(update_sql, (version, key))
+            conn.commit()
+            cursor.close()
+        return version
+
+
+_backend = None
+_database_versions = DatabaseVersions()
+default_ttl = 60
+
+
+def init_app(app):
+    global _backend, default_ttl
+    kind = app.config.get("CACHE_BACKEND", os.getenv("CACHE_BACKEND", "none")).lower()
+    default_ttl = float(app.config.get("CACHE_TTL", os.getenv("CACHE_TTL", 60)))
+    if kind == "memory":
+        _backend = MemoryBackend(int(app.config.get(
+            "CACHE_MAX_ENTRIES", os.getenv("CACHE_MAX_ENTRIES", 2048))))
+    elif kind == "redis":
+        _backend = RedisBackend(app.config.get("CACHE_REDIS_URL", os.getenv("CACHE_REDIS_URL")))
+    elif kind == "none":
+        _backend = None
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND '{kind}' (expected none, memory or redis)")
+
+
+def get_backend():
+    return _backend
+
+
+def _version_key(namespace, business_id):
+    return f"{namespace}:{business_id}"
+
+
+def _versions():
+    return _backend if _backend is not None else _database_versions
+
+
+def get_version(namespace, business_id):
+    return _versions().get_version(_version_key(namespace, business_id))
+
+
+def bump_version(namespace, business_id):
+    if not business_id:
+        return None
+    try:
+        return _versions().bump_version(_version_key(namespace, business_id))
+    except Exception as e:
+        # The write itself already committed; a stale cache is bounded by the TTL
+        log.warning("Cache invalidation failed: %s", e)
+        return None
+
+
+def data_changed(business_id):
+    # Called by the write routes after commit
+    return bump_version(DATA, business_id)
+
+
+def role_scope(identity):
+    # Admins share one view of the business; a manager only sees their branch
+    if identity.get("role_id") == 1:
+        return "admin"
+    return f"{identity.get('role_id')}:{identity.get('user_id')}:{identity.get('branch_id')}"
+
+
+def _request_fingerprint(view_args):
+    parts = [
+        request.method,
+        json.dumps(view_args, sort_keys=True, default=str),
+        json.dumps(sorted(request.args.items(multi=True))),
+        request.get_data(cache=True).decode('utf-8', 'replace'),
+    ]
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def cached_response(ttl=None):
+    """Cache successful JSON responses of a view per business and role scope."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            identity = session.get('user')
+            if _backend is None or not identity or not identity.get("business_id"):
+                return view(*args, **kwargs)
+
+            business_id = identity["business_id"]
+            try:
+                # Read the version before running the view, so a write that
+                # lands meanwhile leaves this result under the old version
+                version = get_version(DATA, business_id)
+                key = (f"response:{request.endpoint}:{business_id}:{version}:"
+                       f"{role_scope(identity)}:{_request_fingerprint(kwargs)}")
+                hit = _backend.get(key)
+            except Exception as e:
+                log.warning("Cache lookup failed: %s", e)
+                return view(*args, **kwargs)
+
+            if hit is not None:
+                response = current_app.response_class(hit["body"], status=hit["status"],
+                                                      content_type=hit["content_type"])
+                response.headers["X-Cache"] = "HIT"
+                return response
+
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                try:
+                    _backend.set(key, {
+                        "status": response.status_code,
+                        "content_type": response.content_type,
+                        "body": response.get_data(as_text=True),
+                    }, ttl or default_ttl)
+                except Exception as e:
+                    log.warning("Cache store failed: %s", e)
+            response.headers["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_get(view):
+    """ETag / If-None-Match support for GET views over business data.
+
+    The ETag is derived from the business's data version (plus endpoint,
+    role scope, arguments and today's date, for the views that depend on
+    it), so it can be checked without running the view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        identity = session.get('user')
+        if request.method != 'GET' or not identity or not identity.get("business_id"):
+            return view(*args, **kwargs)
+
+        try:
+            version = get_version(DATA, identity["business_id"])
+        except Exception as e:
+            log.warning("Cache lookup failed: %s", e)
+            return view(*args, **kwargs)
+        tag = hashlib.sha256(
+            f"{request.endpoint}:{identity['business_id']}:{version}:{role_scope(identity)}:"
+            f"{date.today()}:{_request_fingerprint(kwargs)}".encode()).hexdigest()[:32]
+
+        if tag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(tag)
+        # Let browsers keep the body but revalidate it on every use
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    return wrapper
@@ -0,0 +1,14 @@
+import os
+
+# Settings shared by the init_app() hooks: app.config wins over the
+# environment, so tests and embedding code can set either.
+
+TRUE_VALUES = ("1", "true", "yes", "on")
+
+
+def setting(app, name, default=None):
+    return app.config.get(name, os.getenv(name, default))
+
+
+def flag(app, name, default="0"):
+    return str(setting(app, name, default)).strip().lower() in TRUE_VALUES
@@ -1,22 +1,338 @@
 import os
-import pyodbc
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from umd_app import instrumentation
+from umd_app.db_backends import backend_from_env
 
 load_dotenv()
 
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+def _integrity_errors():
+    errors = [sqlite3.IntegrityError]
+    try:
+        import pyodbc
+        errors.append(pyodbc.IntegrityError)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+
+# Usable in `except IntegrityError:` whichever backend is active
+IntegrityError = _integrity_errors()
+
+
+class _PoolEntry:
+    __slots__ = ("raw", "created_at", "last_used")
+
+    def __init__(self, raw):
+        now = time.monotonic()
+        self.raw = raw
+        self.created_at = now
+        self.last_used = now
+
+
+class PooledConnection:
+    # Proxy handed out by the pool. Routes keep calling conn.close() in their
+    # finally blocks; for a pooled connection that hands it back instead.
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._entry.raw, name)
+
+    def cursor(self):
+        return instrumentation.wrap_cursor(self._entry.raw.cursor())
+
+    def commit(self):
+        self._entry.raw.commit()
+
+    def rollback(self):
+        self._entry.raw.rollback()
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool.release(self._entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ConnectionPool:
+    # Bounded, thread-safe pool. `connect` opens a raw DB-API connection and
+    # `ping` checks one before it is reused, so any driver (pyodbc, sqlite3)
+    # can sit behind it.
+
+    def __init__(self, connect, ping, max_size=10, timeout=10.0, max_idle=300.0,
+                 max_lifetime=1800.0, ping_after=5.0):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self._ping = ping
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.ping_after = ping_after
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._size = 0        # idle + checked out + being opened
+        self._in_use = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._closed = False
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            entry, to_close = self._checkout(deadline)
+            self._close_all(to_close)
+
+            if entry is None:
+                try:
+                    raw = self._connect()
+                except Exception:
+                    self._forget()
+                    raise
+                with self._cond:
+                    self._created += 1
+                return PooledConnection(self, _PoolEntry(raw))
+
+            if time.monotonic() - entry.last_used >= self.ping_after:
+                try:
+                    self._ping(entry.raw)
+                except Exception:
+                    # Stale connection (server restart, network blip) - drop it and retry
+                    self._forget()
+                    self._close_all([entry])
+                    continue
+            return PooledConnection(self, entry)
+
+    def _checkout(self, deadline):
+        # Returns (entry, to_close). entry is None when the caller should open
+        # a new connection; its slot has already been reserved.
+        started = None
+        with self._cond:
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("Connection pool is closed")
+                    to_close = self._evict_locked(time.monotonic())
+                    if self._idle:
+                        self._in_use += 1
+                        return self._idle.pop(), to_close
+                    if self._size < self.max_size:
+                        self._size += 1
+                        self._in_use += 1
+                        return None, to_close
+
+                    if started is None:
+                        started = time.monotonic()
+                        self._waits += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.timeout:.1f}s waiting for a database "
+                            f"connection ({self._in_use}/{self.max_size} in use)")
+                    self._cond.wait(remaining)
+            finally:
+                if started is not None:
+                    self._wait_time += time.monotonic() - started
+
+    def _evict_locked(self, now):
+        to_close = []
+        kept = deque()
+        for entry in self._idle:
+            if (now - entry.last_used > self.max_idle
+                    or now - entry.created_at > self.max_lifetime):
+                to_close.append(entry)
+            else:
+                kept.append(entry)
+        if to_close:
+            self._idle = kept
+            self._size -= len(to_close)
+            self._discarded += len(to_close)
+        return to_close
+
+    def _forget(self):
+        with self._cond:
+            self._size -= 1
+            self._in_use -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def release(self, entry):
+        # Anything the route left uncommitted (early returns, errors) is rolled
+        # back so the next borrower starts from a clean transaction.
+        try:
+            entry.raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        now = time.monotonic()
+        with self._cond:
+            self._in_use -= 1
+            if healthy and not self._closed and now - entry.created_at <= self.max_lifetime:
+                entry.last_used = now
+                self._idle.append(entry)
+                entry = None
+            else:
+                self._size -= 1
+                self._discarded += 1
+            self._cond.notify()
+        if entry is not None:
+            self._close_all([entry])
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            to_close = list(self._idle)
+            self._idle.clear()
+            self._size -= len(to_close)
+            self._cond.notify_all()
+        self._close_all(to_close)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "size": self._size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "waits": self._waits,
+                "wait_time": round(self._wait_time, 6),
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+            }
+
+    @staticmethod
+    def _close_all(entries):
+        for entry in entries:
+            try:
+                entry.raw.close()
+            except Exception:
+                pass
+
+
+_backend = None
+_pool = None
+_pool_pid = None
+# Reentrant: get_pool() builds the pool under it and that calls get_backend()
+_pool_lock = threading.RLock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _pool_lock:
+            if _backend is None:
+                _backend = backend_from_env()
+    return _backend
+
+
+def _pool_from_env():
+    backend = get_backend()
+    return ConnectionPool(
+        backend.connect,
+        backend.ping,
+        max_size=int(os.getenv('DB_POOL_SIZE', 10)),
+        timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        max_idle=float(os.getenv('DB_POOL_MAX_IDLE', 300)),
+        max_lifetime=float(os.getenv('DB_POOL_MAX_LIFETIME', 1800)),
+        ping_after=float(os.getenv('DB_POOL_PING_AFTER', 5)),
+    )
+
+
+def get_pool():
+    global _pool, _pool_pid
+    # Connections must not be shared across a fork (pre-forking WSGI servers),
+    # so each worker process builds its own pool on first use.
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = _pool_from_env()
+                _pool_pid = pid
+    return _pool
+
+
+def reset_pool():
+    # Drops the current pool (and re-reads DB_BACKEND) - used by the bootstrap
+    # and benchmark scripts when they point the app at a different database.
+    global _backend, _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.close()
+        _backend = None
+        _pool = None
+        _pool_pid = None
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+# Called as hook(seconds_waited, timed_out) after every checkout attempt
+_acquire_hooks = []
+
+
+def add_acquire_hook(hook):
+    if hook not in _acquire_hooks:
+        _acquire_hooks.append(hook)
+
+
+def _notify_acquire(started, timed_out):
+    if _acquire_hooks:
+        waited = time.perf_counter() - started
+        for hook in _acquire_hooks:
+            hook(waited, timed_out)
+
+
 def get_connection():
+    started = time.perf_counter()
     try:
-        conn = pyodbc.connect(
-            f"DRIVER={os.getenv('DB_DRIVER')};"
-            f"SERVER={os.getenv('DB_SERVER')};"
-            f"DATABASE={os.getenv('DB_DATABASE')};"
-            "Trusted_Connection=yes;"
-        )
-        print("Database connected")
-        return conn
+        conn = get_pool().acquire()
+    except PoolTimeoutError:
+        _notify_acquire(started, True)
+        raise
     except Exception as e:
         print("Database connection failed:", e)
-        return None
+        raise
+    _notify_acquire(started, False)
+    return conn
+
+
+@contextmanager
+def pooled_connection():
+    conn = get_connection()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
 
 if __name__ == "__main__":
-    get_connection()
+    with pooled_connection() as conn:
+        print("Database connected")
+    print(pool_stats())
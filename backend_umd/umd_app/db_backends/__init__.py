@@ -0,0 +1,17 @@
+import os
+
+from umd_app.db_backends.sqlite import SQLiteBackend
+from umd_app.db_backends.sqlserver import SQLServerBackend
+
+BACKENDS = {
+    "sqlserver": SQLServerBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+def backend_from_env():
+    name = os.getenv('DB_BACKEND', 'sqlserver').strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(
+            f"Unknown DB_BACKEND '{name}'. Expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,174 @@
+import os
+import re
+import sqlite3
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache
+
+# The routes are written in SQL Server dialect. This backend rewrites the few
+# T-SQL constructs they use into SQLite equivalents so the same statements can
+# run against a local database file for load and regression testing.
+
+_ISNULL = re.compile(r"\bISNULL\s*\(", re.I)
+_OFFSET_FETCH = re.compile(
+    r"\bOFFSET\s+(\?|\d+)\s+ROWS?\s+FETCH\s+(?:NEXT|FIRST)\s+(\?|\d+)\s+ROWS?\s+ONLY\b", re.I)
+_OUTPUT_INSERTED = re.compile(
+    r"\bOUTPUT\s+INSERTED\.(\w+)\s*(VALUES\s*\((?:[^()]|\([^()]*\))*\))", re.I | re.S)
+_CAST_DATE = re.compile(r"\bCAST\s*\(\s*([^()]+?)\s+AS\s+DATE\s*\)", re.I)
+_CAST_DATETIME = re.compile(r"\bCAST\s*\(\s*([^()]+?)\s+AS\s+DATETIME\s*\)", re.I)
+_SELECT_TOP = re.compile(r"\bSELECT\s+TOP\s*\(?\s*(\d+)\s*\)?", re.I)
+
+
+def _paren_depth(sql, pos):
+    return sql.count("(", 0, pos) - sql.count(")", 0, pos)
+
+
+def _rewrite_top(sql):
+    matches = list(_SELECT_TOP.finditer(sql))
+    if not matches:
+        return sql
+    m = matches[0]
+    if len(matches) > 1 or _paren_depth(sql, m.start()) != 0:
+        raise sqlite3.NotSupportedError("Only a single outer SELECT TOP is supported on SQLite")
+    body = sql[:m.start()] + "SELECT " + sql[m.end():]
+    body = body.rstrip().rstrip(";")
+    return f"{body}\nLIMIT {m.group(1)}"
+
+
+@lru_cache(maxsize=1024)
+def translate(sql):
+    sql = _ISNULL.sub("IFNULL(", sql)
+    sql = _CAST_DATE.sub(r"DATE(\1)", sql)
+    # DATETIME has numeric affinity in SQLite; timestamps are already ISO text
+    sql = _CAST_DATETIME.sub(r"\1", sql)
+    # SQLite's "LIMIT offset, count" keeps the parameters in the same order
+    sql = _OFFSET_FETCH.sub(r"LIMIT \1, \2", sql)
+    sql = _OUTPUT_INSERTED.sub(r"\2 RETURNING \1", sql)
+    return _rewrite_top(sql)
+
+
+def _getdate():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _date_part(start, end):
+    def part(value):
+        if value is None:
+            return None
+        return int(str(value)[start:end])
+    return part
+
+
+def _adapt_datetime(value):
+    return value.isoformat(" ")
+
+
+sqlite3.register_adapter(datetime, _adapt_datetime)
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+
+def _value(value):
+    # Decimals go in as their exact text, which the DECIMAL columns' numeric
+    # affinity stores as a number. Converted here rather than through
+    # sqlite3.register_adapter, which would change every sqlite3 user in the
+    # process.
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def _params(params):
+    # pyodbc accepts both execute(sql, (a, b)) and execute(sql, a, b)
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        params = params[0]
+    return tuple(_value(value) for value in params)
+
+
+class SQLiteCursor:
+    def __init__(self, raw):
+        self._raw = raw
+        self.fast_executemany = False  # pyodbc-only knob, accepted and ignored
+
+    def execute(self, sql, *params):
+        self._raw.execute(translate(sql), _params(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._raw.executemany(translate(sql), [_params((p,)) for p in seq_of_params])
+        return self
+
+    def fetchone(self):
+        return self._raw.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._raw.fetchmany(size or self._raw.arraysize)
+
+    def fetchall(self):
+        return self._raw.fetchall()
+
+    def close(self):
+        self._raw.close()
+
+    @property
+    def description(self):
+        return self._raw.description
+
+    @property
+    def rowcount(self):
+        return self._raw.rowcount
+
+    def __iter__(self):
+        return iter(self._raw)
+
+
+class SQLiteConnection:
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self):
+        return SQLiteCursor(self._raw.cursor())
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        self._raw.close()
+
+    def executescript(self, script):
+        self._raw.executescript(script)
+
+
+class SQLiteBackend:
+    name = "sqlite"
+    schema_file = "sqlite.sql"
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('DB_SQLITE_PATH', 'umd_local.db')
+
+    def connect(self):
+        raw = sqlite3.connect(
+            self.path,
+            timeout=30,
+            check_same_thread=False,  # connections move between pool users
+            uri=self.path.startswith("file:"),
+        )
+        raw.execute("PRAGMA journal_mode=WAL")
+        raw.execute("PRAGMA synchronous=NORMAL")
+        raw.create_function("GETDATE", 0, _getdate)
+        raw.create_function("YEAR", 1, _date_part(0, 4), deterministic=True)
+        raw.create_function("MONTH", 1, _date_part(5, 7), deterministic=True)
+        raw.create_function("DAY", 1, _date_part(8, 10), deterministic=True)
+        return SQLiteConnection(raw)
+
+    def ping(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        finally:
+            cursor.close()
+
+    def run_script(self, conn, script):
+        conn.executescript(script)
+        conn.commit()
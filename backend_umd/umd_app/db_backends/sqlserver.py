@@ -0,0 +1,40 @@
+import os
+import re
+
+
+class SQLServerBackend:
+    name = "sqlserver"
+    schema_file = "sqlserver.sql"
+
+    def __init__(self):
+        # pyodbc is only needed when this backend is selected, so SQLite-only
+        # boxes (CI, load-test machines) don't need the ODBC stack installed
+        import pyodbc
+        self._pyodbc = pyodbc
+
+    def connect(self):
+        return self._pyodbc.connect(
+            f"DRIVER={os.getenv('DB_DRIVER')};"
+            f"SERVER={os.getenv('DB_SERVER')};"
+            f"DATABASE={os.getenv('DB_DATABASE')};"
+            "Trusted_Connection=yes;"
+        )
+
+    def ping(self, conn):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        finally:
+            cursor.close()
+
+    def run_script(self, conn, script):
+        # T-SQL scripts are split into batches on GO lines, like sqlcmd does
+        cursor = conn.cursor()
+        try:
+            for batch in re.split(r"^\s*GO\s*$", script, flags=re.M | re.I):
+                if batch.strip():
+                    cursor.execute(batch)
+            conn.commit()
+        finally:
+            cursor.close()
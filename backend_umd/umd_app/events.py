@@ -0,0 +1,369 @@
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import Response
+
+from umd_app.db import get_connection
+
+# Push channel for alert changes, consumed by /api/alert/stream (Server-Sent
+# Events) and its long-poll fallback /api/alert/poll.
+#
+# Code that creates alerts or changes the unread count calls one of the
+# publish helpers after committing. Events are per business:
+#   alerts        new alerts ({"alerts": [...]}, each with its branch_id)
+#   unread_count  the business's current unread count ({"unread_count": n})
+# and carry an increasing id, so a client reconnecting with Last-Event-ID
+# (or ?since= when long-polling) gets what it missed from a short
+# per-business buffer.
+#
+# EVENTS_BACKEND picks how events reach the other worker processes:
+#   memory  delivered within this process only (default; single worker)
+#   redis   published on a Redis-compatible server; every process relays
+#           them to its own subscribers
+
+log = logging.getLogger("umd_app.events")
+
+BUFFER_SIZE = 100
+SUBSCRIBER_QUEUE = 100
+
+_subscribers = {}  # business_id -> set of queue.Queue
+_buffers = {}      # business_id -> deque of recent events
+_lock = threading.Lock()
+_last_id = 0
+
+_backend = None
+heartbeat = 15.0
+stream_max = 300.0
+
+
+def _next_id():
+    # Microseconds since the epoch, forced to increase within the process
+    global _last_id
+    with _lock:
+        _last_id = max(_last_id + 1, int(time.time() * 1_000_000))
+        return _last_id
+
+
+def _dispatch(event):
+    business_id = event["business_id"]
+    with _lock:
+        buffer = _buffers.get(business_id)
+        if buffer is None:
+            buffer = _buffers[business_id] = deque(maxlen=BUFFER_SIZE)
+        buffer.append(event)
+        targets = list(_subscribers.get(business_id, ()))
+    for target in targets:
+        try:
+            target.put_nowait(event)
+        except queue.Full:
+            pass  # a stalled client; it catches up from the buffer on reconnect
+
+
+class MemoryBackend:
+    def publish(self, event):
+        _dispatch(event)
+
+    def start(self):
+        pass
+
+
+class RedisBackend:
+    def __init__(self, url=None, client=None, channel="umd:events"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self._client = client
+        self._channel = channel
+        self._started_pid = None
+
+    def publish(self, event):
+        self._client.publish(self._channel, json.dumps(event, default=str))
+
+    def start(self):
+        # One listener thread per process, started with its first subscriber
+        if self._started_pid == os.getpid():
+            return
+        with _lock:
+            if self._started_pid == os.getpid():
+                return
+            threading.Thread(target=self._listen, name="events-listener", daemon=True).start()
+            self._started_pid = os.getpid()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        _dispatch(json.loads(message["data"]))
+            except Exception as e:
+                log.warning("Event listener lost its connection: %s", e)
+                time.sleep(1)
+
+
+def publish(business_id, event_type, data, branch_id=None):
+    if not business_id:
+        return None
+    event = {
+        "id": _next_id(),
+        "business_id": business_id,
+        "branch_id": branch_id,
+        "type": event_type,
+        "data": data,
+    }
+    try:
+        (_backend or MemoryBackend()).publish(event)
+    except Exception as e:
+        # Never fail the write that triggered it; clients resync on reconnect
+        log.warning("Event publish failed: %s", e)
+    return event["id"]
+
+
+def subscribe(business_id):
+    if _backend is not None:
+        _backend.start()
+    target = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+    with _lock:
+        _subscribers.setdefault(business_id, set()).add(target)
+    return target
+
+
+def unsubscribe(business_id, target):
+    with _lock:
+        targets = _subscribers.get(business_id)
+        if targets is not None:
+            targets.discard(target)
+            if not targets:
+                del _subscribers[business_id]
+
+
+def recent(business_id, since):
+    """Buffered events of the business newer than the since id."""
+    with _lock:
+        return [event for event in _buffers.get(business_id, ()) if event["id"] > since]
+
+
+def unread_count(business_id):
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM alerts a
+            JOIN branches b ON a.branch_id = b.branch_id
+            WHERE b.business_id = ? AND a.status = 1 AND ISNULL(a.is_viewed, 0) = 0
+        """, (business_id,))
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def unread_changed(business_id):
+    if not business_id:
+        return
+    try:
+        count = unread_count(business_id)
+    except Exception as e:
+        log.warning("Unread count for event failed: %s", e)
+        return
+    publish(business_id, "unread_count", {"unread_count": count})
+
+
+def alerts_created(business_id, alerts):
+    """Publish new alerts, given as (branch_id, utility_bill_id, alert_type,
+    severity, message) tuples, followed by the new unread count."""
+    if not business_id or not alerts:
+        return
+    created_at = str(datetime.now().replace(microsecond=0))
+    by_branch = {}
+    for branch_id, bill_id, alert_type, severity, message in alerts:
+        by_branch.setdefault(branch_id, []).append({
+            "branch_id": branch_id,
+            "utility_bill_id": bill_id,
+            "type": alert_type,
+            "severity": severity,
+            "message": message,
+            "created_at": created_at,
+        })
+    for branch_id, items in by_branch.items():
+        publish(business_id, "alerts", {"alerts": items}, branch_id=branch_id)
+    unread_changed(business_id)
+
+
+def _visible(ctx, event):
+    # Managers only get events of the branches they handle; business-wide
+    # events (branch_id None) go to everyone in the business
+    branch_id = event.get("branch_id")
+    return branch_id is None or ctx.is_admin or ctx.can_access(branch_id)
+
+
+def _client_event(event):
+    return {"id": event["id"], "type": event["type"], "branch_id": event["branch_id"], **event["data"]}
+
+
+def _sse(event):
+    data = json.dumps(_client_event(event), default=str)
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {data}\n\n"
+
+
+class _LoopTarget:
+    # Subscriber queue for a stream served from an asyncio event loop;
+    # _dispatch() runs on other threads, so hand events over thread-safely
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def _put(self, event):
+        if self.queue.qsize() < SUBSCRIBER_QUEUE:
+            self.queue.put_nowait(event)
+
+    def put_nowait(self, event):
+        self.loop.call_soon_threadsafe(self._put, event)
+
+
+class EventStream:
+    """Body of an event stream response.
+
+    A WSGI server iterates it and blocks a thread on the subscription; the
+    ASGI adapter (umd_app/asgi.py) iterates it asynchronously instead, so an
+    open stream holds no thread there.
+    """
+
+    def __init__(self, ctx, target, first):
+        self.ctx = ctx
+        self.target = target
+        self.first = first
+
+    def _opening(self):
+        yield b"retry: 3000\n\n"
+        for event in self.first:
+            if _visible(self.ctx, event):
+                yield _sse(event).encode()
+
+    def __iter__(self):
+        try:
+            yield from self._opening()
+            deadline = time.monotonic() + stream_max
+            while time.monotonic() < deadline:
+                try:
+                    event = self.target.get(timeout=min(heartbeat, max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    # Also how a closed connection is noticed on an idle stream
+                    yield b": keepalive\n\n"
+                    continue
+                if _visible(self.ctx, event):
+                    yield _sse(event).encode()
+        finally:
+            self.close()
+
+    async def __aiter__(self):
+        business_id = self.ctx.business_id
+        target = _LoopTarget(asyncio.get_running_loop())
+        with _lock:
+            _subscribers.setdefault(business_id, set()).add(target)
+        # Events that reached the original subscription in the meantime
+        while True:
+            try:
+                target.queue.put_nowait(self.target.get_nowait())
+            except queue.Empty:
+                break
+        self.close()
+        try:
+            for chunk in self._opening():
+                yield chunk
+            deadline = time.monotonic() + stream_max
+            while time.monotonic() < deadline:
+                try:
+                    event = await asyncio.wait_for(
+                        target.queue.get(), min(heartbeat, max(0.0, deadline - time.monotonic())))
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if _visible(self.ctx, event):
+                    yield _sse(event).encode()
+        finally:
+            unsubscribe(business_id, target)
+
+    def close(self):
+        unsubscribe(self.ctx.business_id, self.target)
+
+
+def stream_response(ctx, since=None):
+    """Server-Sent Events response for the caller's business.
+
+    Starts with any alerts missed since the Last-Event-ID and the current
+    unread count, then relays new events until the client goes away or
+    stream_max seconds have passed, when EventSource reconnects on its own.
+    """
+    business_id = ctx.business_id
+    target = subscribe(business_id)
+    try:
+        # Alerts missed since the last connection, then the count as it is now
+        first = [event for event in recent(business_id, since)
+                 if event["type"] == "alerts"] if since is not None else []
+        first.append({"id": _next_id(), "business_id": business_id, "branch_id": None,
+                      "type": "unread_count", "data": {"unread_count": unread_count(business_id)}})
+    except Exception:
+        unsubscribe(business_id, target)
+        raise
+
+    response = Response(EventStream(ctx, target, first), content_type="text/event-stream",
+                        direct_passthrough=True)
+    response.headers["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+def wait(ctx, since=None, timeout=25.0):
+    """Long-poll: events newer than since, waiting up to timeout for one.
+
+    Without since it returns the current unread count right away, with a
+    cursor to pass as since on the next call.
+    """
+    business_id = ctx.business_id
+    if since is None:
+        return {"events": [{"type": "unread_count", "unread_count": unread_count(business_id)}],
+                "cursor": _next_id()}
+
+    target = subscribe(business_id)
+    try:
+        events = [event for event in recent(business_id, since) if _visible(ctx, event)]
+        deadline = time.monotonic() + timeout
+        while not events:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = target.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if event["id"] > since and _visible(ctx, event):
+                events.append(event)
+    finally:
+        unsubscribe(business_id, target)
+    cursor = max([since] + [event["id"] for event in events])
+    return {"events": [_client_event(event) for event in events], "cursor": cursor}
+
+
+def init_app(app):
+    global _backend, heartbeat, stream_max
+    heartbeat = float(app.config.get("EVENTS_HEARTBEAT", os.getenv("EVENTS_HEARTBEAT", 15)))
+    stream_max = float(app.config.get("EVENTS_STREAM_MAX", os.getenv("EVENTS_STREAM_MAX", 300)))
+    kind = app.config.get("EVENTS_BACKEND", os.getenv("EVENTS_BACKEND", "memory")).lower()
+    if kind == "memory":
+        _backend = MemoryBackend()
+    elif kind == "redis":
+        _backend = RedisBackend(app.config.get(
+            "EVENTS_REDIS_URL", os.getenv("EVENTS_REDIS_URL", os.getenv("CACHE_REDIS_URL"))))
+    else:
+        raise ValueError(f"Unknown EVENTS_BACKEND '{kind}' (expected memory or redis)")
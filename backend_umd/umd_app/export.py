@@ -0,0 +1,87 @@
+import csv
+import io
+import itertools
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from flask import Response, stream_with_context
+
+from umd_app.db import pooled_connection
+
+# Streams a query result to the client as CSV or NDJSON. Rows are read in
+# primary key order, FETCH_SIZE at a time, each batch on a pooled connection
+# that goes back to the pool before the batch is written out; an export of
+# several years of bills never sits in memory as a whole, and a slow client
+# never pins a connection while it downloads.
+
+FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+FETCH_SIZE = 500
+
+
+def _plain(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return str(value)
+    return value
+
+
+def _batches(query, params, key, after=0):
+    # Keyset batches: WHERE ... AND key > last key seen, one connection each
+    while True:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    query + f" AND {key} > ? ORDER BY {key} OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY",
+                    (*params, after, FETCH_SIZE))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+        if rows:
+            yield rows
+        if len(rows) < FETCH_SIZE:
+            return
+        after = rows[-1][0]
+
+
+def _csv_chunks(batches, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        for row in rows:
+            writer.writerow([_plain(v) for v in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _ndjson_chunks(batches, columns):
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, (_plain(v) for v in row)))) + "\n"
+            for row in rows)
+
+
+def stream_query(query, params, key, columns, fmt, filename):
+    """Build the streaming response for query, read in batches ordered by key.
+
+    query must end inside its WHERE clause and select key as its first column.
+    The first batch is read here, so a failing query raises before the
+    response starts.
+    """
+    chunks = _csv_chunks if fmt == "csv" else _ndjson_chunks
+    batches = _batches(query, params, key)
+    first = next(batches, None)
+
+    rows = itertools.chain([first] if first else [], batches)
+    response = Response(stream_with_context(chunks(rows, columns)), content_type=FORMATS[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}.{fmt}"'
+    return response
@@ -0,0 +1,327 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import AppGroup
+
+from umd_app import bill_parsing, config, media_store
+from umd_app.db import get_connection
+
+# Suggested amount / units / period for uploaded bills, read from their
+# attachment off the request path.
+#
+# The upload routes call enqueue() inside their transaction, which adds a
+# pending bill_extractions row, and notify() once it has committed. Dispatcher
+# threads collect the ids into batches (up to EXTRACTION_BATCH, waiting at
+# most EXTRACTION_BATCH_WAIT seconds to fill one), claim them, and hand each
+# batch to a process pool, since parsing PDFs and running OCR is CPU-bound
+# and would hold the GIL in a thread. The results are written back in one
+# transaction per batch. Rows whose notify() was lost are picked up by a
+# poller, as with the alert outbox.
+#
+# Nothing is applied to the bill until a user confirms the suggestion
+# (POST /api/utility/utility-bills/<id>/extraction/confirm).
+#
+# Row status: pending -> suggested (something was found) | no_match |
+# failed (after MAX_ATTEMPTS errors); suggested -> confirmed.
+#
+# EXTRACTION_WORKERS=0 parses inline in the caller's thread (scripts, tests).
+
+MAX_ATTEMPTS = 3
+# Seconds before a claimed but unfinished row may be retried (OCR is slow)
+CLAIM_TIMEOUT = 300
+POLL_GRACE = 10
+
+workers = 2
+batch_size = 16
+batch_wait = 0.5
+poll_interval = 30.0
+ocr_hook = None
+
+_queue = queue.Queue()
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def can_extract(media_path):
+    ext = media_path.rsplit(".", 1)[-1].lower()
+    return ext in ("csv", "pdf") or (ext in ("jpg", "jpeg", "png") and bool(ocr_hook))
+
+
+def enqueue(cursor, utility_bill_id, media_id):
+    """Queue the bill's attachment for extraction in the caller's transaction."""
+    cursor.execute("""
+        INSERT INTO bill_extractions (utility_bill_id, media_id)
+        OUTPUT INSERTED.id
+        VALUES (?, ?)
+    """, (utility_bill_id, media_id))
+    return cursor.fetchone()[0]
+
+
+def notify(*extraction_ids):
+    # Call after the enqueueing transaction has committed
+    if workers <= 0:
+        process(extraction_ids)
+        return
+    _ensure_started()
+    for extraction_id in extraction_ids:
+        _queue.put(extraction_id)
+
+
+def _now():
+    return datetime.now().replace(microsecond=0)
+
+
+def _claim(cursor, extraction_ids):
+    now = _now()
+    claimed = []
+    for extraction_id in extraction_ids:
+        cursor.execute("""
+            UPDATE bill_extractions
+            SET claimed_at = ?, attempts = attempts + 1
+            WHERE id = ? AND processed_at IS NULL AND attempts < ?
+                AND (claimed_at IS NULL OR claimed_at < ?)
+        """, (now, extraction_id, MAX_ATTEMPTS, now - timedelta(seconds=CLAIM_TIMEOUT)))
+        if cursor.rowcount == 1:
+            claimed.append(extraction_id)
+    return claimed
+
+
+def _jobs(cursor, extraction_ids):
+    placeholders = ", ".join("?" * len(extraction_ids))
+    cursor.execute(f"""
+        SELECT e.id, m.media_path, e.attempts
+        FROM bill_extractions e
+        JOIN media m ON m.id = e.media_id
+        WHERE e.id IN ({placeholders})
+    """, tuple(extraction_ids))
+    return [(extraction_id, media_store.full_path(media_path),
+             media_path.rsplit(".", 1)[-1].lower(), attempts)
+            for extraction_id, media_path, attempts in cursor.fetchall()]
+
+
+def _executor():
+    # One pool per process, created after any fork; spawned children import
+    # only bill_parsing's dependencies, not the app's threads or connections
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=workers,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _parse(jobs):
+    global _pool
+    work = [(extraction_id, path, ext) for extraction_id, path, ext, _ in jobs]
+    if workers <= 0:
+        return bill_parsing.parse_batch(work, ocr_hook)
+    try:
+        return _executor().submit(bill_parsing.parse_batch, work, ocr_hook).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. an OCR engine crashed); start a fresh pool next time
+        _pool = None
+        raise
+
+
+def _store(cursor, results, attempts):
+    now = _now()
+    for extraction_id, method, suggestion, error in results:
+        if error:
+            failed = attempts[extraction_id] >= MAX_ATTEMPTS
+            cursor.execute("""
+                UPDATE bill_extractions
+                SET last_error = ?, status = ?, processed_at = ?
+                WHERE id = ?
+            """, (error[:500], 'failed' if failed else 'pending', now if failed else None,
+                  extraction_id))
+            continue
+        suggestion = suggestion or {}
+        found = any(suggestion.get(key) is not None
+                    for key in ("amount", "units_used", "year", "month"))
+        cursor.execute("""
+            UPDATE bill_extractions
+            SET status = ?, method = ?, amount = ?, units_used = ?, year = ?, month = ?,
+                processed_at = ?, last_error = NULL
+            WHERE id = ?
+        """, ('suggested' if found else 'no_match', method, suggestion.get("amount"),
+              suggestion.get("units_used"), suggestion.get("year"), suggestion.get("month"),
+              now, extraction_id))
+
+
+def process(extraction_ids):
+    """Extract one batch of rows; returns {id: status}. Safe to call more than
+    once for the same ids."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        claimed = _claim(cursor, list(extraction_ids))
+        jobs = _jobs(cursor, claimed) if claimed else []
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    if not jobs:
+        return {}
+
+    # No connection is held while the batch is parsed
+    try:
+        results = _parse(jobs)
+    except Exception as e:
+        print("Bill extraction batch failed:", e)
+        results = [(job[0], None, None, f"{type(e).__name__}: {e}") for job in jobs]
+
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        _store(cursor, results, {job[0]: job[3] for job in jobs})
+        conn.commit()
+        ids = [job[0] for job in jobs]
+        placeholders = ", ".join("?" * len(ids))
+        cursor.execute(f"SELECT id, status FROM bill_extractions WHERE id IN ({placeholders})",
+                       tuple(ids))
+        return dict(cursor.fetchall())
+    except Exception as e:
+        conn.rollback()
+        print("Storing bill extractions failed:", e)
+        return {}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _next_batch():
+    batch = [_queue.get()]
+    deadline = time.monotonic() + batch_wait
+    while len(batch) < batch_size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_queue.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _work():
+    while True:
+        batch = _next_batch()
+        try:
+            process(batch)
+        except Exception as e:
+            print("Bill extraction worker failed:", e)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+
+def pending(limit=500, grace=POLL_GRACE):
+    # Unprocessed rows that nobody is (still) working on
+    now = _now()
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT TOP {int(limit)} id FROM bill_extractions
+            WHERE processed_at IS NULL AND attempts < ?
+                AND created_at <= ?
+                AND (claimed_at IS NULL OR claimed_at < ?)
+            ORDER BY id
+        """, (MAX_ATTEMPTS, now - timedelta(seconds=grace),
+              now - timedelta(seconds=CLAIM_TIMEOUT)))
+        return [row[0] for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _poll():
+    grace = 0  # on startup, take over whatever a previous process left behind
+    while True:
+        try:
+            for extraction_id in pending(grace=grace):
+                _queue.put(extraction_id)
+        except Exception as e:
+            print("Bill extraction poll failed:", e)
+        grace = POLL_GRACE
+        time.sleep(poll_interval)
+
+
+def _ensure_started():
+    # Started lazily (and again after a fork), like the alert workers
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        # One dispatcher per pool process keeps every process busy
+        for number in range(workers):
+            threading.Thread(target=_work, name=f"extraction-{number}", daemon=True).start()
+        if poll_interval > 0:
+            threading.Thread(target=_poll, name="extraction-poller", daemon=True).start()
+        _started_pid = os.getpid()
+
+
+def drain(timeout=30.0):
+    """Wait until queued extractions are done (tests and benchmarks)."""
+    deadline = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not _queue.unfinished_tasks
+
+
+extraction_cli = AppGroup('extraction', help="Inspect and run bill extraction.")
+
+
+@extraction_cli.command('status')
+def status_command():
+    """Count extraction rows by status."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT status, COUNT(*) FROM bill_extractions GROUP BY status ORDER BY status")
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    for status, count in rows:
+        click.echo(f"{status}: {count}")
+
+
+@extraction_cli.command('run')
+def run_command():
+    """Extract every pending row now, in batches, in this process."""
+    done = 0
+    while True:
+        ids = pending(limit=batch_size, grace=0)
+        if not ids:
+            break
+        statuses = process(ids)
+        if not statuses:
+            break  # claimed elsewhere or failing to claim; leave them
+        done += len(statuses)
+    click.echo(f"Processed {done} extractions.")
+
+
+def init_app(app):
+    global workers, batch_size, batch_wait, poll_interval, ocr_hook
+    workers = int(config.setting(app, "EXTRACTION_WORKERS", 2))
+    batch_size = max(1, int(config.setting(app, "EXTRACTION_BATCH", 16)))
+    batch_wait = float(config.setting(app, "EXTRACTION_BATCH_WAIT", 0.5))
+    poll_interval = float(config.setting(app, "EXTRACTION_POLL", 30))
+    ocr_hook = config.setting(app, "EXTRACTION_OCR", None) or None
+    app.cli.add_command(extraction_cli)
+    if workers > 0:
+        _ensure_started()
@@ -0,0 +1,201 @@
+import json
+import logging
+import re
+import time
+
+from flask import g, has_request_context, request
+
+from umd_app import config
+
+# Optional SQL instrumentation. When switched on at startup (SQL_INSTRUMENTATION=1
+# or app.config['SQL_INSTRUMENTATION']), every cursor handed out by
+# get_connection() is wrapped so each statement's time and row count are
+# charged to the current request. Responses get a Server-Timing header and
+# statements slower than SLOW_QUERY_MS are written to the "umd_app.sql"
+# logger as one JSON object per line. When off, get_connection() returns the
+# driver's cursor untouched.
+#
+# The /metrics endpoint needs per-request query counts too, so it can switch
+# on the counting alone (count_queries=True) without the header and log.
+
+enabled = False
+slow_query_ms = 200.0
+
+MAX_RECORDED_STATEMENTS = 200
+_WHITESPACE = re.compile(r"\s+")
+
+slow_log = logging.getLogger("umd_app.sql")
+
+
+class Statement:
+    __slots__ = ("sql", "duration", "rows")
+
+    def __init__(self, sql, duration, rows):
+        self.sql = sql
+        self.duration = duration
+        self.rows = rows
+
+
+class RequestStats:
+    def __init__(self, route):
+        self.route = route
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.query_count = 0
+        self.statements = []
+
+    def record(self, sql, duration, rows):
+        self.db_time += duration
+        self.query_count += 1
+        if len(self.statements) >= MAX_RECORDED_STATEMENTS:
+            return None
+        statement = Statement(sql, duration, rows)
+        self.statements.append(statement)
+        return statement
+
+
+def current_stats():
+    if not enabled or not has_request_context():
+        return None
+    return g.get("_sql_stats")
+
+
+def _normalize(sql):
+    return _WHITESPACE.sub(" ", sql).strip()[:2000]
+
+
+def _log_slow(route, statement):
+    slow_log.warning(json.dumps({
+        "event": "slow_query",
+        "route": route,
+        "duration_ms": round(statement.duration * 1000, 2),
+        "rows": statement.rows,
+        "sql": _normalize(statement.sql),
+    }))
+
+
+class InstrumentedCursor:
+    # Times execute()/executemany() and counts the rows fetched afterwards.
+    # Everything else is passed through to the driver cursor.
+
+    def __init__(self, raw):
+        self._raw = raw
+        self._statement = None
+        self._pending_slow = None
+
+    def _finish(self):
+        # Slow statements are logged once their rows have been read
+        statement, self._pending_slow = self._pending_slow, None
+        if statement is not None:
+            stats = current_stats()
+            _log_slow(stats.route if stats else None, statement)
+
+    def _track(self, sql, run):
+        self._finish()
+        started = time.perf_counter()
+        try:
+            run()
+        finally:
+            duration = time.perf_counter() - started
+            # Result sets are counted as they are fetched; for DML the driver
+            # reports the affected rows
+            rowcount = self._raw.rowcount
+            if self._raw.description is not None or rowcount is None or rowcount < 0:
+                rows = 0
+            else:
+                rows = rowcount
+            stats = current_stats()
+            if stats is not None:
+                self._statement = stats.record(sql, duration, rows)
+            else:
+                self._statement = Statement(sql, duration, rows)
+            if self._statement is not None and duration * 1000 >= slow_query_ms:
+                self._pending_slow = self._statement
+        return self
+
+    def execute(self, sql, *params):
+        return self._track(sql, lambda: self._raw.execute(sql, *params))
+
+    def executemany(self, sql, seq_of_params):
+        return self._track(sql, lambda: self._raw.executemany(sql, seq_of_params))
+
+    def _count(self, rows):
+        if self._statement is not None:
+            self._statement.rows += rows
+        return rows
+
+    def fetchone(self):
+        row = self._raw.fetchone()
+        if row is not None:
+            self._count(1)
+        return row
+
+    def fetchmany(self, *args):
+        rows = self._raw.fetchmany(*args)
+        self._count(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._raw.fetchall()
+        self._count(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._raw:
+            self._count(1)
+            yield row
+
+    def close(self):
+        self._finish()
+        self._raw.close()
+
+    @property
+    def fast_executemany(self):
+        return getattr(self._raw, "fast_executemany", False)
+
+    @fast_executemany.setter
+    def fast_executemany(self, value):
+        self._raw.fast_executemany = value
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+def wrap_cursor(raw):
+    return InstrumentedCursor(raw) if enabled else raw
+
+
+def _before_request():
+    g._sql_stats = RequestStats(request.endpoint or request.path)
+
+
+def _after_request(response):
+    stats = g.get("_sql_stats")
+    if stats is not None:
+        total = (time.perf_counter() - stats.started) * 1000
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats.db_time * 1000:.2f};desc="{stats.query_count} queries", '
+            f'app;dur={total:.2f}')
+    return response
+
+
+def init_app(app, count_queries=False):
+    global enabled, slow_query_ms
+    report = config.flag(app, "SQL_INSTRUMENTATION")
+    enabled = report or count_queries
+    if not enabled:
+        return
+
+    app.before_request(_before_request)
+    if not report:
+        slow_query_ms = float('inf')
+        return
+
+    slow_query_ms = float(config.setting(app, "SLOW_QUERY_MS", 200))
+    if not slow_log.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        slow_log.addHandler(handler)
+        slow_log.propagate = False
+    app.after_request(_after_request)
@@ -0,0 +1,277 @@
+import mimetypes
+import os
+import queue
+import shutil
+import subprocess
+import threading
+
+import click
+from flask import current_app, jsonify, request, send_file
+
+from umd_app import cache, config, media_store
+from umd_app.db import pooled_connection
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional: no image previews without Pillow
+    Image = None
+
+# Serving bill attachments and their previews.
+#
+# A media row never changes what it points at (replacing an attachment adds a
+# new row), and store files are named by their content hash, so responses are
+# cached by the browser for a year as immutable, with the hash as ETag;
+# Range and If-None-Match requests are answered by send_file. With
+# MEDIA_SENDFILE the bytes are left to the front server instead:
+#   x-sendfile        X-Sendfile header (Apache mod_xsendfile, lighttpd)
+#   x-accel-redirect  X-Accel-Redirect to MEDIA_ACCEL_PREFIX + the store path,
+#                     for an nginx `internal` location aliased to UPLOAD_FOLDER
+#
+# Previews are JPEGs at most MEDIA_PREVIEW_SIZE pixels on a side, made from
+# images (needs Pillow) and the first page of PDFs (needs pdftoppm, from
+# poppler-utils) by a background worker after each upload, and kept next to
+# the store under previews/ by content hash.
+
+CACHE_SECONDS = 365 * 24 * 3600
+PDFTOPPM_TIMEOUT = 30
+
+sendfile = None
+accel_prefix = "/protected-media/"
+preview_size = 320
+preview_workers = 1
+
+# Media row fields by business data version and id, so repeat views skip the
+# database; soft-deleting a row (a replaced attachment, a deleted bill) goes
+# with cache.data_changed(), which moves every worker onto a fresh key
+_rows = cache.MemoryBackend(max_entries=4096)
+ROW_TTL = 300
+
+_queue = queue.Queue()
+_pending = set()
+_pending_lock = threading.Lock()
+_started_pid = None
+_start_lock = threading.Lock()
+
+
+def _content_hash(media_path):
+    if not media_store.is_blob_path(media_path):
+        return None
+    return media_path.rsplit("/", 1)[1].split(".", 1)[0]
+
+
+def _ext(media_path):
+    return media_path.rsplit(".", 1)[-1].lower() if "." in media_path else ""
+
+
+def can_preview(media_path):
+    if _content_hash(media_path) is None:
+        return False
+    ext = _ext(media_path)
+    if ext in ("jpg", "png"):
+        return Image is not None
+    if ext == "pdf":
+        return shutil.which("pdftoppm") is not None
+    return False
+
+
+def lookup(media_id, business_id):
+    """(media_path, media_name, business_id, branch_id) of an active media row,
+    as seen by a user of business_id."""
+    key = f"{business_id}:{cache.get_version(cache.DATA, business_id)}:{media_id}"
+    row = _rows.get(key)
+    if row is None:
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT m.media_path, m.media_name, m.business_id,
+                        COALESCE(m.branch_id, ub.branch_id)
+                    FROM media m
+                    LEFT JOIN utility_bills ub ON ub.id = m.utility_bill_id
+                    WHERE m.id = ? AND m.status = 1
+                """, (media_id,))
+                found = cursor.fetchone()
+            finally:
+                cursor.close()
+        if not found:
+            return None
+        row = tuple(found)
+        _rows.set(key, row, ROW_TTL)
+    return row
+
+
+def can_view(ctx, row):
+    _, _, business_id, branch_id = row
+    if branch_id is not None:
+        return ctx.can_access(branch_id)
+    return business_id == ctx.business_id and ctx.is_admin
+
+
+def _cache_headers(response, immutable):
+    # private: attachments are only for the signed-in business, not shared caches
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = CACHE_SECONDS
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def send(path, download_name, etag=None):
+    """Respond with a stored file (or a preview) at path.
+
+    etag is the content hash for store files, whose responses may then be
+    cached as immutable; pre-store files are revalidated on every use.
+    """
+    immutable = etag is not None
+    mimetype = mimetypes.guess_type(download_name)[0] or "application/octet-stream"
+    relative = os.path.relpath(path, media_store.root)
+    if sendfile == "x-accel-redirect" and not relative.startswith(".."):
+        response = current_app.response_class(mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = accel_prefix + relative.replace(os.sep, "/")
+        response.headers["Content-Disposition"] = f'inline; filename="{download_name}"'
+        if etag:
+            response.set_etag(etag)
+        response.make_conditional(request)
+        return _cache_headers(response, immutable)
+
+    response = send_file(path, mimetype=mimetype, download_name=download_name,
+                         conditional=True, etag=etag if etag else True, max_age=None)
+    return _cache_headers(response, immutable)
+
+
+def send_media(row):
+    media_path, media_name = row[0], row[1]
+    path = media_store.full_path(media_path)
+    if not os.path.isfile(path):
+        return jsonify({"error": "Image not found"}), 404
+    return send(path, media_name or os.path.basename(path), _content_hash(media_path))
+
+
+def send_preview(row):
+    media_path, media_name = row[0], row[1]
+    if not can_preview(media_path):
+        return jsonify({"error": "No preview for this file"}), 404
+    content_hash = _content_hash(media_path)
+    path = media_store.preview_path(content_hash)
+    if not os.path.isfile(path):
+        enqueue(media_path)
+        response = jsonify({"status": "pending"})
+        response.status_code = 202
+        response.headers["Retry-After"] = "2"
+        response.cache_control.no_store = True
+        return response
+    name = os.path.splitext(media_name or content_hash)[0] + "-preview.jpg"
+    return send(path, name, f"{content_hash}-p{preview_size}")
+
+
+def generate_preview(media_path):
+    """Write the preview of a store file; returns its path, or None if the
+    file type (or a missing optional tool) does not allow one."""
+    if not can_preview(media_path):
+        return None
+    source = media_store.full_path(media_path)
+    target = media_store.preview_path(_content_hash(media_path))
+    if os.path.exists(target):
+        return target
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    partial = f"{target}.{os.getpid()}.{threading.get_ident()}"
+
+    try:
+        if _ext(media_path) == "pdf":
+            # First page only, written to partial + ".jpg"
+            subprocess.run(["pdftoppm", "-jpeg", "-f", "1", "-l", "1", "-singlefile",
+                            "-scale-to", str(preview_size), source, partial],
+                           check=True, capture_output=True, timeout=PDFTOPPM_TIMEOUT)
+            os.replace(partial + ".jpg", target)
+        else:
+            with Image.open(source) as image:
+                # Lets the JPEG decoder skip most of the pixels of a big scan
+                image.draft("RGB", (preview_size, preview_size))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((preview_size, preview_size))
+                image.convert("RGB").save(partial, "JPEG", quality=80, optimize=True)
+            os.replace(partial, target)
+    finally:
+        for leftover in (partial, partial + ".jpg"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+    return target
+
+
+def _work():
+    while True:
+        media_path = _queue.get()
+        try:
+            generate_preview(media_path)
+        except Exception as e:
+            print(f"Preview of {media_path} failed:", e)
+        finally:
+            with _pending_lock:
+                _pending.discard(media_path)
+
+
+def _ensure_started():
+    # Started lazily (and again after a fork), like the alert workers
+    global _started_pid
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        for number in range(preview_workers):
+            threading.Thread(target=_work, name=f"media-preview-{number}", daemon=True).start()
+        _started_pid = os.getpid()
+
+
+def enqueue(media_path):
+    """Have a preview made in the background, if it can be and is missing."""
+    if not preview_workers or not can_preview(media_path):
+        return
+    if os.path.exists(media_store.preview_path(_content_hash(media_path))):
+        return
+    with _pending_lock:
+        if media_path in _pending:
+            return
+        _pending.add(media_path)
+    _ensure_started()
+    _queue.put(media_path)
+
+
+@media_store.media_cli.command('previews')
+def previews_command():
+    """Make the missing previews of active attachments (run after migrate)."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT DISTINCT media_path FROM media WHERE status = 1")
+            paths = [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+    made = failed = 0
+    for media_path in paths:
+        if not can_preview(media_path) or os.path.exists(media_store.preview_path(_content_hash(media_path))):
+            continue
+        try:
+            generate_preview(media_path)
+            made += 1
+        except Exception as e:
+            failed += 1
+            click.echo(f"{media_path}: {e}")
+    click.echo(f"Made {made} previews" + (f", {failed} failed." if failed else "."))
+
+
+def init_app(app):
+    global sendfile, accel_prefix, preview_size, preview_workers
+    sendfile = (str(config.setting(app, "MEDIA_SENDFILE", "")).lower() or None)
+    if sendfile in ("none", "0", "off"):
+        sendfile = None
+    if sendfile == "x-sendfile":
+        app.config["USE_X_SENDFILE"] = True
+    accel_prefix = str(config.setting(app, "MEDIA_ACCEL_PREFIX", accel_prefix))
+    if not accel_prefix.endswith("/"):
+        accel_prefix += "/"
+    preview_size = int(config.setting(app, "MEDIA_PREVIEW_SIZE", preview_size))
+    preview_workers = int(config.setting(app, "MEDIA_PREVIEW_WORKERS", preview_workers))
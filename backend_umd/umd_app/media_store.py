@@ -0,0 +1,513 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import click
+from flask import Request, current_app, jsonify
+from flask.cli import AppGroup
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from umd_app.db import IntegrityError, pooled_connection
+
+# Content-addressed storage for bill attachments.
+#
+# An upload is streamed into UPLOAD_FOLDER/tmp while it is hashed, then kept
+# under its SHA-256 in a two-level sharded tree:
+#
+#     UPLOAD_FOLDER/3f/a2/3fa2...e1.pdf
+#
+# so a scan uploaded twice is stored once and no directory grows past a few
+# hundred entries. media.media_path holds that relative path. media_blobs has
+# one row per stored file with ref_count = the number of active media rows
+# pointing at it; the write paths call add_ref/release inside their own
+# transaction, and `flask --app run media gc` deletes the files nothing has
+# referenced for MEDIA_GC_GRACE seconds.
+#
+# Uploads to the routes marked @streamed_upload never sit in memory or in a
+# second temp file: the multipart parser writes the file part straight into
+# an UploadFile, which hashes it, enforces MEDIA_MAX_BYTES and keeps the first
+# bytes so save() can check the content really is the PDF/PNG/JPEG/CSV its
+# extension claims. place() then links the file into the tree before the
+# route opens its transaction, which only has to record the rows.
+#
+# Rows written before this module kept "<uuid>_<name>" files directly in
+# UPLOAD_FOLDER (or an absolute path); they stay readable, and
+# `flask --app run media migrate` moves them into the store.
+
+CHUNK_SIZE = 64 * 1024
+HEAD_SIZE = 512
+TMP_DIR = "tmp"
+PREVIEW_DIR = "previews"
+
+# Same content, same file name
+_EXTENSIONS = {"jpeg": "jpg"}
+
+# Leading bytes of each accepted binary type; CSV is checked for being text
+_SIGNATURES = {
+    "pdf": (b"%PDF-",),
+    "png": (b"\x89PNG\r\n\x1a\n",),
+    "jpg": (b"\xff\xd8\xff",),
+}
+_TEXT_CONTROLS = set(b"\t\n\r\f")
+
+root = os.path.join(os.getcwd(), "uploads", "media")
+gc_grace = 86400
+max_bytes = 20 * 1024 * 1024
+
+
+class InvalidMedia(ValueError):
+    # The upload is empty or its content does not match its extension
+    pass
+
+# An upload hashed into a temp file, not yet placed in the store
+Blob = namedtuple("Blob", "content_hash media_path size_bytes tmp_path")
+
+
+def blob_path(content_hash, ext):
+    ext = _normalize(ext)
+    return f"{content_hash[:2]}/{content_hash[2:4]}/{content_hash}.{ext}"
+
+
+def is_blob_path(media_path):
+    parts = media_path.split("/")
+    return len(parts) == 3 and len(parts[2].split(".", 1)[0]) == 64
+
+
+def full_path(media_path):
+    if os.path.isabs(media_path):
+        return media_path
+    return os.path.join(root, *media_path.split("/"))
+
+
+def preview_path(content_hash):
+    # Thumbnails made by media_serving, one per content
+    return os.path.join(root, PREVIEW_DIR, content_hash[:2], content_hash[2:4],
+                        f"{content_hash}.jpg")
+
+
+def _normalize(ext):
+    ext = ext.lower().lstrip(".")
+    return _EXTENSIONS.get(ext, ext)
+
+
+def content_matches(ext, head):
+    """Whether the first bytes of a file are plausible for its extension."""
+    ext = _normalize(ext)
+    if ext == "csv":
+        return bool(head) and not any(b < 32 and b not in _TEXT_CONTROLS for b in head)
+    return ext in _SIGNATURES and head.startswith(_SIGNATURES[ext])
+
+
+class UploadFile:
+    """File the multipart parser writes an upload into: a temp file in the
+    store, hashed and size-checked chunk by chunk as the request arrives."""
+
+    def __init__(self, limit=None):
+        tmp_dir = os.path.join(root, TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        self._file = os.fdopen(fd, "w+b")
+        self._digest = hashlib.sha256()
+        self.limit = limit
+        self.size = 0
+        self.head = b""
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit and self.size > self.limit:
+            self.close()
+            raise RequestEntityTooLarge(f"Attachments are limited to {_size(self.limit)}.")
+        if len(self.head) < HEAD_SIZE:
+            self.head += data[:HEAD_SIZE - len(self.head)]
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def detach(self):
+        # Hand the temp file over to a Blob; close() no longer removes it
+        self._file.close()
+        path, self.path = self.path, None
+        return path
+
+    def close(self):
+        self._file.close()
+        if self.path:
+            _remove(self.path)
+            self.path = None
+
+    def __getattr__(self, name):
+        # read, readline, seek, tell, ... for code that reads the upload back
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+def streamed_upload(view):
+    """Mark a route whose file uploads are parsed into UploadFile."""
+    view.streamed_upload = True
+    return view
+
+
+class UploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        view = current_app.view_functions.get(self.endpoint) if self.endpoint else None
+        if getattr(view, "streamed_upload", False):
+            return UploadFile(max_bytes)
+        return super()._get_file_stream(total_content_length, content_type, filename,
+                                        content_length)
+
+
+def save(file_storage, ext, check=True):
+    """Finish an upload as a Blob: hashed, in a temp file in the store.
+
+    Raises InvalidMedia if check is set and the content is not what ext
+    says. Call place() to put it in the tree and discard() once the
+    transaction recording it is over.
+    """
+    stream = file_storage.stream
+    if isinstance(stream, UploadFile):
+        content_hash, size, head = stream.hexdigest(), stream.size, stream.head
+        tmp_path = stream.detach()
+    else:
+        # Not parsed by UploadRequest (e.g. migrate): copy it, hashing on the way
+        tmp_dir = os.path.join(root, TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        head = b""
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if len(head) < HEAD_SIZE:
+                        head += chunk[:HEAD_SIZE - len(head)]
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        content_hash = digest.hexdigest()
+
+    if check and not content_matches(ext, head):
+        _remove(tmp_path)
+        if not size:
+            raise InvalidMedia("The uploaded file is empty")
+        raise InvalidMedia(f"The file's content is not a valid .{_normalize(ext)} file")
+    return Blob(content_hash, blob_path(content_hash, ext), size, tmp_path)
+
+
+def _link(source, target):
+    # Atomic: the target appears complete or not at all
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        # No hard links on this filesystem: copy beside the target, then rename
+        partial = f"{target}.{os.getpid()}.part"
+        shutil.copyfile(source, partial)
+        os.replace(partial, target)
+
+
+def place(blob):
+    """Put an upload into the tree, before the transaction that records it.
+
+    The temp file stays until discard(), so add_ref can put the file back if
+    gc collected the same content in the meantime.
+    """
+    target = full_path(blob.media_path)
+    if not os.path.exists(target):
+        _link(blob.tmp_path, target)
+
+
+def discard(blob):
+    if blob is not None and blob.tmp_path:
+        _remove(blob.tmp_path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def add_ref(cursor, blob):
+    """Count one more media row for a placed blob and make sure its file exists.
+
+    Returns the media_path to store on the media row: the blob's existing
+    path if the same content was stored before under another extension.
+    """
+    cursor.execute("""
+        UPDATE media_blobs SET ref_count = ref_count + 1, released_at = NULL
+        WHERE content_hash = ?
+    """, (blob.content_hash,))
+    if not cursor.rowcount:
+        try:
+            cursor.execute("""
+                INSERT INTO media_blobs (content_hash, media_path, size_bytes, ref_count)
+                VALUES (?, ?, ?, 1)
+            """, (blob.content_hash, blob.media_path, blob.size_bytes))
+        except IntegrityError:
+            # Stored by a concurrent upload between the UPDATE and the INSERT
+            cursor.execute("""
+                UPDATE media_blobs SET ref_count = ref_count + 1, released_at = NULL
+                WHERE content_hash = ?
+            """, (blob.content_hash,))
+    cursor.execute("SELECT media_path FROM media_blobs WHERE content_hash = ?",
+                   (blob.content_hash,))
+    media_path = cursor.fetchone()[0]
+
+    # The row is locked until the caller commits, so gc cannot remove the
+    # file between this check and the commit; a file gc removed since
+    # place() is put back from the upload
+    target = full_path(media_path)
+    if not os.path.exists(target):
+        _link(blob.tmp_path, target)
+    return media_path
+
+
+def release(cursor, media_paths, now=None):
+    """Count the media rows for media_paths as gone (soft-deleted or replaced)."""
+    now = now or datetime.now()
+    for media_path in media_paths:
+        if not is_blob_path(media_path):
+            continue  # pre-store file, collected by gc once migrated
+        cursor.execute("""
+            UPDATE media_blobs
+            SET ref_count = ref_count - 1,
+                released_at = CASE WHEN ref_count = 1 THEN ? ELSE released_at END
+            WHERE media_path = ? AND ref_count > 0
+        """, (now, media_path))
+
+
+def collect_unreferenced(conn, cutoff, dry_run=False, batch=500):
+    """Delete blobs no media row has referenced since cutoff. Returns (files, bytes)."""
+    cursor = conn.cursor()
+    files = size = 0
+    seen = set()
+    try:
+        if dry_run:
+            cursor.execute("""
+                SELECT COUNT(*), SUM(size_bytes) FROM media_blobs
+                WHERE ref_count = 0 AND released_at < ?
+            """, (cutoff,))
+            files, size = cursor.fetchone()
+            return files, size or 0
+        while True:
+            cursor.execute(f"""
+                SELECT TOP ({int(batch)}) content_hash, media_path, size_bytes FROM media_blobs
+                WHERE ref_count = 0 AND released_at < ?
+                ORDER BY released_at
+            """, (cutoff,))
+            rows = [row for row in cursor.fetchall() if row[0] not in seen]
+            if not rows:
+                break
+            for content_hash, media_path, size_bytes in rows:
+                seen.add(content_hash)
+                # Delete the row first and unlink while holding it, so an
+                # upload of the same content waits for this commit and then
+                # puts the file back
+                cursor.execute("""
+                    DELETE FROM media_blobs
+                    WHERE content_hash = ? AND ref_count = 0 AND released_at < ?
+                """, (content_hash, cutoff))
+                if cursor.rowcount:
+                    _remove(full_path(media_path))
+                    _remove(preview_path(content_hash))
+                    files += 1
+                    size += size_bytes or 0
+                conn.commit()
+    finally:
+        cursor.close()
+    return files, size
+
+
+def _old_files(directory, cutoff_ts):
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.is_file() and entry.stat().st_mtime < cutoff_ts:
+            yield entry
+
+
+def collect_orphans(conn, cutoff, dry_run=False):
+    """Delete files no row accounts for: temp files of failed uploads, blobs
+    whose insert rolled back, and flat pre-store files no active media row
+    points at (including the ones whose rows were hard-deleted)."""
+    cutoff_ts = time.mktime(cutoff.timetuple())
+    cursor = conn.cursor()
+    files = size = 0
+
+    def drop(entry):
+        nonlocal files, size
+        files += 1
+        size += entry.stat().st_size
+        if not dry_run:
+            _remove(entry.path)
+
+    try:
+        for entry in _old_files(os.path.join(root, TMP_DIR), cutoff_ts):
+            drop(entry)
+
+        # One query per top-level shard keeps memory flat at millions of blobs
+        for top in sorted(os.listdir(root)) if os.path.isdir(root) else ():
+            top_dir = os.path.join(root, top)
+            if len(top) != 2 or not os.path.isdir(top_dir):
+                continue
+            cursor.execute("""
+                SELECT media_path FROM media_blobs WHERE content_hash >= ? AND content_hash < ?
+            """, (top, top + "g"))
+            known = {row[0] for row in cursor.fetchall()}
+            for sub in sorted(os.listdir(top_dir)):
+                for entry in _old_files(os.path.join(top_dir, sub), cutoff_ts):
+                    if f"{top}/{sub}/{entry.name}" not in known:
+                        drop(entry)
+
+        flat = list(_old_files(root, cutoff_ts))
+        if flat:
+            cursor.execute("SELECT media_path FROM media WHERE status = 1")
+            referenced = {os.path.basename(row[0]) for row in cursor.fetchall()
+                          if not is_blob_path(row[0])}
+            for entry in flat:
+                if entry.name not in referenced:
+                    drop(entry)
+    finally:
+        cursor.close()
+    return files, size
+
+
+def recount(cursor, now=None):
+    """Recompute media_blobs.ref_count from the active media rows."""
+    now = now or datetime.now()
+    cursor.execute("""
+        SELECT media_path, COUNT(*) FROM media
+        WHERE status = 1
+        GROUP BY media_path
+    """)
+    counts = [(count, media_path) for media_path, count in cursor.fetchall()
+              if is_blob_path(media_path)]
+    cursor.execute("UPDATE media_blobs SET ref_count = 0")
+    if counts:
+        cursor.fast_executemany = True
+        cursor.executemany("UPDATE media_blobs SET ref_count = ? WHERE media_path = ?", counts)
+    cursor.execute("""
+        UPDATE media_blobs SET released_at = NULL WHERE ref_count > 0
+    """)
+    cursor.execute("""
+        UPDATE media_blobs SET released_at = ? WHERE ref_count = 0 AND released_at IS NULL
+    """, (now,))
+    return len(counts)
+
+
+class _LocalFile:
+    # save() reads .stream, as on a werkzeug FileStorage
+    def __init__(self, stream):
+        self.stream = stream
+
+
+def migrate(conn):
+    """Move pre-store files into the store and point their media rows at them."""
+    cursor = conn.cursor()
+    moved = missing = 0
+    try:
+        cursor.execute("SELECT id, media_path FROM media WHERE status = 1")
+        rows = [row for row in cursor.fetchall() if not is_blob_path(row[1])]
+        for media_id, old_path in rows:
+            source = full_path(old_path)
+            if not os.path.isfile(source):
+                missing += 1
+                continue
+            with open(source, "rb") as f:
+                blob = save(_LocalFile(f), os.path.splitext(source)[1] or "bin", check=False)
+            try:
+                place(blob)
+                media_path = add_ref(cursor, blob)
+                cursor.execute("UPDATE media SET media_path = ? WHERE id = ?", (media_path, media_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                discard(blob)
+            moved += 1
+    finally:
+        cursor.close()
+    # The flat originals are left for gc, which drops them once no row uses them
+    return moved, missing
+
+
+def _size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+media_cli = AppGroup('media', help="Maintain the content-addressed media store.")
+
+
+@media_cli.command('gc')
+@click.option('--grace', type=int, default=None,
+              help="seconds a file must have been unreferenced (default MEDIA_GC_GRACE)")
+@click.option('--dry-run', is_flag=True, help="report what would be deleted")
+def gc_command(grace, dry_run):
+    """Delete stored files no media row references any more."""
+    cutoff = datetime.now() - timedelta(seconds=gc_grace if grace is None else grace)
+    with pooled_connection() as conn:
+        blobs, blob_bytes = collect_unreferenced(conn, cutoff, dry_run)
+        orphans, orphan_bytes = collect_orphans(conn, cutoff, dry_run)
+    verb = "Would delete" if dry_run else "Deleted"
+    click.echo(f"{verb} {blobs} unreferenced blobs ({_size(blob_bytes)}) and "
+               f"{orphans} orphaned files ({_size(orphan_bytes)}).")
+
+
+@media_cli.command('recount')
+def recount_command():
+    """Recompute the blob reference counts from the media table."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            count = recount(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+    click.echo(f"Recounted references for {count} blobs.")
+
+
+@media_cli.command('migrate')
+def migrate_command():
+    """Move attachments stored before the media store into it."""
+    with pooled_connection() as conn:
+        moved, missing = migrate(conn)
+    click.echo(f"Moved {moved} attachments into the store"
+               + (f", {missing} files were missing." if missing else "."))
+
+
+def _too_large(error):
+    return jsonify({"error": error.description}), 413
+
+
+def init_app(app):
+    global root, gc_grace, max_bytes
+    root = app.config.get("UPLOAD_FOLDER", root)
+    gc_grace = int(app.config.get("MEDIA_GC_GRACE", os.getenv("MEDIA_GC_GRACE", 86400)))
+    max_bytes = int(app.config.get("MEDIA_MAX_BYTES", os.getenv("MEDIA_MAX_BYTES", max_bytes)))
+    app.request_class = UploadRequest
+    app.register_error_handler(RequestEntityTooLarge, _too_large)
+    app.cli.add_command(media_cli)
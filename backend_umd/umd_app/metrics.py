@@ -0,0 +1,111 @@
+import os
+import time
+
+from flask import Response, g, request
+
+from umd_app import config, db, instrumentation
+
+# Prometheus metrics, served at /metrics when METRICS_ENABLED=1 and the
+# prometheus_client package is installed.
+#
+# Under a pre-forking server (gunicorn, uWSGI) every worker keeps its own
+# counters. Point PROMETHEUS_MULTIPROC_DIR at an empty, writable directory
+# before the app is imported; the workers then write their samples there and
+# /metrics aggregates all of them, whichever worker answers the scrape.
+
+try:
+    from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter,
+                                   Histogram, generate_latest, multiprocess)
+except ImportError:
+    Counter = None
+
+enabled = False
+
+if Counter is not None:
+    REQUEST_LATENCY = Histogram(
+        'umd_http_request_duration_seconds', "Time spent handling a request",
+        ['endpoint', 'method'])
+    REQUESTS = Counter(
+        'umd_http_requests_total', "Requests handled, by response status",
+        ['endpoint', 'method', 'status'])
+    DB_ACQUIRE = Histogram(
+        'umd_db_connection_acquire_seconds', "Time spent waiting for a pooled database connection",
+        buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+    DB_ACQUIRE_TIMEOUTS = Counter(
+        'umd_db_connection_acquire_timeouts_total', "Requests that gave up waiting for a connection")
+    QUERIES_PER_REQUEST = Histogram(
+        'umd_db_queries_per_request', "SQL statements executed per request",
+        ['endpoint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+    UPLOAD_BYTES = Counter(
+        'umd_media_upload_bytes_total', "Bytes of utility bill media stored (use rate() for bytes/sec)")
+    ALERTS = Counter(
+        'umd_alerts_created_total', "Alerts generated, by type", ['alert_type'])
+
+
+def wanted(app):
+    return config.flag(app, "METRICS_ENABLED")
+
+
+# Recording helpers for the routes; they do nothing while metrics are off
+
+def alert_created(alert_type, count=1):
+    if enabled and count:
+        ALERTS.labels(alert_type=alert_type).inc(count)
+
+
+def media_uploaded(path):
+    if enabled:
+        try:
+            UPLOAD_BYTES.inc(os.path.getsize(path))
+        except OSError:
+            pass
+
+
+def _observe_acquire(waited, timed_out):
+    DB_ACQUIRE.observe(waited)
+    if timed_out:
+        DB_ACQUIRE_TIMEOUTS.inc()
+
+
+def _before_request():
+    g._metrics_started = time.perf_counter()
+
+
+def _after_request(response):
+    started = g.get("_metrics_started")
+    if started is None or request.endpoint == 'metrics':
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    REQUEST_LATENCY.labels(endpoint=endpoint, method=request.method).observe(
+        time.perf_counter() - started)
+    REQUESTS.labels(endpoint=endpoint, method=request.method,
+                    status=str(response.status_code)).inc()
+    stats = instrumentation.current_stats()
+    if stats is not None:
+        QUERIES_PER_REQUEST.labels(endpoint=endpoint).observe(stats.query_count)
+    return response
+
+
+def metrics_view():
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        data = generate_latest(registry)
+    else:
+        data = generate_latest()
+    return Response(data, content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    global enabled
+    if not wanted(app):
+        return
+    if Counter is None:
+        print("METRICS_ENABLED is set but prometheus_client is not installed; /metrics is disabled")
+        return
+
+    enabled = True
+    db.add_acquire_hook(_observe_acquire)
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view, methods=['GET'])
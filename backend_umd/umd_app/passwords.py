@@ -0,0 +1,233 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+from flask import jsonify
+
+from umd_app import config
+
+# Password hashing and login throttling.
+#
+# bcrypt is deliberately slow (~250 ms of CPU at cost 12), so hashing and
+# checking run on a small pool of PASSWORD_WORKERS threads rather than on
+# every request thread at once: bcrypt releases the GIL while it works, so
+# the pool uses up to that many cores and the other request threads keep
+# serving. At most PASSWORD_QUEUE calls may wait for the pool; past that the
+# request is refused with 503 and Retry-After instead of queueing more CPU
+# work behind a burst of logins. PASSWORD_WORKERS=0 hashes inline.
+#
+# BCRYPT_ROUNDS is the cost of new hashes. A login whose stored hash has a
+# different cost is rehashed at the current one, so raising it takes effect
+# as users sign in.
+#
+# Failed logins are counted per account and per client address over
+# LOGIN_WINDOW seconds; once either reaches its limit, further attempts get
+# 429 before any bcrypt work is done. Counters live in THROTTLE_BACKEND:
+#   memory  per-process (default) - each worker counts on its own
+#   redis   shared by every worker (THROTTLE_REDIS_URL)
+
+_COST = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+rounds = 12
+workers = 2
+max_queue = 32
+max_account_failures = 5
+max_address_failures = 50
+window = 900
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_slots = None
+_throttle = None
+
+
+class PasswordPoolBusy(Exception):
+    def __init__(self):
+        super().__init__("Too many sign-ins in progress, please try again shortly.")
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Too many failed attempts, please try again later.")
+        self.retry_after = retry_after
+
+
+def _executor():
+    # One pool per process, created after any fork
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _run(function, *args):
+    if workers <= 0:
+        return function(*args)
+    if not _slots.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    try:
+        future = _executor().submit(function, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def _hash(password, cost):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(cost)).decode('utf-8')
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_password(password):
+    return _run(_hash, password, rounds)
+
+
+def check_password(password, hashed):
+    if not hashed:
+        return False
+    try:
+        return _run(_check, password, hashed)
+    except ValueError:  # not a bcrypt hash
+        return False
+
+
+def needs_rehash(hashed):
+    match = _COST.match(hashed or "")
+    return match is not None and int(match.group(1)) != rounds
+
+
+class MemoryThrottle:
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._counts = OrderedDict()  # key -> (count, window ends)
+        self._lock = threading.Lock()
+
+    def _current(self, key, now):
+        item = self._counts.get(key)
+        if item is not None and item[1] <= now:
+            del self._counts[key]
+            return None
+        return item
+
+    def get(self, key):
+        # (failures, seconds until the window ends)
+        now = time.monotonic()
+        with self._lock:
+            item = self._current(key, now)
+            return (item[0], item[1] - now) if item else (0, 0)
+
+    def hit(self, key, ttl):
+        now = time.monotonic()
+        with self._lock:
+            item = self._current(key, now)
+            count, ends = item if item else (0, now + ttl)
+            self._counts[key] = (count + 1, ends)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._counts.pop(key, None)
+
+
+class RedisThrottle:
+    def __init__(self, url=None, client=None, prefix="umd:login:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self._client = client
+        self._prefix = prefix
+
+    def get(self, key):
+        pipe = self._client.pipeline()
+        pipe.get(self._prefix + key)
+        pipe.ttl(self._prefix + key)
+        count, ttl = pipe.execute()
+        return (int(count), max(ttl, 1)) if count is not None else (0, 0)
+
+    def hit(self, key, ttl):
+        # The window starts with the first failure; INCR keeps its expiry
+        pipe = self._client.pipeline()
+        pipe.set(self._prefix + key, 0, ex=max(1, int(ttl)), nx=True)
+        pipe.incr(self._prefix + key)
+        pipe.execute()
+
+    def reset(self, key):
+        self._client.delete(self._prefix + key)
+
+
+def _keys(email, address):
+    keys = [("account:" + (email or "").strip().lower(), max_account_failures)]
+    if address:
+        keys.append(("address:" + address, max_address_failures))
+    return keys
+
+
+def check_throttle(email, address):
+    """Raise LoginThrottled if the account or address has failed too often."""
+    for key, limit in _keys(email, address):
+        if limit <= 0:
+            continue
+        failures, remaining = _throttle.get(key)
+        if failures >= limit:
+            raise LoginThrottled(int(remaining) + 1)
+
+
+def login_failed(email, address):
+    for key, limit in _keys(email, address):
+        if limit > 0:
+            _throttle.hit(key, window)
+
+
+def login_succeeded(email):
+    _throttle.reset(_keys(email, None)[0][0])
+
+
+def init_app(app):
+    global rounds, workers, max_queue, max_account_failures, max_address_failures
+    global window, _slots, _throttle, _pool
+    rounds = int(config.setting(app, "BCRYPT_ROUNDS", rounds))
+    if not 4 <= rounds <= 31:
+        raise ValueError(f"BCRYPT_ROUNDS must be between 4 and 31, not {rounds}")
+    workers = int(config.setting(app, "PASSWORD_WORKERS", workers))
+    max_queue = int(config.setting(app, "PASSWORD_QUEUE", max_queue))
+    # Calls running plus calls waiting for a worker
+    _slots = threading.BoundedSemaphore(max(1, workers) + max(0, max_queue))
+    _pool = None
+
+    max_account_failures = int(config.setting(app, "LOGIN_MAX_FAILURES", max_account_failures))
+    max_address_failures = int(config.setting(app, "LOGIN_MAX_ADDRESS_FAILURES", max_address_failures))
+    window = int(config.setting(app, "LOGIN_WINDOW", window))
+    kind = str(config.setting(app, "THROTTLE_BACKEND", "memory")).lower()
+    if kind == "memory":
+        _throttle = MemoryThrottle()
+    elif kind == "redis":
+        _throttle = RedisThrottle(config.setting(app, "THROTTLE_REDIS_URL", None))
+    else:
+        raise ValueError(f"Unknown THROTTLE_BACKEND '{kind}' (expected memory or redis)")
+
+    @app.errorhandler(PasswordPoolBusy)
+    def handle_password_pool_busy(e):
+        response = jsonify({"error": str(e)})
+        response.status_code = 503
+        response.headers["Retry-After"] = "1"
+        return response
+
+    @app.errorhandler(LoginThrottled)
+    def handle_login_throttled(e):
+        response = jsonify({"error": str(e)})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(e.retry_after)
+        return response
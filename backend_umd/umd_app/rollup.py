@@ -0,0 +1,263 @@
+from decimal import Decimal
+
+import click
+from flask.cli import AppGroup
+
+from umd_app.db import IntegrityError, pooled_connection
+
+# branch_month_rollup keeps one row per (branch, year, month) with the running
+# budget/expense totals and bill/alert counts, so the dashboard and report
+# routes read a handful of pre-aggregated rows instead of re-summing
+# utility_bills and budget on every call. The write paths keep it current by
+# calling the record_* helpers inside their own transaction.
+#
+# branch_type_month_rollup splits the expense side further by utility type,
+# for the alert engine's per-type rules.
+
+
+def _decimal(value):
+    return Decimal(str(value)) if value is not None else Decimal(0)
+
+
+def apply_delta(cursor, branch_id, year, month, budget=0, expense=0, bills=0, alerts=0):
+    if year is None or month is None:
+        return
+    params = (_decimal(budget), _decimal(expense), int(bills), int(alerts),
+              branch_id, int(year), int(month))
+    update_sql = """
+        UPDATE branch_month_rollup
+        SET budget_total = budget_total + ?,
+            expense_total = expense_total + ?,
+            bill_count = bill_count + ?,
+            alert_count = alert_count + ?
+        WHERE branch_id = ? AND year = ? AND month = ?
+    """
+    cursor.execute(update_sql, params)
+    if cursor.rowcount:
+        return
+    try:
+        cursor.execute("""
+            INSERT INTO branch_month_rollup
+                (budget_total, expense_total, bill_count, alert_count, branch_id, year, month)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, params)
+    except IntegrityError:
+        # Another request created the row between our UPDATE and INSERT
+        cursor.execute(update_sql, params)
+
+
+def apply_type_delta(cursor, branch_id, utility_type_id, year, month, expense=0, bills=0):
+    if year is None or month is None or utility_type_id is None:
+        return
+    params = (_decimal(expense), int(bills), branch_id, int(utility_type_id), int(year), int(month))
+    update_sql = """
+        UPDATE branch_type_month_rollup
+        SET expense_total = expense_total + ?,
+            bill_count = bill_count + ?
+        WHERE branch_id = ? AND utility_type_id = ? AND year = ? AND month = ?
+    """
+    cursor.execute(update_sql, params)
+    if cursor.rowcount:
+        return
+    try:
+        cursor.execute("""
+            INSERT INTO branch_type_month_rollup
+                (expense_total, bill_count, branch_id, utility_type_id, year, month)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, params)
+    except IntegrityError:
+        cursor.execute(update_sql, params)
+
+
+def record_bill(cursor, branch_id, year, month, amount, utility_type_id=None):
+    apply_delta(cursor, branch_id, year, month, expense=amount, bills=1)
+    apply_type_delta(cursor, branch_id, utility_type_id, year, month, expense=amount, bills=1)
+
+
+def remove_bill(cursor, branch_id, year, month, amount, utility_type_id=None):
+    apply_delta(cursor, branch_id, year, month, expense=-_decimal(amount), bills=-1)
+    apply_type_delta(cursor, branch_id, utility_type_id, year, month,
+                     expense=-_decimal(amount), bills=-1)
+
+
+def record_budget(cursor, branch_id, year, month, amount):
+    apply_delta(cursor, branch_id, year, month, budget=amount)
+
+
+def remove_budget(cursor, branch_id, year, month, amount):
+    apply_delta(cursor, branch_id, year, month, budget=-_decimal(amount))
+
+
+def record_alert(cursor, branch_id, year, month):
+    apply_delta(cursor, branch_id, year, month, alerts=1)
+
+
+def compute_from_source(cursor):
+    # Recomputes every rollup row from the raw tables:
+    # {(branch_id, year, month): [budget_total, expense_total, bill_count, alert_count]}
+    totals = {}
+
+    def row_for(branch_id, year, month):
+        return totals.setdefault((branch_id, int(year), int(month)),
+                                 [Decimal(0), Decimal(0), 0, 0])
+
+    cursor.execute("""
+        SELECT branch_id, year, month, SUM(total_budget)
+        FROM budget
+        WHERE status = 1 AND year IS NOT NULL AND month IS NOT NULL
+        GROUP BY branch_id, year, month
+    """)
+    for branch_id, year, month, budget_total in cursor.fetchall():
+        row_for(branch_id, year, month)[0] += _decimal(budget_total)
+
+    cursor.execute("""
+        SELECT branch_id, year, month, SUM(amount), COUNT(*)
+        FROM utility_bills
+        WHERE status = 1
+        GROUP BY branch_id, year, month
+    """)
+    for branch_id, year, month, expense_total, bill_count in cursor.fetchall():
+        row = row_for(branch_id, year, month)
+        row[1] += _decimal(expense_total)
+        row[2] += bill_count
+
+    # Bill alerts belong to the bill's period, the others to the month they are dated
+    cursor.execute("""
+        SELECT a.branch_id,
+               ISNULL(ub.year, YEAR(a.created_at)) AS period_year,
+               ISNULL(ub.month, MONTH(a.created_at)) AS period_month,
+               COUNT(*)
+        FROM alerts a
+        LEFT JOIN utility_bills ub ON ub.id = a.utility_bill_id
+        GROUP BY a.branch_id, ISNULL(ub.year, YEAR(a.created_at)), ISNULL(ub.month, MONTH(a.created_at))
+    """)
+    for branch_id, year, month, alert_count in cursor.fetchall():
+        row_for(branch_id, year, month)[3] += alert_count
+
+    return totals
+
+
+def compute_types_from_source(cursor):
+    # {(branch_id, utility_type_id, year, month): [expense_total, bill_count]}
+    cursor.execute("""
+        SELECT branch_id, utility_type_id, year, month, SUM(amount), COUNT(*)
+        FROM utility_bills
+        WHERE status = 1
+        GROUP BY branch_id, utility_type_id, year, month
+    """)
+    return {
+        (r[0], r[1], int(r[2]), int(r[3])): [_decimal(r[4]), r[5]]
+        for r in cursor.fetchall()
+    }
+
+
+def load_rollup(cursor):
+    cursor.execute("""
+        SELECT branch_id, year, month, budget_total, expense_total, bill_count, alert_count
+        FROM branch_month_rollup
+    """)
+    return {
+        (r[0], int(r[1]), int(r[2])): [_decimal(r[3]), _decimal(r[4]), r[5], r[6]]
+        for r in cursor.fetchall()
+    }
+
+
+def load_type_rollup(cursor):
+    cursor.execute("""
+        SELECT branch_id, utility_type_id, year, month, expense_total, bill_count
+        FROM branch_type_month_rollup
+    """)
+    return {
+        (r[0], r[1], int(r[2]), int(r[3])): [_decimal(r[4]), r[5]]
+        for r in cursor.fetchall()
+    }
+
+
+def _differs(want, have):
+    if isinstance(want, Decimal) or isinstance(have, Decimal):
+        return abs(_decimal(want) - _decimal(have)) >= Decimal("0.01")
+    return want != have
+
+
+def find_drift(expected, actual, zero=(Decimal(0), Decimal(0), 0, 0)):
+    drift = []
+    for key in sorted(set(expected) | set(actual)):
+        want = expected.get(key, list(zero))
+        have = actual.get(key, list(zero))
+        if any(_differs(w, h) for w, h in zip(want, have)):
+            drift.append((key, want, have))
+    return drift
+
+
+def rebuild(cursor):
+    totals = compute_from_source(cursor)
+    cursor.execute("DELETE FROM branch_month_rollup")
+    if totals:
+        cursor.fast_executemany = True
+        cursor.executemany("""
+            INSERT INTO branch_month_rollup
+                (branch_id, year, month, budget_total, expense_total, bill_count, alert_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(key[0], key[1], key[2], *values) for key, values in totals.items()])
+
+    type_totals = compute_types_from_source(cursor)
+    cursor.execute("DELETE FROM branch_type_month_rollup")
+    if type_totals:
+        cursor.fast_executemany = True
+        cursor.executemany("""
+            INSERT INTO branch_type_month_rollup
+                (branch_id, utility_type_id, year, month, expense_total, bill_count)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(*key, *values) for key, values in type_totals.items()])
+    return len(totals)
+
+
+rollup_cli = AppGroup('rollup', help="Maintain the branch_month_rollup tables.")
+
+
+@rollup_cli.command('rebuild')
+def rebuild_command():
+    """Recompute branch_month_rollup (and the per-type split) from budget,
+    utility_bills and alerts.
+
+    Run it once after creating the table, and preferably while no bills or
+    budgets are being written.
+    """
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            count = rebuild(cursor)
+            conn.commit()
+        finally:
+            cursor.close()
+    click.echo(f"Rebuilt {count} rollup rows.")
+
+
+@rollup_cli.command('verify')
+def verify_command():
+    """Compare branch_month_rollup with the raw tables and report drift."""
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            drift = find_drift(compute_from_source(cursor), load_rollup(cursor))
+            type_drift = find_drift(compute_types_from_source(cursor), load_type_rollup(cursor),
+                                    zero=(Decimal(0), 0))
+        finally:
+            cursor.close()
+
+    if not drift and not type_drift:
+        click.echo("branch_month_rollup matches the source tables.")
+        return
+
+    if drift:
+        click.echo(f"{len(drift)} rollup rows drifted "
+                   "(budget_total, expense_total, bill_count, alert_count):")
+        for (branch_id, year, month), want, have in drift:
+            click.echo(f"  branch {branch_id} {year}-{month:02d}: "
+                       f"expected {tuple(str(v) for v in want)}, found {tuple(str(v) for v in have)}")
+    if type_drift:
+        click.echo(f"{len(type_drift)} per-type rollup rows drifted (expense_total, bill_count):")
+        for (branch_id, type_id, year, month), want, have in type_drift:
+            click.echo(f"  branch {branch_id} type {type_id} {year}-{month:02d}: "
+                       f"expected {tuple(str(v) for v in want)}, found {tuple(str(v) for v in have)}")
+    raise SystemExit(1)
@@ -1,4 +1,5 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, g, request, jsonify, session
+from umd_app import authz, cache, events
 from umd_app.db import get_connection
 from datetime import datetime, timedelta
 
@@ -6,6 +7,7 @@ alert_bp = Blueprint('alert_bp', __name__)
 
 
 @alert_bp.route('/alerts', methods=['GET'])
+@cache.conditional_get
 def get_active_alerts():
     identity = session.get('user')
     role_id = identity.get("role_id")
@@ -67,29 +69,35 @@ def get_active_alerts():
 
 
 @alert_bp.route('/budget-reminders/today', methods=["GET"])
+@authz.load_context
 def get_today_budget_reminders():
-    identity = session.get('user')
-    role_id = identity.get("role_id")
-    business_id = identity.get("business_id")
+    ctx = g.authz
+    if not (ctx.is_admin or ctx.is_manager):
+        return jsonify({"error": "Unauthorized"}), 403
 
     try:
         conn = get_connection()
         cursor = conn.cursor()
-        today = datetime.now().strftime("%Y-%m-%d")
+        # A half-open range on created_at, so ix_alerts_type_created is used
+        today = datetime.combine(datetime.now().date(), datetime.min.time())
 
         query = """
             SELECT a.alertsid, a.message, a.created_at, b.branch_name
             FROM alerts a
             JOIN branches b ON a.branch_id = b.branch_id
-            WHERE CAST(a.created_at AS DATE) = ?
-            AND a.alert_type = 'budget_reminder'
+            WHERE a.alert_type = 'budget_reminder'
+            AND a.created_at >= ? AND a.created_at < ?
             AND a.status = 1
+            AND b.business_id = ?
         """
-        if role_id == 1 and role_id == 2:
-            query += " AND b.business_id = ?"
-            cursor.execute(query, (today, business_id))
-        else:
-            return jsonify({"error": "Unauthorized"}), 403
+        params = [today, today + timedelta(days=1), ctx.business_id]
+        if ctx.is_manager:
+            # Managers only see reminders for the branches they handle
+            if not ctx.branch_ids:
+                return jsonify({"alerts": []}), 200
+            query += f" AND a.branch_id IN ({', '.join('?' for _ in ctx.branch_ids)})"
+            params.extend(ctx.branch_ids)
+        cursor.execute(query, params)
 
         rows = cursor.fetchall()
         alerts = [{
@@ -180,11 +188,11 @@ def filter_alerts():
 
 
 @alert_bp.route('/alerts/resolve/<int:alert_id>', methods=['PATCH'])
+@authz.load_context
 def resolve_alert(alert_id):
-    identity = session.get('user')
-    role_id = identity.get("role_id")
-    business_id = identity.get("business_id")
-    user_id = identity.get("user_id")
+    ctx = g.authz
+    role_id = ctx.role_id
+    business_id = ctx.business_id
 
     if not all([role_id, business_id]):
         return jsonify({"error": "Missing role or business context."}), 400
@@ -193,32 +201,24 @@ def resolve_alert(alert_id):
         conn = get_connection()
         cursor = conn.cursor()
 
-        # Get branch & business linked to the alert
+        # Get the branch linked to the alert
         cursor.execute("""
-            SELECT a.branch_id, b.business_id, b.handled_by
-            FROM alerts a
-            JOIN branches b ON a.branch_id = b.branch_id
-            WHERE a.alertsid = ? AND a.status = 1 AND is_resolved = 0
+            SELECT branch_id FROM alerts
+            WHERE alertsid = ? AND status = 1 AND is_resolved = 0
         """, (alert_id,))
         row = cursor.fetchone()
 
         if not row:
             return jsonify({"error": "Alert not found, already resolved or already deleted."}), 404
 
-        alert_branch_id, alert_business_id, handled_by = row
+        alert_branch_id = row[0]
 
-        if role_id == 1:
-            # Admin can resolve only if alert is in their business
-            if alert_business_id != business_id:
-                return jsonify({"error": "Unauthorized."}), 403
-
-        elif role_id == 2:
-            # Manager can resolve only if alert belongs to their branch
-            if alert_business_id != business_id or handled_by != user_id:
-                return jsonify({"error": "Unauthorized."}), 403
-
-        else:
+        if role_id not in (1, 2):
             return jsonify({"error": "Invalid role."}), 403
+        # Admins can resolve alerts anywhere in their business, managers only
+        # for their own branch
+        if not ctx.can_access(alert_branch_id):
+            return jsonify({"error": "Unauthorized."}), 403
 
         # Mark the alert as resolved
         cursor.execute("""
@@ -227,6 +227,7 @@ def resolve_alert(alert_id):
             WHERE alertsid = ?
         """, (alert_id,))
         conn.commit()
+        cache.data_changed(business_id)
 
         return jsonify({"message": "Alert resolved successfully."}), 200
 
@@ -240,11 +241,12 @@ def resolve_alert(alert_id):
 
 
 @alert_bp.route('/alerts/delete/<int:alert_id>', methods=['PATCH'])
+@authz.load_context
 def delete_alert(alert_id):
-    data = request.json or {}
-    role_id = data.get("role_id")
-    business_id = data.get("business_id")
-    user_id = data.get("user_id")
+    # Role and business come from the session, not the request body
+    ctx = g.authz
+    role_id = ctx.role_id
+    business_id = ctx.business_id
 
     if not all([role_id, business_id]):
         return jsonify({"error": "Missing role or business context."}), 400
@@ -253,28 +255,22 @@ def delete_alert(alert_id):
         conn = get_connection()
         cursor = conn.cursor()
 
-    # Get branch, business, and manager info from alert
+    # Get the branch linked to the alert
         cursor.execute("""
-            SELECT a.branch_id, b.business_id, b.handled_by
-            FROM alerts a
-            JOIN branches b ON a.branch_id = b.branch_id
-            WHERE a.alertsid = ? AND a.status = 1
+            SELECT branch_id FROM alerts
+            WHERE alertsid = ? AND status = 1
         """, (alert_id,))
         row = cursor.fetchone()
 
         if not row:
             return jsonify({"error": "Alert not found or already deleted."}), 404
 
-        branch_id, alert_business_id, handled_by = row
+        branch_id = row[0]
 
-        if role_id == 1:
-            if alert_business_id != business_id:
-                return jsonify({"error": "Unauthorized."}), 403
-        elif role_id == 2:
-            if alert_business_id != business_id or handled_by != user_id:
-                return jsonify({"error": "Unauthorized."}), 403
-        else:
+        if role_id not in (1, 2):
             return jsonify({"error": "Invalid role."}), 403
+        if not ctx.can_access(branch_id):
+            return jsonify({"error": "Unauthorized."}), 403
 
     # Soft delete the alert
         cursor.execute("""
@@ -283,6 +279,8 @@ def delete_alert(alert_id):
             WHERE alertsid = ?
         """, (alert_id,))
         conn.commit()
+        cache.data_changed(business_id)
+        events.unread_changed(business_id)
 
         return jsonify({"message": "Alert soft-deleted successfully."}), 200
 
@@ -317,6 +315,36 @@ def get_unread_alerts_count():
         conn.close()
 
 
+def _event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+@alert_bp.route('/stream', methods=['GET'])
+@authz.load_context
+def alert_stream():
+    # Server-Sent Events: new alerts and unread-count changes as they happen.
+    # EventSource sends Last-Event-ID when it reconnects.
+    since = _event_id(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    return events.stream_response(g.authz, since)
+
+
+@alert_bp.route('/poll', methods=['GET'])
+@authz.load_context
+def poll_alert_events():
+    # Long-poll fallback for clients that cannot keep an event stream open:
+    # call without since for the current count and a cursor, then with
+    # ?since=<cursor> to wait for the next events
+    since = _event_id(request.args.get('since'))
+    try:
+        timeout = min(max(float(request.args.get('timeout', 25)), 0), 30)
+    except ValueError:
+        return jsonify({"error": "timeout must be a number of seconds"}), 400
+    return jsonify(events.wait(g.authz, since, timeout)), 200
+
+
 @alert_bp.route('/mark-viewed', methods=['PATCH'])
 def mark_alerts_as_viewed():
     identity = session.get('user')
@@ -326,13 +354,14 @@ def mark_alerts_as_viewed():
     cursor = conn.cursor()
     try:
         cursor.execute("""
-            UPDATE a
-            SET a.is_viewed = 1
-            FROM alerts a
-            JOIN branches b ON a.branch_id = b.branch_id
-            WHERE b.business_id = ? AND a.status = 1 AND ISNULL(a.is_viewed, 0) = 0
+            UPDATE alerts
+            SET is_viewed = 1
+            WHERE branch_id IN (SELECT branch_id FROM branches WHERE business_id = ?)
+                AND status = 1 AND ISNULL(is_viewed, 0) = 0
         """, (business_id,))
         conn.commit()
+        cache.data_changed(business_id)
+        events.unread_changed(business_id)
         return jsonify({"message": "Alerts marked as viewed."}), 200
     except Exception as e:
         conn.rollback()
@@ -343,11 +372,11 @@ def mark_alerts_as_viewed():
 
 
 @alert_bp.route('/alerts/reopen/<int:alert_id>', methods=['PATCH'])
+@authz.load_context
 def reopen_alert(alert_id):
-    identity = session.get('user')
-    role_id = identity.get("role_id")
-    business_id = identity.get("business_id")
-    user_id = identity.get("user_id")
+    ctx = g.authz
+    role_id = ctx.role_id
+    business_id = ctx.business_id
 
     if not all([role_id, business_id]):
         return jsonify({"error": "Missing role or business context."}), 400
@@ -356,32 +385,26 @@ def reopen_alert(alert_id):
         conn = get_connection()
         cursor = conn.cursor()
 
-        # Fetch alert and branch details
+        # Fetch alert details
         cursor.execute("""
-            SELECT a.branch_id, b.business_id, b.handled_by, a.is_resolved
-            FROM alerts a
-            JOIN branches b ON a.branch_id = b.branch_id
-            WHERE a.alertsid = ? AND a.status = 1
+            SELECT branch_id, is_resolved FROM alerts
+            WHERE alertsid = ? AND status = 1
         """, (alert_id,))
         row = cursor.fetchone()
 
         if not row:
             return jsonify({"error": "Alert not found or deleted."}), 404
 
-        branch_id, alert_business_id, handled_by, is_resolved = row
+        branch_id, is_resolved = row
+
+        if role_id not in (1, 2):
+            return jsonify({"error": "Invalid role."}), 403
+        if not ctx.can_access(branch_id):
+            return jsonify({"error": "Unauthorized."}), 403
 
         if is_resolved == 0:
             return jsonify({"message": "Alert is already active."}), 200
 
-        if role_id == 1:
-            if alert_business_id != business_id:
-                return jsonify({"error": "Unauthorized."}), 403
-        elif role_id == 2:
-            if alert_business_id != business_id or handled_by != user_id:
-                return jsonify({"error": "Unauthorized."}), 403
-        else:
-            return jsonify({"error": "Invalid role."}), 403
-
         # Reopen the alert
         cursor.execute("""
             UPDATE alerts
@@ -389,6 +412,7 @@ def reopen_alert(alert_id):
             WHERE alertsid = ?
         """, (alert_id,))
         conn.commit()
+        cache.data_changed(business_id)
 
         return jsonify({"message": "Alert reopened successfully."}), 200
 
@@ -2,8 +2,8 @@ from umd_app.db import get_connection  # adjust import if needed
 from datetime import timedelta
 from flask import Blueprint, request, jsonify, session
 # from umd_app.models.user_model import cleanup_user_references
+from umd_app import authz, passwords, sessions
 from umd_app.db import get_connection
-import bcrypt
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -35,8 +35,7 @@ def register_business():
     if not all([business_name, industry, contact_person, user_email, username, contact_no, raw_password]):
         return jsonify({"error": "Missing required fields."}), 400
 
-    hashed_password = bcrypt.hashpw(raw_password.encode(
-        'utf-8'), bcrypt.gensalt()).decode('utf-8')
+    hashed_password = passwords.hash_password(raw_password)
 
     try:
         conn = get_connection()
@@ -274,6 +273,9 @@ def add_user():
         if not all([username, email, contact_no, password, role_id]):
             return jsonify({"error": "Missing required fields."}), 400
 
+        # Hash password (on the bcrypt pool, before taking a connection)
+        hashed_pw = passwords.hash_password(password)
+
         conn = get_connection()
         cursor = conn.cursor()
 
@@ -285,10 +287,6 @@ def add_user():
         if existing_user:
             return jsonify({"error": "A user with this username or email already exists."}), 409
 
-        # Hash password
-        hashed_pw = bcrypt.hashpw(password.encode(
-            'utf-8'), bcrypt.gensalt()).decode('utf-8')
-
         # Insert new user
         cursor.execute("""
             INSERT INTO users (username, email, contact_no, userpassword, role_id, business_id)
@@ -298,6 +296,8 @@ def add_user():
         conn.commit()
         return jsonify({"message": "User added successfully."}), 201
 
+    except passwords.PasswordPoolBusy:
+        raise  # 503, see passwords.init_app
     except Exception as e:
         if conn:
             conn.rollback()
@@ -354,6 +354,8 @@ def delete_user(user_id):
         # 4. Safe to delete
         cursor.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
         conn.commit()
+        authz.invalidate(current_business_id)
+        sessions.invalidate_user(user_id)
         return jsonify({"message": f"User ID {user_id} deleted successfully."}), 200
 
     except Exception as e:
@@ -430,6 +432,9 @@ def update_user(user_id):
         update_query = f"UPDATE users SET {', '.join(fields)} WHERE user_id = ?"
         cursor.execute(update_query, values)
         conn.commit()
+        authz.invalidate(current_business_id)
+        # Role and contact details are copied into the session at login
+        sessions.invalidate_user(user_id)
 
         return jsonify({"message": f"User ID {user_id} updated successfully."}), 200
 
@@ -455,6 +460,13 @@ def login():
     if not email or not password:
         return jsonify({"error": "Email and password are required"}), 400
 
+    # Accounts and addresses with too many recent failures get 429 before
+    # any bcrypt work is done
+    address = request.remote_addr
+    passwords.check_throttle(email, address)
+
+    conn = None
+    cursor = None
     try:
         conn = get_connection()
         cursor = conn.cursor()
@@ -467,50 +479,72 @@ def login():
         """, (email,))
         row = cursor.fetchone()
 
-        if not row:
-            return jsonify({"error": "Invalid email or password"}), 401
-
-        user_id, username, hashed_password, role_id, business_id = row
-
-        if not bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8')):
-            return jsonify({"error": "Invalid email or password"}), 401
-
         # Get branch_id for branch managers (role_id == 2)
         branch_id = None
-        if role_id == 2:
+        if row and row[3] == 2:
             cursor.execute(
-                "SELECT branch_id FROM branches WHERE handled_by = ?", (user_id,))
+                "SELECT branch_id FROM branches WHERE handled_by = ?", (row[0],))
             branch_row = cursor.fetchone()
             if branch_row:
                 branch_id = branch_row[0]
 
-        # Store session
-        session.permanent = True  # So session lasts beyond browser close
-        session['user'] = {
-            "user_id": user_id,
-            "username": username,
-            "role_id": role_id,
-            "business_id": business_id,
-            "branch_id": branch_id
-        }
-
-        print("Session created for:", session['user'])
-        # identity = session.get('user')print("Session Identity:", identity)
-
-        return jsonify({
-            "message": "Login successful",
-            "user": session['user']
-        }), 200
-
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
     finally:
+        # Released before the password check, which may wait for the bcrypt pool
         if cursor:
             cursor.close()
         if conn:
             conn.close()
 
+    if not row or not passwords.check_password(password, row[2]):
+        passwords.login_failed(email, address)
+        return jsonify({"error": "Invalid email or password"}), 401
+
+    user_id, username, hashed_password, role_id, business_id = row
+    passwords.login_succeeded(email)
+
+    # Stored under a different BCRYPT_ROUNDS: rehash while we have the password
+    if passwords.needs_rehash(hashed_password):
+        try:
+            rehash_password(user_id, hashed_password, password)
+        except Exception as e:
+            print("Password rehash failed:", e)  # tried again at the next login
+
+    # Store session
+    session.permanent = True  # So session lasts beyond browser close
+    session['user'] = {
+        "user_id": user_id,
+        "username": username,
+        "role_id": role_id,
+        "business_id": business_id,
+        "branch_id": branch_id
+    }
+
+    print("Session created for:", session['user'])
+    # identity = session.get('user')print("Session Identity:", identity)
+
+    return jsonify({
+        "message": "Login successful",
+        "user": session['user']
+    }), 200
+
+
+def rehash_password(user_id, old_hash, password):
+    new_hash = passwords.hash_password(password)
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        # Unless the password was changed meanwhile
+        cursor.execute("""
+            UPDATE users SET userpassword = ? WHERE user_id = ? AND userpassword = ?
+        """, (new_hash, user_id, old_hash))
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
 
 @auth_bp.route('/logout', methods=['POST'])
 def logout():
@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify, session
-from umd_app.db import get_connection
-import pyodbc
+from umd_app import authz, cache, sessions
+from umd_app.db import get_connection, IntegrityError
 
 branch_bp = Blueprint('branch_bp', __name__)
 # token needed
@@ -67,6 +67,10 @@ def add_branch():
         print("Rows updated for availability:", cursor.rowcount)
 
         conn.commit()
+        cache.data_changed(current_business_id)
+        authz.invalidate(current_business_id)
+        # The manager's session was built without a branch; make them log in again
+        sessions.invalidate_user(handled_by)
         return jsonify({"message": "Branch added successfully and manager marked unavailable."}), 201
 
     except Exception as e:
@@ -269,6 +273,7 @@ def set_budget_alert_threshold(branch_id):
         """, (new_threshold, branch_id, business_id))
 
     conn.commit()
+    cache.data_changed(business_id)
     cursor.close()
     conn.close()
 
@@ -409,9 +414,15 @@ def update_branch(branch_id):
                 "UPDATE users SET availablecurrently = 0 WHERE user_id = ?", (handled_by,))
 
         conn.commit()
+        cache.data_changed(current_business_id)
+        authz.invalidate(current_business_id)
+        # Sessions carry the manager's branch_id; end them for both managers
+        if old_manager != handled_by:
+            sessions.invalidate_user(old_manager)
+            sessions.invalidate_user(handled_by)
         return jsonify({"message": "Branch updated successfully."}), 200
 
-    except pyodbc.IntegrityError:
+    except IntegrityError:
         return jsonify({"error": "This manager is already handling another branch."}), 400
 
     except Exception as e:
@@ -465,6 +476,9 @@ def soft_delete_branch(branch_id):
             """, (handled_by,))
 
         conn.commit()
+        cache.data_changed(current_business_id)
+        authz.invalidate(current_business_id)
+        sessions.invalidate_user(handled_by)
         return jsonify({"message": f"Branch {branch_id} soft-deleted and manager unassigned."}), 200
 
     except Exception as e:
@@ -511,6 +525,8 @@ def reactivate_branch(branch_id):
             UPDATE branches SET status = 1 WHERE branch_id = ?
         """, (branch_id,))
         conn.commit()
+        cache.data_changed(current_business_id)
+        authz.invalidate(current_business_id)
 
         return jsonify({"message": f"Branch ID {branch_id} reactivated successfully."}), 200
 
@@ -1,7 +1,7 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, g, request, jsonify, session
 from umd_app.db import get_connection
+from umd_app import alert_engine, authz, cache, export, rollup
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
 
 budget_bp = Blueprint('budget_bp', __name__)
 
@@ -44,20 +44,13 @@ def add_budget():
             INSERT INTO budget (branch_id, year, month, total_budget, allocated_by)
             VALUES (?, ?, ?, ?, ?)
         """, (branch_id, year, month, total_budget, allocated_by))
-
-        # Insert future alert for same date next month
-        next_month_same_day = datetime.now() + relativedelta(months=1)
-
-        cursor.execute("""
-            INSERT INTO alerts (branch_id, utility_bill_id, alert_type, severity, message, created_at)
-            VALUES (?, NULL, 'budget_reminder', 'medium', ?, ?)
-        """, (
-            branch_id,  # from the inserted budget
-            f"Reminder to allocate budget again to this branch.",
-            next_month_same_day.strftime("%Y-%m-%d")
-        ))
+        rollup.record_budget(cursor, branch_id, year, month, total_budget)
+        # Bills may already be over the new budget's threshold
+        outbox_id = alert_engine.enqueue(cursor, alert_engine.BUDGET, branch_id, year, month)
 
         conn.commit()
+        cache.data_changed(business_id)
+        alert_engine.notify(outbox_id)
         return jsonify({"message": "Budget added successfully."}), 201
 
     except Exception as e:
@@ -89,11 +82,11 @@ def view_budgets():
 
         query = """
             SELECT bg.id, bg.branch_id, b.branch_name, bg.year, bg.month, bg.total_budget,
-                   ISNULL(SUM(ub.amount), 0) as total_spent
+                   ISNULL(r.expense_total, 0) as total_spent
             FROM budget bg
             JOIN branches b ON bg.branch_id = b.branch_id
-            LEFT JOIN utility_bills ub 
-                ON bg.branch_id = ub.branch_id AND bg.year = ub.year AND bg.month = ub.month
+            LEFT JOIN branch_month_rollup r
+                ON bg.branch_id = r.branch_id AND bg.year = r.year AND bg.month = r.month
             WHERE b.status = 1
         """
         params = []
@@ -118,7 +111,6 @@ def view_budgets():
             params.append(branch_id)
 
         query += """
-            GROUP BY bg.id, bg.branch_id, b.branch_name, bg.year, bg.month, bg.total_budget
             ORDER BY bg.year DESC, bg.month DESC
             OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
         """
@@ -170,7 +162,8 @@ def update_budget(budget_id):
 
         # Fetch original budget entry
         cursor.execute("""
-            SELECT bg.id, bg.created_at, b.business_id, bg.branch_id
+            SELECT bg.id, bg.created_at, b.business_id, bg.branch_id,
+                   bg.year, bg.month, bg.total_budget, bg.status
             FROM budget bg
             JOIN branches b ON bg.branch_id = b.branch_id
             WHERE bg.id = ?
@@ -180,7 +173,7 @@ def update_budget(budget_id):
         if not row:
             return jsonify({"error": "Budget not found."}), 404
 
-        _, created_at, budget_business_id, branch_id = row
+        _, created_at, budget_business_id, branch_id, old_year, old_month, old_total, budget_status = row
 
         if budget_business_id != business_id:
             return jsonify({"error": "Unauthorized. Only update your own business"}), 403
@@ -193,6 +186,17 @@ def update_budget(budget_id):
         if not reallocate and datetime.now() > created_at + timedelta(hours=48):
             return jsonify({"error": "Cannot edit now. 48-hour update window expired."}), 403
 
+        # Fields left out keep their current value
+        if total_budget is None:
+            total_budget = old_total
+        try:
+            year = int(year if year is not None else old_year)
+            month = int(month if month is not None else old_month)
+        except (TypeError, ValueError):
+            return jsonify({"error": "year and month must be numbers."}), 400
+        if not 1 <= month <= 12:
+            return jsonify({"error": "month must be between 1 and 12."}), 400
+
         # Prepare update query
         if reallocate:
             # Also update created_at to now
@@ -209,19 +213,19 @@ def update_budget(budget_id):
                 WHERE id = ?
             """, (total_budget, month, year, budget_id))
 
-        # Insert future alert for same date next month
-        next_month_same_day = datetime.now() + relativedelta(months=1)
-
-        cursor.execute("""
-            INSERT INTO alerts (branch_id, utility_bill_id, alert_type, severity, message, created_at)
-            VALUES (?, NULL, 'budget_reminder', 'medium', ?, ?)
-        """, (
-            branch_id,  # from the inserted budget
-            f"Reminder to allocate budget again to this branch.",
-            next_month_same_day.strftime("%Y-%m-%d")
-        ))
+        # Move the budget out of its old period and into the new one
+        outbox_ids = []
+        if budget_status == 1:
+            rollup.remove_budget(cursor, branch_id, old_year, old_month, old_total)
+            rollup.record_budget(cursor, branch_id, year, month, total_budget)
+            periods = {(int(old_year), int(old_month)), (year, month)}
+            for period_year, period_month in sorted(periods):
+                outbox_ids.append(alert_engine.enqueue(
+                    cursor, alert_engine.BUDGET, branch_id, period_year, period_month))
 
         conn.commit()
+        cache.data_changed(business_id)
+        alert_engine.notify(*outbox_ids)
         return jsonify({"message": "Budget updated successfully."}), 200
 
     except Exception as e:
@@ -245,15 +249,16 @@ def get_budget(budget_id):
         conn = get_connection()
         cursor = conn.cursor()
 
+        # Spent comes from the period's pre-aggregated rollup row, so the budget
+        # row is never multiplied by the period's bills
         cursor.execute("""
             SELECT b.branch_name, bg.year, bg.month, bg.total_budget, bg.created_at,
-                   ISNULL(SUM(ub.amount), 0) as total_spent
+                   ISNULL(r.expense_total, 0) as total_spent
             FROM budget bg
             JOIN branches b ON bg.branch_id = b.branch_id
-            LEFT JOIN utility_bills ub 
-                ON bg.branch_id = ub.branch_id AND bg.year = ub.year AND bg.month = ub.month
+            LEFT JOIN branch_month_rollup r
+                ON bg.branch_id = r.branch_id AND bg.year = r.year AND bg.month = r.month
             WHERE bg.id = ? AND b.business_id = ?
-            GROUP BY b.branch_name, bg.year, bg.month, bg.total_budget, bg.created_at
         """, (budget_id, business_id))
 
         row = cursor.fetchone()
@@ -275,31 +280,22 @@ def get_budget(budget_id):
 
 
 @budget_bp.route('/budgets/history/<int:branch_id>', methods=['GET'])
+@authz.load_context
 def budget_history(branch_id):
-    role_id = request.args.get("role_id", type=int)
-    business_id = request.args.get("business_id", type=int)
-    user_id = request.args.get("user_id", type=int)
+    # Role, business and user come from the session; the old role_id /
+    # business_id / user_id query arguments are ignored
+    ctx = g.authz
     page = request.args.get("page", 1, type=int)
     page_size = request.args.get("page_size", 10, type=int)
 
+    # Authorization checks
+    if not ctx.can_access(branch_id):
+        return jsonify({"error": "Access denied." if ctx.is_manager else "Unauthorized."}), 403
+
     try:
         conn = get_connection()
         cursor = conn.cursor()
 
-        # Authorization checks
-        if role_id == 2:
-            cursor.execute(
-                "SELECT handled_by FROM branches WHERE branch_id = ?", (branch_id,))
-            row = cursor.fetchone()
-            if not row or row[0] != user_id:
-                return jsonify({"error": "Access denied."}), 403
-        elif role_id == 1:
-            cursor.execute(
-                "SELECT business_id FROM branches WHERE branch_id = ?", (branch_id,))
-            row = cursor.fetchone()
-            if not row or row[0] != business_id:
-                return jsonify({"error": "Unauthorized."}), 403
-
         # Count total rows for pagination metadata
         cursor.execute(
             "SELECT COUNT(*) FROM budget WHERE branch_id = ?", (branch_id,))
@@ -310,12 +306,11 @@ def budget_history(branch_id):
         # Fetch paginated history with total spent per row
         cursor.execute("""
             SELECT bg.year, bg.month, bg.total_budget,
-                ISNULL(SUM(ub.amount), 0) AS total_spent
+                ISNULL(r.expense_total, 0) AS total_spent
             FROM budget bg
-            LEFT JOIN utility_bills ub
-                ON bg.branch_id = ub.branch_id AND bg.year = ub.year AND bg.month = ub.month
+            LEFT JOIN branch_month_rollup r
+                ON bg.branch_id = r.branch_id AND bg.year = r.year AND bg.month = r.month
             WHERE bg.branch_id = ?
-            GROUP BY bg.year, bg.month, bg.total_budget
             ORDER BY bg.year DESC, bg.month DESC
             OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
         """, (branch_id, offset, page_size))
@@ -345,6 +340,56 @@ def budget_history(branch_id):
         cursor.close()
         conn.close()
 
+BUDGET_EXPORT_COLUMNS = ["budget_id", "branch_id", "branch_name", "year", "month", "total_budget",
+                         "total_spent", "allocated_by", "status", "created_at"]
+
+
+# Streams the budget history of every branch in scope as CSV or NDJSON
+@budget_bp.route('/budgets/export', methods=['GET'])
+@authz.load_context
+def export_budgets():
+    ctx = g.authz
+
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in export.FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    query = """
+        SELECT bg.id, bg.branch_id, b.branch_name, bg.year, bg.month, bg.total_budget,
+               ISNULL(r.expense_total, 0) AS total_spent, u.username AS allocated_by,
+               bg.status, bg.created_at
+        FROM budget bg
+        JOIN branches b ON bg.branch_id = b.branch_id
+        LEFT JOIN branch_month_rollup r
+            ON bg.branch_id = r.branch_id AND bg.year = r.year AND bg.month = r.month
+        LEFT JOIN users u ON bg.allocated_by = u.user_id
+        WHERE 1 = 1
+    """
+    params = []
+
+    if ctx.is_admin:
+        query += " AND b.business_id = ?"
+        params.append(ctx.business_id)
+    elif ctx.is_manager:
+        if not ctx.branch_ids:
+            return jsonify({"error": "No branch assigned or invalid user."}), 403
+        query += f" AND b.branch_id IN ({','.join('?' for _ in ctx.branch_ids)})"
+        params.extend(ctx.branch_ids)
+    else:
+        return jsonify({"error": "Unauthorized access."}), 403
+
+    for column in ("branch_id", "year", "month"):
+        value = request.args.get(column, type=int)
+        if value:
+            query += f" AND bg.{column} = ?"
+            params.append(value)
+
+    try:
+        return export.stream_query(query, params, "bg.id",
+                                   BUDGET_EXPORT_COLUMNS, fmt, "budget_history")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # GET /budgets/alerts going
 # show all alerts whether that be active/inactive/deleted
 
@@ -364,15 +409,13 @@ def budget_alerts():
 
         cursor.execute("""
             SELECT b.branch_name, bg.year, bg.month, bg.total_budget,
-                   ISNULL(SUM(ub.amount), 0) as total_expense,
-                   (ISNULL(SUM(ub.amount), 0) - bg.total_budget) as overspent
+                   r.expense_total as total_expense,
+                   (r.expense_total - bg.total_budget) as overspent
             FROM budget bg
             JOIN branches b ON bg.branch_id = b.branch_id
-            LEFT JOIN utility_bills ub 
-                ON bg.branch_id = ub.branch_id AND bg.year = ub.year AND bg.month = ub.month
-            WHERE b.business_id = ?
-            GROUP BY b.branch_name, bg.year, bg.month, bg.total_budget
-            HAVING ISNULL(SUM(ub.amount), 0) > bg.total_budget
+            JOIN branch_month_rollup r
+                ON bg.branch_id = r.branch_id AND bg.year = r.year AND bg.month = r.month
+            WHERE b.business_id = ? AND r.expense_total > bg.total_budget
         """, (business_id,))
 
         rows = cursor.fetchall()
@@ -1,12 +1,24 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, g, request, jsonify, session
 from umd_app.db import get_connection
+from umd_app import authz, cache, export, pagination
+from umd_app.pagination import InvalidCursor
 import calendar
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
 from statistics import mean
 
 dashboard_bp = Blueprint('dashboard_bp', __name__)
 
 
+def _month_bounds(today=None):
+    # [first day of this month, first day of next month)
+    today = today or datetime.now()
+    month_start = datetime(today.year, today.month, 1)
+    return month_start, month_start + relativedelta(months=1)
+
+
 @dashboard_bp.route('/summary', methods=['POST'])
+@cache.cached_response()
 def get_dashboard_summary():
     identity = session.get('user')
     role_id = identity.get("role_id")
@@ -18,65 +30,55 @@ def get_dashboard_summary():
     if not role_id or not business_id:
         return jsonify({"error": "Missing required data"}), 400
 
+    month_start, next_month_start = _month_bounds()
+
     conn = get_connection()
     cursor = conn.cursor()
 
     try:
+        # All four figures come back from one statement; the month filters are
+        # plain ranges on created_at/uploaded_at so the indexes can seek on them
         if role_id == 1:
-            cursor.execute(
-                "SELECT COUNT(*) FROM branches WHERE business_id = ?", (business_id,))
-            total_branches = cursor.fetchone()[0]
-
             cursor.execute("""
-                SELECT ISNULL(SUM(total_budget), 0)
-                FROM budget
-                WHERE branch_id IN (SELECT branch_id FROM branches WHERE business_id = ?)
-                    AND MONTH(created_at) = MONTH(GETDATE())
-                    AND YEAR(created_at) = YEAR(GETDATE())
-            """, (business_id,))
-            monthly_budget = cursor.fetchone()[0]
-
-            cursor.execute("""
-                SELECT ISNULL(SUM(amount), 0)
-                FROM utility_bills
-                WHERE branch_id IN (SELECT branch_id FROM branches WHERE business_id = ?) AND status = 1
-                    AND MONTH(uploaded_at) = MONTH(GETDATE())
-                    AND YEAR(uploaded_at) = YEAR(GETDATE())
-            """, (business_id,))
-            total_expenses = cursor.fetchone()[0]
-
-            cursor.execute("""
-                SELECT COUNT(*) FROM alerts
-                WHERE branch_id IN (SELECT branch_id FROM branches WHERE business_id = ?) 
-                      AND is_resolved = 0
-            """, (business_id,))
-            active_alerts = cursor.fetchone()[0]
+                WITH biz AS (
+                    SELECT branch_id FROM branches WHERE business_id = ?
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM biz) AS total_branches,
+                    (SELECT ISNULL(SUM(bg.total_budget), 0)
+                     FROM budget bg
+                     JOIN biz ON bg.branch_id = biz.branch_id
+                     WHERE bg.created_at >= ? AND bg.created_at < ?) AS monthly_budget,
+                    (SELECT ISNULL(SUM(ub.amount), 0)
+                     FROM utility_bills ub
+                     JOIN biz ON ub.branch_id = biz.branch_id
+                     WHERE ub.status = 1
+                        AND ub.uploaded_at >= ? AND ub.uploaded_at < ?) AS total_expenses,
+                    (SELECT COUNT(*)
+                     FROM alerts a
+                     JOIN biz ON a.branch_id = biz.branch_id
+                     WHERE a.is_resolved = 0) AS active_alerts
+            """, (business_id, month_start, next_month_start, month_start, next_month_start))
+            total_branches, monthly_budget, total_expenses, active_alerts = cursor.fetchone()
 
         elif role_id == 2:
             if not branch_id:
                 return jsonify({"error": "Branch ID is required for managers"}), 400
 
-            total_branches = 1
-
-            cursor.execute("""
-                SELECT ISNULL(SUM(total_budget), 0)
-                FROM budget
-                WHERE branch_id = ? 
-            """, (branch_id,))
-            monthly_budget = cursor.fetchone()[0]
-
             cursor.execute("""
-                SELECT ISNULL(SUM(amount), 0)
-                FROM utility_bills
-                WHERE branch_id = ? AND MONTH(uploaded_at) = MONTH(GETDATE()) AND YEAR(uploaded_at) = YEAR(GETDATE())
-            """, (branch_id,))
-            total_expenses = cursor.fetchone()[0]
-
-            cursor.execute("""
-                SELECT COUNT(*) FROM alerts
-                WHERE branch_id = ? AND is_resolved = 0
-            """, (branch_id,))
-            active_alerts = cursor.fetchone()[0]
+                SELECT
+                    (SELECT ISNULL(SUM(total_budget), 0)
+                     FROM budget
+                     WHERE branch_id = ?) AS monthly_budget,
+                    (SELECT ISNULL(SUM(amount), 0)
+                     FROM utility_bills
+                     WHERE branch_id = ?
+                        AND uploaded_at >= ? AND uploaded_at < ?) AS total_expenses,
+                    (SELECT COUNT(*) FROM alerts
+                     WHERE branch_id = ? AND is_resolved = 0) AS active_alerts
+            """, (branch_id, branch_id, month_start, next_month_start, branch_id))
+            monthly_budget, total_expenses, active_alerts = cursor.fetchone()
+            total_branches = 1
 
         else:
             return jsonify({"error": "Invalid role"}), 403
@@ -101,13 +103,11 @@ def get_dashboard_summary():
 
 
 @dashboard_bp.route('/branch-performance', methods=['POST'])
+@authz.load_context
 def branch_performance():
-    identity = session.get('user')
-    role_id = identity.get("role_id")
-    business_id = identity.get("business_id")
-    user_id = identity.get("user_id")
-    # optional
-    branch_id = identity.get("branch_id")
+    ctx = g.authz
+    role_id = ctx.role_id
+    business_id = ctx.business_id
 
     if not role_id or not business_id:
         return jsonify({"error": "Missing role_id or business_id"}), 400
@@ -118,58 +118,35 @@ def branch_performance():
     try:
         if role_id == 1:
             # Admin view: All branches or specific branch if branch_id provided # performance of specific branch
+            # optional
+            branch_id = session['user'].get("branch_id")
             cursor.execute("""
                 SELECT b.branch_id, b.branch_name,
-                        ISNULL(SUM(bg.total_budget), 0) AS total_budget,
-                        ISNULL(SUM(ub.amount), 0) AS total_expense,
-                        (SELECT COUNT(*) FROM alerts a WHERE a.branch_id = b.branch_id) AS alerts
+                        ISNULL(SUM(r.budget_total), 0) AS total_budget,
+                        ISNULL(SUM(r.expense_total), 0) AS total_expense,
+                        ISNULL(SUM(r.alert_count), 0) AS alerts
                 FROM branches b
-                LEFT JOIN budget bg ON b.branch_id = bg.branch_id
-                LEFT JOIN utility_bills ub ON b.branch_id = ub.branch_id
+                LEFT JOIN branch_month_rollup r ON r.branch_id = b.branch_id
                 WHERE b.branch_id = ? AND b.business_id = ? AND b.status = 1
                 GROUP BY b.branch_id, b.branch_name
             """, (branch_id, business_id))
         else:
-            # Branch Manager: must provide branch_id
+            # Branch Manager: their own active branch only
+            branch_id = ctx.branch_id
             if not branch_id:
                 return jsonify({"error": "Branch ID required for branch manager"}), 400
-
-            # Validate branch ownership
-            cursor.execute("""
-                SELECT handled_by FROM branches WHERE branch_id = ? AND business_id = ? AND status = 1
-            """, (branch_id, business_id))
-            result = cursor.fetchone()
-            if not result or result[0] != user_id:
+            if not ctx.can_access(branch_id, active_only=True):
                 return jsonify({"error": "Unauthorized or branch not found"}), 403
 
             cursor.execute("""
-               SELECT
-    b.branch_id,
-    b.branch_name,
-
-    -- Total budget for this branch
-    (
-        SELECT ISNULL(SUM(bg.total_budget), 0)
-        FROM budget bg
-        WHERE bg.branch_id = b.branch_id AND bg.status = 1
-    ) AS total_budget,
-
-    -- Total expenses for this branch
-    (
-        SELECT ISNULL(SUM(ub.amount), 0)
-        FROM utility_bills ub
-        WHERE ub.branch_id = b.branch_id AND ub.status = 1
-    ) AS total_expense,
-
-    -- Alerts count for this branch
-    (
-        SELECT COUNT(*) FROM alerts a WHERE a.branch_id = b.branch_id
-    ) AS alert_count
-
-FROM branches b
-WHERE b.status = 1 AND b.branch_id = ?
-
-                
+                SELECT b.branch_id, b.branch_name,
+                        ISNULL(SUM(r.budget_total), 0) AS total_budget,
+                        ISNULL(SUM(r.expense_total), 0) AS total_expense,
+                        ISNULL(SUM(r.alert_count), 0) AS alert_count
+                FROM branches b
+                LEFT JOIN branch_month_rollup r ON r.branch_id = b.branch_id
+                WHERE b.status = 1 AND b.branch_id = ?
+                GROUP BY b.branch_id, b.branch_name
             """, (branch_id,))
 
         rows = cursor.fetchall()
@@ -205,6 +182,7 @@ WHERE b.status = 1 AND b.branch_id = ?
 
 
 @dashboard_bp.route('/branches/compare', methods=['POST'])
+@cache.cached_response()
 def compare_branches():
     identity = session.get('user')
     print("Session identity:", identity)
@@ -222,38 +200,18 @@ def compare_branches():
     cursor = conn.cursor()
 
     try:
+        # Per-branch totals come from the monthly rollup rather than re-summing
+        # budget and utility_bills for every branch
         cursor.execute("""
-            SELECT
-    b.branch_id,
-    b.branch_name,
-
-    -- Total budget (correct per branch)
-    (
-        SELECT ISNULL(SUM(bg.total_budget), 0)
-        FROM budget bg
-        WHERE bg.branch_id = b.branch_id AND bg.status = 1
-    ) AS total_budget,
-
-    -- Total expenses (correct per branch)
-    (
-        SELECT ISNULL(SUM(ub.amount), 0)
-        FROM utility_bills ub
-        WHERE ub.branch_id = b.branch_id AND ub.status = 1
-    ) AS total_expense,
-
-    -- Alerts count
-    (
-        SELECT COUNT(*) FROM alerts a WHERE a.branch_id = b.branch_id
-    ) AS alert_count,
-
-    -- Utility bills count
-    (
-        SELECT COUNT(*) FROM utility_bills ub2 WHERE ub2.branch_id = b.branch_id
-    ) AS total_bills_uploaded
-
-FROM branches b
-WHERE b.business_id = ? AND b.status = 1
-
+            SELECT b.branch_id, b.branch_name,
+                   ISNULL(SUM(r.budget_total), 0) AS total_budget,
+                   ISNULL(SUM(r.expense_total), 0) AS total_expense,
+                   ISNULL(SUM(r.alert_count), 0) AS alert_count,
+                   ISNULL(SUM(r.bill_count), 0) AS total_bills_uploaded
+            FROM branches b
+            LEFT JOIN branch_month_rollup r ON r.branch_id = b.branch_id
+            WHERE b.business_id = ? AND b.status = 1
+            GROUP BY b.branch_id, b.branch_name
         """, (business_id,))
         rows = cursor.fetchall()
 
@@ -287,6 +245,8 @@ WHERE b.business_id = ? AND b.status = 1
 
 
 @dashboard_bp.route('/branches/<int:branch_id>/budget-vs-expense', methods=['GET'])
+@cache.conditional_get
+@cache.cached_response()
 def budget_vs_expense_chart(branch_id):
     year = request.args.get("year")
     if not year:
@@ -296,25 +256,15 @@ def budget_vs_expense_chart(branch_id):
     cursor = conn.cursor()
 
     try:
-        # Budgets
+        # Budgets and expenses per month, both from the rollup
         cursor.execute("""
-            SELECT month, SUM(total_budget) AS total_budget
-            FROM budget
-            WHERE branch_id = ? AND year = ? AND status = 1
-            GROUP BY month
+            SELECT month, budget_total, expense_total
+            FROM branch_month_rollup
+            WHERE branch_id = ? AND year = ?
         """, (branch_id, year))
-        budget_data = {int(row[0]): float(row[1] or 0)
-                       for row in cursor.fetchall()}
-
-        # Expenses
-        cursor.execute("""
-            SELECT month, SUM(amount) AS total_expense
-            FROM utility_bills
-            WHERE branch_id = ? AND year = ? AND status = 1
-            GROUP BY month
-        """, (branch_id, year))
-        expense_data = {int(row[0]): float(row[1] or 0)
-                        for row in cursor.fetchall()}
+        rows = cursor.fetchall()
+        budget_data = {int(row[0]): float(row[1] or 0) for row in rows}
+        expense_data = {int(row[0]): float(row[2] or 0) for row in rows}
 
         months = ['January', 'February', 'March', 'April', 'May', 'June',
                   'July', 'August', 'September', 'October', 'November', 'December']
@@ -337,6 +287,8 @@ def budget_vs_expense_chart(branch_id):
 
 
 @dashboard_bp.route('/expenses/branch-pie', methods=['GET'])
+@cache.conditional_get
+@cache.cached_response()
 def branch_expenses_pie():
     business_id = session.get("user", {}).get("business_id")
     year = request.args.get("year")  # Optional
@@ -346,11 +298,10 @@ def branch_expenses_pie():
     try:
         # Build SQL query with optional year filter
         sql = """
-            SELECT b.branch_id, b.branch_name, ISNULL(SUM(ub.amount), 0) AS total_expense
+            SELECT b.branch_id, b.branch_name, ISNULL(SUM(r.expense_total), 0) AS total_expense
             FROM branches b
-            LEFT JOIN utility_bills ub 
-                ON b.branch_id = ub.branch_id 
-                AND ub.status = 1
+            LEFT JOIN branch_month_rollup r
+                ON b.branch_id = r.branch_id
                 {year_condition}
             WHERE b.business_id = ? AND b.status = 1
             GROUP BY b.branch_id, b.branch_name
@@ -358,7 +309,7 @@ def branch_expenses_pie():
         year_condition = ""
         params = []
         if year:
-            year_condition = "AND ub.year = ?"
+            year_condition = "AND r.year = ?"
             sql = sql.format(year_condition=year_condition)
             params.append(int(year))
         else:
@@ -385,18 +336,73 @@ def branch_expenses_pie():
 # expense management page
 
 
+EXPENSE_COLUMNS = ["expense_id", "branch_name", "utility_name", "category", "year", "month",
+                   "units_used", "amount", "uploaded_at", "uploaded_by"]
+
+
+def _expense_listing(ctx, filters):
+    # Role scoping and filters shared by the expense listing and its export.
+    # Returns (listing, None) or (None, (error message, status code)).
+    role_id = ctx.role_id
+    business_id = ctx.business_id
+    filter_branch_id = filters.get("branch_id")
+
+    query = """
+        SELECT ub.id, b.branch_name, uet.utility_name, uet.category,
+               ub.year, ub.month, ub.units_used, ub.amount, ub.uploaded_at, u.username AS uploaded_by
+        FROM utility_bills ub
+        JOIN branches b ON ub.branch_id = b.branch_id
+        JOIN utility_expense_types uet ON ub.utility_type_id = uet.id
+        LEFT JOIN users u ON ub.uploaded_by = u.user_id
+        WHERE 1 = 1 and ub.status = 1
+    """
+    # Role-based filtering
+    if role_id == 1:
+        scope_sql, scope_params = " AND b.business_id = ?", [business_id]
+    elif role_id == 2:
+        branch_id = ctx.branch_id
+        if not branch_id:
+            return None, ("No branch assigned or invalid user.", 403)
+
+        scope_sql, scope_params = " AND b.branch_id = ?", [branch_id]
+        filter_branch_id = None
+    else:
+        return None, ("Unauthorized access.", 403)
+
+    query += scope_sql
+    params = list(scope_params)
+
+    # Apply filters if provided
+    if filter_branch_id:
+        query += " AND b.branch_id = ?"
+        params.append(filter_branch_id)
+    if filters.get("year"):
+        query += " AND ub.year = ?"
+        params.append(filters.get("year"))
+    if filters.get("month"):
+        query += " AND ub.month = ?"
+        params.append(filters.get("month"))
+    if filters.get("utility_type_id"):
+        query += " AND ub.utility_type_id = ?"
+        params.append(filters.get("utility_type_id"))
+
+    return {
+        "query": query,
+        "params": params,
+        "scope_sql": scope_sql,
+        "scope_params": scope_params,
+        "branch_id": filter_branch_id,
+    }, None
+
+
 @dashboard_bp.route('/expenses/all', methods=['POST'])
+@authz.load_context
 def get_all_expenses():
-    identity = session.get('user')
-    role_id = identity.get("role_id")
-    business_id = identity.get("business_id")
-    user_id = identity.get("user_id")
 
     data = request.json or {}
     page = data.get("page", 1)
     page_size = data.get("page_size", 10)
 
-    filter_branch_id = data.get("branch_id")
     filter_year = data.get("year")
     filter_month = data.get("month")
     filter_utility_type_id = data.get("utility_type_id")
@@ -406,56 +412,27 @@ def get_all_expenses():
         cursor = conn.cursor()
         offset = (page - 1) * page_size
 
-        query = """
-            SELECT ub.id, b.branch_name, uet.utility_name, uet.category,
-                   ub.year, ub.month, ub.units_used, ub.amount, ub.uploaded_at, u.username AS uploaded_by
-            FROM utility_bills ub
-            JOIN branches b ON ub.branch_id = b.branch_id
-            JOIN utility_expense_types uet ON ub.utility_type_id = uet.id
-            LEFT JOIN users u ON ub.uploaded_by = u.user_id
-            WHERE 1 = 1 and ub.status = 1
-        """
-        params = []
-
-        # Role-based filtering
-        if role_id == 1:
-            query += " AND b.business_id = ?"
-            params.append(business_id)
-        elif role_id == 2:
-            cursor.execute(
-                "SELECT branch_id, business_id FROM branches WHERE handled_by = ?", (user_id,))
-            branch_row = cursor.fetchone()
-            if not branch_row:
-                return jsonify({"error": "No branch assigned or invalid user."}), 403
-            branch_id, branch_business_id = branch_row
-            if branch_business_id != business_id:
-                return jsonify({"error": "Access denied: Mismatched business."}), 403
-
-            query += " AND b.branch_id = ?"
-            params.append(branch_id)
-            filter_branch_id = None
+        listing, error = _expense_listing(g.authz, data)
+        if error:
+            return jsonify({"error": error[0]}), error[1]
+        query, params = listing["query"], listing["params"]
+        scope_sql, scope_params = listing["scope_sql"], listing["scope_params"]
+        filter_branch_id = listing["branch_id"]
+
+        filtered_query, filtered_params = query, list(params)
+        use_cursor = pagination.wants_cursor(data)
+        if use_cursor:
+            page_size = pagination.page_size_from(data)
+            query, params = pagination.apply_keyset(
+                query, params, data.get("cursor"), page_size)
         else:
-            return jsonify({"error": "Unauthorized access."}), 403
-
-        # Apply filters if provided
-        if filter_branch_id:
-            query += " AND b.branch_id = ?"
-            params.append(filter_branch_id)
-        if filter_year:
-            query += " AND ub.year = ?"
-            params.append(filter_year)
-        if filter_month:
-            query += " AND ub.month = ?"
-            params.append(filter_month)
-        if filter_utility_type_id:
-            query += " AND ub.utility_type_id = ?"
-            params.append(filter_utility_type_id)
-
-        query += " ORDER BY ub.uploaded_at DESC OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
-        params.extend([offset, page_size])
+            query += " ORDER BY ub.uploaded_at DESC, ub.id DESC OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+            params.extend([offset, page_size])
 
         cursor.execute(query, tuple(params))
         rows = cursor.fetchall()
+        if use_cursor:
+            rows, next_cursor = pagination.keyset_page(rows, page_size, uploaded_at_index=8)
 
         result = [
             {
@@ -476,12 +453,31 @@ def get_all_expenses():
 
         print("Filters received:", data)
 
-        return jsonify({
-            "page": page,
-            "page_size": page_size,
-            "expenses": result,
-            "total_pages": 1  # Optional: you can add pagination count logic here if needed
-        }), 200
+        def count_total():
+            # The rollup keeps bill counts per branch and month; a utility type
+            # filter is finer than that, so count the filtered rows instead
+            if filter_utility_type_id:
+                cursor.execute(f"SELECT COUNT(*) FROM ({filtered_query}) t", tuple(filtered_params))
+                return int(cursor.fetchone()[0])
+            return pagination.estimate_bill_count(
+                cursor, scope_sql, scope_params,
+                branch_id=filter_branch_id, year=filter_year, month=filter_month)
+
+        if use_cursor:
+            response = {"page_size": page_size, "expenses": result, "next_cursor": next_cursor}
+            if data.get("include_total"):
+                response["total_estimate"] = count_total()
+            return jsonify(response), 200
+
+        response = {"page": page, "page_size": page_size, "expenses": result}
+        # Only the first page is counted; clients keep that total while they
+        # page through, or ask again with include_total
+        if page == 1 or data.get("include_total"):
+            response["total_pages"] = pagination.total_pages(count_total(), page_size)
+        return jsonify(response), 200
+
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -491,8 +487,34 @@ def get_all_expenses():
         conn.close()
 
 
+# Streams every matching bill as CSV or NDJSON for offline analysis
+@dashboard_bp.route('/expenses/export', methods=['GET'])
+@authz.load_context
+def export_expenses():
+
+    fmt = request.args.get("format", "csv").lower()
+    if fmt not in export.FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    filters = {key: request.args.get(key, type=int)
+               for key in ("branch_id", "year", "month", "utility_type_id")}
+
+    listing, error = _expense_listing(g.authz, filters)
+    if error:
+        return jsonify({"error": error[0]}), error[1]
+
+    # Primary key order streams straight off the clustered index, a batch at
+    # a time, with no sort of the whole extract before the first row goes out
+    try:
+        return export.stream_query(listing["query"], listing["params"], "ub.id",
+                                   EXPENSE_COLUMNS, fmt, "utility_bills")
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
 # expense management page
 @dashboard_bp.route('/expenses/filters', methods=['GET'])
+@cache.conditional_get
 def get_expense_filters():
     identity = session.get('user')
     role_id = identity.get("role_id")
@@ -572,6 +594,7 @@ def get_expense_filters():
 
 # reports and analytics page
 @dashboard_bp.route('/reports/profit-loss/summary', methods=['GET'])
+@cache.cached_response()
 def profit_loss_summary():
     year = request.args.get("year")
     month = request.args.get("month")
@@ -591,21 +614,15 @@ def profit_loss_summary():
             SELECT
                 b.branch_id,
                 b.branch_name,
-                ISNULL(SUM(bg.total_budget), 0) AS budget,
-                ISNULL(SUM(ub.amount), 0) AS expense
+                ISNULL(r.budget_total, 0) AS budget,
+                ISNULL(r.expense_total, 0) AS expense
             FROM branches b
-            LEFT JOIN budget bg ON bg.branch_id = b.branch_id
-            AND bg.status = 1
-            AND CAST(bg.year AS INT) = ?
-            AND CAST(bg.month AS INT) = ?
-
-            LEFT JOIN utility_bills ub ON ub.branch_id = b.branch_id
-            AND ub.status = 1
-            AND CAST(ub.year AS INT) = ?
-            AND CAST(ub.month AS INT) = ?
+            LEFT JOIN branch_month_rollup r ON r.branch_id = b.branch_id
+            AND r.year = ?
+            AND r.month = ?
 
         """
-        params = [year, month, year, month]
+        params = [int(year), int(month)]
         print("== DEBUG Params ===")
         print("Params:", params)
 
@@ -618,7 +635,7 @@ def profit_loss_summary():
         else:
             return jsonify({"error": "Unauthorized"}), 403
 
-        query += " GROUP BY b.branch_id, b.branch_name ORDER BY b.branch_name"
+        query += " ORDER BY b.branch_name"
 
         cursor.execute(query, tuple(params))
         rows = cursor.fetchall()
@@ -653,50 +670,34 @@ def profit_loss_summary():
 
 
 @dashboard_bp.route('/reports/budget-recommendation/<int:branch_id>', methods=['GET'])
+@authz.load_context
 def budget_recommendation(branch_id):
-    identity = session.get('user')
-    business_id = identity.get("business_id")
-    role_id = identity.get("role_id")
-    user_id = identity.get("user_id")
+    ctx = g.authz
     target_year = request.args.get("year", type=int)
     target_month = request.args.get("month")
 
-    print(role_id, business_id, user_id)
-    if not all([business_id, role_id, user_id]):
-        return jsonify({"error": "Missing parameters"}), 400
-
     conn = get_connection()
     cursor = conn.cursor()
 
     try:
         # Access check
-        cursor.execute(
-            "SELECT business_id, handled_by FROM branches WHERE branch_id = ?", (branch_id,))
-        branch = cursor.fetchone()
-        if not branch:
-            return jsonify({"error": "Branch not found"}), 404
-
-        branch_business_id, handled_by = branch
-        if branch_business_id != business_id or (role_id == 2 and handled_by != user_id):
+        if not ctx.can_access(branch_id):
+            cursor.execute("SELECT business_id FROM branches WHERE branch_id = ?", (branch_id,))
+            branch = cursor.fetchone()
+            if not branch or branch[0] != ctx.business_id:
+                return jsonify({"error": "Branch not found"}), 404
             return jsonify({"error": "Unauthorized"}), 403
 
         cursor.execute("""
-            WITH monthly AS (
-            SELECT  year,
+            SELECT TOP 6
+                year,
                 month,
-            SUM(amount) AS total_expense
-            FROM    utility_bills
-            WHERE   branch_id = ?     -- current branch
-            AND   status     = 1
-            GROUP BY year, month
-        )
-        SELECT TOP 6
-           year,
-           month,
-           total_expense
-        FROM   monthly
-        ORDER  BY year DESC, month DESC;
-    """, (branch_id,))
+                expense_total
+            FROM branch_month_rollup
+            WHERE branch_id = ?     -- current branch
+                AND bill_count > 0
+            ORDER BY year DESC, month DESC
+        """, (branch_id,))
 
         rows = cursor.fetchall()
         print("⇢ 6‑month expense rows for branch", branch_id)
@@ -1,10 +1,13 @@
-from flask import Blueprint, request, jsonify, session, send_from_directory
+from flask import Blueprint, g, request, jsonify, session
 from umd_app.db import get_connection
-import os
+from umd_app import (alert_engine, authz, bulk_import, cache, extraction, media_serving, media_store,
+                     metrics, pagination, rollup)
+from umd_app.bulk_import import BatchError
+from umd_app.pagination import InvalidCursor
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
-from flask import current_app
-import uuid
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 
 utility_bp = Blueprint('utility_bp', __name__)
 
@@ -50,11 +53,14 @@ def get_expense_utility_types():
 
 
 @utility_bp.route('/utility-bills/upload', methods=['POST'])
+@media_store.streamed_upload
+@authz.load_context
 def upload_utility_bill():
     identity = session.get('user')
-    role_id = identity.get("role_id")
-    business_id = identity.get("business_id")
-    branch_id = identity.get("branch_id")
+    ctx = g.authz
+    role_id = ctx.role_id
+    business_id = ctx.business_id
+    branch_id = ctx.branch_id
     print("Session identity:", identity)
 
     data = request.form
@@ -76,33 +82,39 @@ def upload_utility_bill():
     print("uploaded_by", uploaded_by)
     print("business_id", business_id)
 
-    branch_id = identity.get("branch_id")
     if not branch_id:
         branch_id = request.form.get("branch_id", type=int)
     if not all([branch_id, utility_type_id, year, month, amount, uploaded_by, business_id]):
         return jsonify({"error": "Missing required fields"}), 400
 
+    # Verify branch ownership
+    if not ctx.can_access(branch_id):
+        if role_id == 2:
+            return jsonify({"error": "You can only upload bills for your own branch"}), 403
+        return jsonify({"error": "You do not have access to this branch"}), 403
+    if not ctx.can_access(branch_id, active_only=True):
+        return jsonify({"error": "This branch is inactive"}), 403
+
+    # Save media file before touching the database: the upload was already
+    # streamed to disk while the request was parsed, this checks its content
+    # and links it into the store (content-addressed, so a re-uploaded scan
+    # is stored once)
+    blob = None
+    if file and allowed_file(file.filename):
+        filename = secure_filename(file.filename)
+        try:
+            blob = media_store.save(file, filename.rsplit('.', 1)[1])
+            media_store.place(blob)
+        except media_store.InvalidMedia as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            media_store.discard(blob)
+            return jsonify({"error": str(e)}), 500
+
     conn = get_connection()
     cursor = conn.cursor()
 
     try:
-        # Verify branch ownership
-        cursor.execute("""
-            SELECT business_id, handled_by FROM branches WHERE branch_id = ?
-        """, (branch_id,))
-        row = cursor.fetchone()
-
-        if not row:
-            return jsonify({"error": "Branch not found"}), 404
-
-        branch_business_id, handled_by = row
-
-        if branch_business_id != business_id:
-            return jsonify({"error": "You do not have access to this branch"}), 403
-
-        if role_id == 2 and handled_by != uploaded_by:
-            return jsonify({"error": "You can only upload bills for your own branch"}), 403
-
         # Insert utility bill
         cursor.execute("""
             INSERT INTO utility_bills (branch_id, utility_type_id, year, month, units_used, amount, uploaded_by)
@@ -110,59 +122,141 @@ def upload_utility_bill():
             VALUES (?, ?, ?, ?, ?, ?, ?)
         """, (branch_id, utility_type_id, year, month, units_used, amount, uploaded_by))
         bill_id = cursor.fetchone()[0]
+        rollup.record_bill(cursor, branch_id, year, month, amount, utility_type_id)
 
-        # Save media file
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            unique_filename = f"{uuid.uuid4().hex}_{filename}"
-            filepath = os.path.join(
-                current_app.config['UPLOAD_FOLDER'], unique_filename)
-            os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
-            file.save(filepath)
+        extraction_id = None
+        if blob:
+            media_path = media_store.add_ref(cursor, blob)
 
             cursor.execute("""
                 INSERT INTO media (media_name, media_path, uploaded_by, business_id, branch_id, utility_bill_id, media_type)
+                OUTPUT INSERTED.id
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (unique_filename, unique_filename, uploaded_by, business_id, branch_id, bill_id, media_type))
+            """, (filename, media_path, uploaded_by, business_id, branch_id, bill_id, media_type))
+            media_id = cursor.fetchone()[0]
+            # Suggested amount/units/period, read from the file in the background
+            if extraction.can_extract(media_path):
+                extraction_id = extraction.enqueue(cursor, bill_id, media_id)
 
-        # === BUDGET CHECK ===
-        cursor.execute("""
-            SELECT ISNULL(SUM(total_budget), 0)
-            FROM budget
-            WHERE branch_id = ? AND year = ? AND month = ? AND status = 1
-        """, (branch_id, year, month))
-        total_budget = float(cursor.fetchone()[0])
-        count = 1 if total_budget > 0 else 0
+        # === BUDGET CHECK === runs in the alert engine once this commits
+        outbox_id = alert_engine.enqueue(cursor, alert_engine.BILL, branch_id, year, month, bill_id)
 
-        cursor.execute("""
-            SELECT ISNULL(SUM(amount), 0)
-            FROM utility_bills
-            WHERE branch_id = ? AND year = ? AND month = ? AND status = 1
-        """, (branch_id, year, month))
-        total_expenses = float(cursor.fetchone()[0])
+        conn.commit()
+        if blob:
+            metrics.media_uploaded(media_store.full_path(media_path))
+            media_serving.enqueue(media_path)
+        cache.data_changed(business_id)
+        alert_engine.notify(outbox_id)
+        if extraction_id:
+            extraction.notify(extraction_id)
+        return jsonify({"message": "Utility bill and media uploaded", "bill_id": bill_id}), 201
 
-        cursor.execute("""
-            SELECT budget_alert_threshold FROM branches WHERE branch_id = ?
-        """, (branch_id,))
-        threshold_row = cursor.fetchone()
-        threshold = threshold_row[0] if threshold_row and threshold_row[0] is not None else 90
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
 
-        if count == 0:
-            message = "No budget defined for this period"
-            cursor.execute("""
-                INSERT INTO alerts (branch_id, utility_bill_id, alert_type, severity, message)
-                VALUES (?, ?, 'missing_budget', 'High', ?)
-            """, (branch_id, bill_id, message))
-        else:
-            if total_expenses >= (threshold / 100) * total_budget:
-                message = f"{threshold}% of the budget consumed: Rs. {total_expenses} of Rs. {total_budget}"
-                cursor.execute("""
-                    INSERT INTO alerts (branch_id, utility_bill_id, alert_type, severity, message)
-                    VALUES (?, ?, 'budget_warning', 'medium', ?)
-                """, (branch_id, bill_id, message))
+    finally:
+        media_store.discard(blob)
+        cursor.close()
+        conn.close()
+
+
+# month-end batch upload: many bills in one request, one budget check per period
+@utility_bp.route('/utility-bills/bulk', methods=['POST'])
+@authz.load_context
+def bulk_upload_utility_bills():
+    ctx = g.authz
+    role_id = ctx.role_id
+    business_id = ctx.business_id
+    uploaded_by = ctx.user_id
+
+    if role_id not in (1, 2):
+        return jsonify({"error": "Unauthorized"}), 403
+    # Managers upload for their own branch, admins name the branch on each row
+    default_branch_id = ctx.branch_id if role_id == 2 else None
+    if role_id == 2 and not default_branch_id:
+        return jsonify({"error": "No branch assigned to this manager"}), 403
+
+    try:
+        raw_rows = bulk_import.read_batch(request)
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("SELECT id, utility_name FROM utility_expense_types")
+        utility_types = {}
+        for type_id, utility_name in cursor.fetchall():
+            utility_types[type_id] = type_id
+            utility_types[utility_name.strip().lower()] = type_id
+
+        errors = []
+        cleaned = []
+        for number, raw in enumerate(raw_rows, start=1):
+            try:
+                cleaned.append((number, bulk_import.clean_row(raw, default_branch_id, utility_types)))
+            except ValueError as e:
+                errors.append({"row": number, "error": str(e)})
+
+        # Verify branch access once per branch in the batch, against the
+        # database rather than the session: the branch may have been
+        # deactivated or handed to someone else since login
+        denied = {}
+        for branch_id in {values[0] for _, values in cleaned}:
+            if not ctx.can_access(branch_id):
+                denied[branch_id] = ("You can only upload bills for your own branch" if role_id == 2
+                                     else "You do not have access to this branch")
+            elif not ctx.can_access(branch_id, active_only=True):
+                denied[branch_id] = "This branch is inactive"
+
+        bills = []
+        periods = {}
+        type_periods = {}
+        for number, values in cleaned:
+            branch_id, _, year, month, _, amount = values
+            if branch_id in denied:
+                errors.append({"row": number, "error": denied[branch_id]})
+                continue
+            bills.append((*values, uploaded_by))
+            total = periods.setdefault((branch_id, year, month), [0, 0])
+            total[0] += amount
+            total[1] += 1
+            type_total = type_periods.setdefault((branch_id, values[1], year, month), [0, 0])
+            type_total[0] += amount
+            type_total[1] += 1
+
+        if not bills:
+            errors.sort(key=lambda e: e["row"])
+            return jsonify({"error": "No valid bills in the batch", "errors": errors}), 400
+
+        cursor.fast_executemany = True
+        cursor.executemany("""
+            INSERT INTO utility_bills (branch_id, utility_type_id, year, month, units_used, amount, uploaded_by)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, bills)
+
+        # === BUDGET CHECK === once per (branch, year, month) the batch touched,
+        # in the alert engine after commit
+        for (branch_id, type_id, year, month), (amount, count) in type_periods.items():
+            rollup.apply_type_delta(cursor, branch_id, type_id, year, month, expense=amount, bills=count)
+        outbox_ids = []
+        for (branch_id, year, month), (amount, count) in periods.items():
+            rollup.apply_delta(cursor, branch_id, year, month, expense=amount, bills=count)
+            outbox_ids.append(alert_engine.enqueue(cursor, alert_engine.BILL, branch_id, year, month))
 
         conn.commit()
-        return jsonify({"message": "Utility bill and media uploaded", "bill_id": bill_id}), 201
+        cache.data_changed(business_id)
+        alert_engine.notify(*outbox_ids)
+        errors.sort(key=lambda e: e["row"])
+        return jsonify({
+            "message": f"{len(bills)} utility bills uploaded",
+            "inserted": len(bills),
+            "failed": len(errors),
+            "alert_checks_queued": len(outbox_ids),
+            "errors": errors
+        }), 201
 
     except Exception as e:
         conn.rollback()
@@ -173,10 +267,28 @@ def upload_utility_bill():
         conn.close()
 
 
+def _attach_media(cursor, results):
+    # Each bill's current attachment, with the small preview lists should show
+    ids = [r["id"] for r in results]
+    media = {}
+    if ids:
+        placeholders = ", ".join("?" * len(ids))
+        cursor.execute(f"""
+            SELECT utility_bill_id, MAX(id) FROM media
+            WHERE status = 1 AND utility_bill_id IN ({placeholders})
+            GROUP BY utility_bill_id
+        """, tuple(ids))
+        media = dict(cursor.fetchall())
+    for r in results:
+        media_id = media.get(r["id"])
+        r["media_id"] = media_id
+        r["preview_url"] = f"/api/utility/media/{media_id}/preview" if media_id else None
+
+
 # show all utilities present
 @utility_bp.route('/utility-bills/all', methods=['POST'])
 def get_all_utilities():
-    data = request.get_json()
+    data = request.get_json() or {}
     identity = session.get('user')
     role_id = identity.get("role_id")
     business_id = identity.get("business_id")
@@ -200,22 +312,30 @@ def get_all_utilities():
             JOIN utility_expense_types uet ON ub.utility_type_id = uet.id
             WHERE ub.status = 1
         """
-        params = []
-
         if role_id == 1:
-            query += " AND b.business_id = ?"
-            params.append(business_id)
+            scope_sql, scope_params = " AND b.business_id = ?", [business_id]
         elif role_id == 2:
-            query += " AND b.business_id = ? AND b.handled_by = ?"
-            params.extend([business_id, user_id])
+            scope_sql = " AND b.business_id = ? AND b.handled_by = ?"
+            scope_params = [business_id, user_id]
         else:
             return jsonify({"error": "Unauthorized"}), 403
 
-        query += " ORDER BY ub.uploaded_at DESC OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
-        params.extend([offset, page_size])
+        query += scope_sql
+        params = list(scope_params)
+
+        use_cursor = pagination.wants_cursor(data)
+        if use_cursor:
+            page_size = pagination.page_size_from(data)
+            query, params = pagination.apply_keyset(
+                query, params, data.get("cursor"), page_size)
+        else:
+            query += " ORDER BY ub.uploaded_at DESC, ub.id DESC OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+            params.extend([offset, page_size])
 
         cursor.execute(query, tuple(params))
         rows = cursor.fetchall()
+        if use_cursor:
+            rows, next_cursor = pagination.keyset_page(rows, page_size, uploaded_at_index=8)
 
         results = [{
             "id": r[0],
@@ -228,9 +348,20 @@ def get_all_utilities():
             "amount": float(r[7]),
             "uploaded_at": str(r[8])
         } for r in rows]
+        _attach_media(cursor, results)
+
+        if use_cursor:
+            response = {"utilities": results, "page_size": page_size, "next_cursor": next_cursor}
+            if data.get("include_total"):
+                response["total_estimate"] = pagination.estimate_bill_count(
+                    cursor, scope_sql, scope_params)
+            return jsonify(response), 200
 
         return jsonify({"utilities": results, "page": page, "page_size": page_size}), 200
 
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -243,7 +374,7 @@ def get_all_utilities():
 
 @utility_bp.route('/utility-bills/filter', methods=['POST'])
 def filter_utilities():
-    data = request.get_json()
+    data = request.get_json() or {}
     identity = session.get('user')
     role_id = identity.get("role_id")
     business_id = identity.get("business_id")
@@ -273,18 +404,19 @@ def filter_utilities():
             JOIN utility_expense_types uet ON ub.utility_type_id = uet.id
             WHERE ub.status = 1
         """
-        params = []
 
         # Access control filters
         if role_id == 1:
-            query += " AND b.business_id = ?"
-            params.append(business_id)
+            scope_sql, scope_params = " AND b.business_id = ?", [business_id]
         elif role_id == 2:
-            query += " AND b.business_id = ? AND b.handled_by = ?"
-            params.extend([business_id, user_id])
+            scope_sql = " AND b.business_id = ? AND b.handled_by = ?"
+            scope_params = [business_id, user_id]
         else:
             return jsonify({"error": "Unauthorized"}), 403
 
+        query += scope_sql
+        params = list(scope_params)
+
         # Optional filters
         if branch_id:
             query += " AND ub.branch_id = ?"
@@ -299,11 +431,19 @@ def filter_utilities():
             params.append(month)
 
         # Pagination
-        query += " ORDER BY ub.uploaded_at DESC OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
-        params.extend([offset, page_size])
+        use_cursor = pagination.wants_cursor(data)
+        if use_cursor:
+            page_size = pagination.page_size_from(data)
+            query, params = pagination.apply_keyset(
+                query, params, data.get("cursor"), page_size)
+        else:
+            query += " ORDER BY ub.uploaded_at DESC, ub.id DESC OFFSET ? ROWS FETCH NEXT ? ROWS ONLY"
+            params.extend([offset, page_size])
 
         cursor.execute(query, tuple(params))
         rows = cursor.fetchall()
+        if use_cursor:
+            rows, next_cursor = pagination.keyset_page(rows, page_size, uploaded_at_index=8)
 
         results = [{
             "id": r[0],
@@ -316,6 +456,14 @@ def filter_utilities():
             "amount": float(r[7]),
             "uploaded_at": str(r[8])
         } for r in rows]
+        _attach_media(cursor, results)
+
+        if use_cursor:
+            response = {"utilities": results, "page_size": page_size, "next_cursor": next_cursor}
+            if data.get("include_total"):
+                response["total_estimate"] = pagination.estimate_bill_count(
+                    cursor, scope_sql, scope_params, branch_id=branch_id, year=year, month=month)
+            return jsonify(response), 200
 
         return jsonify({
             "utilities": results,
@@ -323,6 +471,9 @@ def filter_utilities():
             "page_size": page_size
         }), 200
 
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -332,6 +483,7 @@ def filter_utilities():
 
 
 @utility_bp.route('/utility-bills/<int:utility_id>', methods=['GET'])
+@cache.conditional_get
 def get_utility_detail(utility_id):
     identity = session.get('user')
     role_id = identity.get("role_id")
@@ -390,41 +542,50 @@ def get_utility_detail(utility_id):
 # media preview
 
 
-UPLOAD_FOLDER = 'uploads/media'  # Ensure this folder exists
-UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads', 'media')
-
-
 @utility_bp.route('/media/<int:image_id>', methods=['GET'])
+@authz.load_context
 def get_media_by_id(image_id):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT media_path FROM media WHERE id = ? AND status = 1", (image_id,))
-        row = cursor.fetchone()
-
-        if not row:
+        row = media_serving.lookup(image_id, g.authz.business_id)
+        if not row or not media_serving.can_view(g.authz, row):
             return jsonify({"error": "Image not found"}), 404
+        return media_serving.send_media(row)
 
-        filename = row[0]
-        return send_from_directory(UPLOAD_FOLDER, filename)
-
+    except HTTPException:
+        # e.g. 416 for a Range past the end of the file
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-    finally:
-        cursor.close()
-        conn.close()
+
+@utility_bp.route('/media/<int:image_id>/preview', methods=['GET'])
+@authz.load_context
+def get_media_preview(image_id):
+    # Small JPEG of an image or a PDF's first page, for bill lists; 202 while
+    # it is still being made
+    try:
+        row = media_serving.lookup(image_id, g.authz.business_id)
+        if not row or not media_serving.can_view(g.authz, row):
+            return jsonify({"error": "Image not found"}), 404
+        return media_serving.send_preview(row)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 
 @utility_bp.route('/utility-bills/<int:utility_id>/media', methods=['PATCH'])
+@media_store.streamed_upload
+@authz.load_context
 def update_utility_media(utility_id):
     identity = session.get('user')
-    business_id = identity.get("business_id")
+    ctx = g.authz
+    business_id = ctx.business_id
 
     file = request.files.get('media_file')
     media_type = request.form.get('media_type')
-    uploaded_by = request.form.get('uploaded_by', type=int)
+    uploaded_by = identity.get("user_id")
 
     if not all([file, media_type, uploaded_by, business_id]):
         return jsonify({"error": "Missing required fields"}), 400
@@ -433,58 +594,266 @@ def update_utility_media(utility_id):
         return jsonify({"error": "Invalid file type"}), 400
 
     filename = secure_filename(file.filename)
-    unique_filename = f"{uuid.uuid4().hex}_{filename}"
-    filepath = os.path.join(
-        current_app.config['UPLOAD_FOLDER'], unique_filename)
+    blob = None
 
     try:
         conn = get_connection()
         cursor = conn.cursor()
 
-    # Soft delete previous media
         cursor.execute(
-            "DELETE FROM media WHERE utility_bill_id = ?", (utility_id,))
+            "SELECT branch_id FROM utility_bills WHERE id = ? AND status = 1", (utility_id,))
+        bill = cursor.fetchone()
+        conn.commit()
+        if not bill:
+            return jsonify({"error": "Utility not found"}), 404
+        branch_id = bill[0]
+        if not ctx.can_access(branch_id):
+            return jsonify({"error": "Unauthorized"}), 403
 
-    # Save new media
-        os.makedirs(current_app.config['UPLOAD_FOLDER'], exist_ok=True)
-        file.save(filepath)
+    # Check the new file and put it in the store outside the transaction
+        try:
+            blob = media_store.save(file, filename.rsplit('.', 1)[1])
+        except media_store.InvalidMedia as e:
+            return jsonify({"error": str(e)}), 400
+        media_store.place(blob)
+
+    # Soft delete previous media, releasing their stored files for gc
+        cursor.execute(
+            "SELECT id, media_path FROM media WHERE utility_bill_id = ? AND status = 1", (utility_id,))
+        previous = cursor.fetchall()
+        cursor.execute(
+            "UPDATE media SET status = 0 WHERE utility_bill_id = ? AND status = 1", (utility_id,))
+        media_store.release(cursor, [row[1] for row in previous])
 
+    # Save new media
+        media_path = media_store.add_ref(cursor, blob)
         cursor.execute("""
-            INSERT INTO media (media_name, media_path, media_type, uploaded_by, business_id, utility_bill_id)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (filename, filepath, media_type, uploaded_by, business_id, utility_id))
+            INSERT INTO media (media_name, media_path, media_type, uploaded_by, business_id, branch_id, utility_bill_id)
+            OUTPUT INSERTED.id
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (filename, media_path, media_type, uploaded_by, business_id, branch_id, utility_id))
+        media_id = cursor.fetchone()[0]
+        extraction_id = None
+        if extraction.can_extract(media_path):
+            extraction_id = extraction.enqueue(cursor, utility_id, media_id)
 
         conn.commit()
+        metrics.media_uploaded(media_store.full_path(media_path))
+        media_serving.enqueue(media_path)
+        if extraction_id:
+            extraction.notify(extraction_id)
+        cache.data_changed(business_id)
         return jsonify({"message": "Media updated successfully."}), 200
 
     except Exception as e:
         conn.rollback()
         return jsonify({"error": str(e)}), 500
     finally:
+        media_store.discard(blob)
         cursor.close()
         conn.close()
 
+# suggested values read from the bill's attachment (umd_app/extraction.py)
+
+
+def _extraction_json(row, bill):
+    (extraction_id, status, method, amount, units_used, year, month,
+     last_error, processed_at, confirmed_at) = row
+    return {
+        "id": extraction_id,
+        "status": status,
+        "method": method,
+        "suggested": {
+            "amount": float(amount) if amount is not None else None,
+            "units_used": float(units_used) if units_used is not None else None,
+            "year": year,
+            "month": month,
+        },
+        "current": {
+            "amount": float(bill[3]),
+            "units_used": float(bill[5]) if bill[5] is not None else None,
+            "year": bill[1],
+            "month": bill[2],
+        },
+        "error": last_error if status == 'failed' else None,
+        "processed_at": str(processed_at) if processed_at else None,
+        "confirmed_at": str(confirmed_at) if confirmed_at else None,
+    }
+
+
+def _latest_extraction(cursor, utility_id):
+    cursor.execute("""
+        SELECT TOP 1 id, status, method, amount, units_used, year, month,
+            last_error, processed_at, confirmed_at
+        FROM bill_extractions
+        WHERE utility_bill_id = ?
+        ORDER BY id DESC
+    """, (utility_id,))
+    return cursor.fetchone()
+
+
+@utility_bp.route('/utility-bills/<int:utility_id>/extraction', methods=['GET'])
+@authz.load_context
+def get_bill_extraction(utility_id):
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT branch_id, year, month, amount, utility_type_id, units_used
+            FROM utility_bills WHERE id = ? AND status = 1
+        """, (utility_id,))
+        bill = cursor.fetchone()
+        if not bill or not g.authz.can_access(bill[0]):
+            return jsonify({"error": "Utility not found"}), 404
+
+        row = _latest_extraction(cursor, utility_id)
+        if not row:
+            return jsonify({"error": "No extraction for this bill"}), 404
+        return jsonify(_extraction_json(row, bill)), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _confirmed_values(data, amount, units_used, year, month):
+    # Body fields override the suggestion; raises ValueError with a message
+    # for the client, like bulk_import.clean_row
+    try:
+        amount = Decimal(str(data.get("amount", amount)).strip())
+        units_used = data.get("units_used", units_used)
+        units_used = Decimal(str(units_used).strip()) if units_used not in (None, '') else None
+    except InvalidOperation:
+        raise ValueError("amount and units_used must be numbers")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("amount must be greater than zero")
+    if units_used is not None and (not units_used.is_finite() or units_used < 0):
+        raise ValueError("units_used cannot be negative")
+    try:
+        year = int(data.get("year", year))
+        month = int(data.get("month", month))
+    except (TypeError, ValueError):
+        raise ValueError("year and month must be whole numbers")
+    if not 1 <= month <= 12:
+        raise ValueError("month must be between 1 and 12")
+    return amount, units_used, year, month
+
+
+@utility_bp.route('/utility-bills/<int:utility_id>/extraction/confirm', methods=['POST'])
+@authz.load_context
+def confirm_bill_extraction(utility_id):
+    # Apply the suggestion to the bill; any of amount, units_used, year and
+    # month in the body override the suggested value
+    data = request.get_json(silent=True) or {}
+    identity = session.get('user')
+    ctx = g.authz
+
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            SELECT branch_id, year, month, amount, utility_type_id, units_used
+            FROM utility_bills WHERE id = ? AND status = 1
+        """, (utility_id,))
+        bill = cursor.fetchone()
+        if not bill or not ctx.can_access(bill[0]):
+            return jsonify({"error": "Utility not found"}), 404
+        branch_id, old_year, old_month, old_amount, utility_type_id, old_units = bill
+
+        row = _latest_extraction(cursor, utility_id)
+        if not row or row[1] not in ('suggested', 'no_match'):
+            return jsonify({"error": "No suggestion to confirm for this bill"}), 409
+        extraction_id, _, _, amount, units_used, year, month = row[:7]
+
+        try:
+            amount, units_used, year, month = _confirmed_values(
+                data,
+                amount if amount is not None else old_amount,
+                units_used if units_used is not None else old_units,
+                year or old_year, month or old_month)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        cursor.execute("""
+            UPDATE bill_extractions SET status = 'confirmed', confirmed_by = ?, confirmed_at = ?
+            WHERE id = ? AND status IN ('suggested', 'no_match')
+        """, (identity.get("user_id"), datetime.now(), extraction_id))
+        if cursor.rowcount == 0:
+            return jsonify({"error": "No suggestion to confirm for this bill"}), 409
+
+        cursor.execute("""
+            UPDATE utility_bills SET amount = ?, units_used = ?, year = ?, month = ?
+            WHERE id = ? AND status = 1
+        """, (amount, units_used, year, month, utility_id))
+        rollup.remove_bill(cursor, branch_id, old_year, old_month, old_amount, utility_type_id)
+        rollup.record_bill(cursor, branch_id, year, month, amount, utility_type_id)
+
+        # Re-check the new period, and the old one if the bill moved
+        outbox_ids = [alert_engine.enqueue(cursor, alert_engine.BILL, branch_id, year, month, utility_id)]
+        if (year, month) != (old_year, old_month):
+            # Alerts count towards their bill's period, so they move with it
+            cursor.execute("SELECT COUNT(*) FROM alerts WHERE utility_bill_id = ?", (utility_id,))
+            moved = cursor.fetchone()[0]
+            if moved:
+                rollup.apply_delta(cursor, branch_id, old_year, old_month, alerts=-moved)
+                rollup.apply_delta(cursor, branch_id, year, month, alerts=moved)
+            outbox_ids.append(alert_engine.enqueue(cursor, alert_engine.BILL, branch_id, old_year, old_month))
+
+        conn.commit()
+        cache.data_changed(ctx.business_id)
+        alert_engine.notify(*outbox_ids)
+        return jsonify({"message": "Bill updated from its attachment.", "bill_id": utility_id,
+                        "amount": float(amount), "units_used": float(units_used) if units_used is not None else None,
+                        "year": year, "month": month}), 200
+
+    except Exception as e:
+        conn.rollback()
+        return jsonify({"error": str(e)}), 500
+    finally:
+        cursor.close()
+        conn.close()
+
+
 # soft-deleting a utilitybill
 
 
 @utility_bp.route('/utility-bills/delete/<int:utility_id>', methods=['DELETE'])
+@authz.load_context
 def soft_delete_utility_bill(utility_id):
-    identity = session.get("user")
-    if not identity:
-        return jsonify({"error": "Unauthorized"}), 401
-
     try:
         conn = get_connection()
         cursor = conn.cursor()
 
         cursor.execute("""
-            UPDATE utility_bills SET status = 0 WHERE id = ?
+            SELECT ub.branch_id, ub.year, ub.month, ub.amount, ub.utility_type_id, b.business_id
+            FROM utility_bills ub
+            JOIN branches b ON b.branch_id = ub.branch_id
+            WHERE ub.id = ? AND ub.status = 1
+        """, (utility_id,))
+        row = cursor.fetchone()
+        # Bills of branches the caller cannot act on are reported as missing
+        if not row or not g.authz.can_access(row[0]):
+            return jsonify({"error": "Utility not found"}), 404
+        bill, owner_business_id = tuple(row[:5]), row[5]
+
+        cursor.execute("""
+            UPDATE utility_bills SET status = 0 WHERE id = ? AND status = 1
         """, (utility_id,))
 
         if cursor.rowcount == 0:
             return jsonify({"error": "Utility not found"}), 404
 
+        rollup.remove_bill(cursor, *bill)
+        # Lets rules whose condition no longer holds re-arm
+        outbox_id = alert_engine.enqueue(cursor, alert_engine.BILL, bill[0], bill[1], bill[2])
+
         conn.commit()
+        cache.data_changed(owner_business_id)
+        alert_engine.notify(outbox_id)
         return jsonify({"message": "Utility bill deleted successfully."}), 200
 
     except Exception as e:
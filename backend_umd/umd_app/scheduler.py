@@ -0,0 +1,281 @@
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from dateutil.relativedelta import relativedelta
+from flask.cli import AppGroup
+
+from umd_app import cache, config, events, metrics, rollup
+from umd_app.db import IntegrityError, get_connection
+
+# A small in-process scheduler for periodic jobs.
+#
+# Every job has a row in scheduled_jobs holding its next_run_at. Each worker
+# process runs a scheduler thread that wakes every SCHEDULER_TICK seconds and,
+# for every due job, tries to take its lease with a conditional UPDATE on
+# locked_by/locked_until. Only the process whose UPDATE hits the row runs the
+# job, so however many workers a deployment has, a job runs once per period.
+# The job's writes commit together with the move of next_run_at and the
+# release of the lease; a run that dies holding the lease is retried once
+# LEASE_SECONDS have passed.
+#
+# Jobs:
+#   budget_reminders  once a month after a branch's latest budget was
+#                     allocated, add a budget_reminder alert for it (replaces
+#                     the future-dated alert rows add/update budget used to
+#                     insert on every call)
+
+LEASE_SECONDS = 300
+
+log = logging.getLogger("umd_app.scheduler")
+
+enabled = True
+tick = 30.0
+
+# name -> (interval seconds, fn(cursor, now) -> (status, after_commit or None))
+_jobs = {}
+_started_pid = None
+_start_lock = threading.Lock()
+
+_owner = f"{socket.gethostname()}:{os.getpid()}"[:100]
+
+
+def job(name, interval):
+    """Register fn(cursor, now) as a periodic job run every interval seconds."""
+    def register(fn):
+        _jobs[name] = (int(interval), fn)
+        return fn
+    return register
+
+
+def _now():
+    return datetime.now().replace(microsecond=0)
+
+
+def _ensure_rows(cursor, now):
+    cursor.execute("SELECT name FROM scheduled_jobs")
+    known = {row[0] for row in cursor.fetchall()}
+    for name, (interval, _) in _jobs.items():
+        if name in known:
+            continue
+        try:
+            cursor.execute("""
+                INSERT INTO scheduled_jobs (name, interval_seconds, next_run_at)
+                VALUES (?, ?, ?)
+            """, (name, interval, now))
+        except IntegrityError:
+            pass  # another process registered it first
+
+
+def _acquire(cursor, name, now, force=False):
+    # The lease is the leader election: one UPDATE wins, the rest match no row
+    due = "" if force else "AND next_run_at <= ?"
+    params = [_owner, now + timedelta(seconds=LEASE_SECONDS), name]
+    if not force:
+        params.append(now)
+    params.append(now)
+    cursor.execute(f"""
+        UPDATE scheduled_jobs
+        SET locked_by = ?, locked_until = ?
+        WHERE name = ? {due}
+            AND (locked_until IS NULL OR locked_until < ?)
+    """, params)
+    return cursor.rowcount == 1
+
+
+def run_job(name, force=False):
+    """Run one job if it is due and no other process holds its lease.
+
+    Returns the job's status string, or None when it did not run.
+    """
+    interval, fn = _jobs[name]
+    now = _now()
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        _ensure_rows(cursor, now)
+        if not _acquire(cursor, name, now, force):
+            conn.commit()
+            return None
+        conn.commit()
+
+        try:
+            status, after_commit = fn(cursor, now)
+            cursor.execute("""
+                UPDATE scheduled_jobs
+                SET next_run_at = ?, last_run_at = ?, last_status = ?,
+                    interval_seconds = ?, locked_by = NULL, locked_until = NULL
+                WHERE name = ? AND locked_by = ?
+            """, (now + timedelta(seconds=interval), now, str(status)[:500], interval, name, _owner))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            log.exception("Scheduled job %s failed", name)
+            # Keep next_run_at so the next tick retries it
+            cursor.execute("""
+                UPDATE scheduled_jobs
+                SET last_status = ?, locked_by = NULL, locked_until = NULL
+                WHERE name = ? AND locked_by = ?
+            """, (f"error: {e}"[:500], name, _owner))
+            conn.commit()
+            return None
+    finally:
+        cursor.close()
+        conn.close()
+
+    if after_commit is not None:
+        after_commit()
+    return status
+
+
+def run_pending():
+    for name in list(_jobs):
+        try:
+            run_job(name)
+        except Exception:
+            log.exception("Scheduler could not run %s", name)
+
+
+def _loop():
+    while True:
+        run_pending()
+        time.sleep(tick)
+
+
+def _ensure_started():
+    # Started lazily, on the first request each process serves: a preforking
+    # server that loads the app before forking would otherwise leave the only
+    # thread in the master
+    global _started_pid, _owner
+    if _started_pid == os.getpid():
+        return
+    with _start_lock:
+        if _started_pid == os.getpid():
+            return
+        _owner = f"{socket.gethostname()}:{os.getpid()}"[:100]
+        threading.Thread(target=_loop, name="scheduler", daemon=True).start()
+        _started_pid = os.getpid()
+
+
+def _as_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    return datetime.strptime(str(value)[:19], "%Y-%m-%d %H:%M:%S")
+
+
+REMINDER_MESSAGE = "Reminder to allocate budget again to this branch."
+
+
+def due_budget_reminders(cursor, now):
+    """Branches whose latest budget was allocated a month or more ago and that
+    have had no reminder since: [(branch_id, business_id)].
+
+    Only allocations from the previous month on are read - the ones whose
+    reminder falls due this period or next - so the scan does not grow with
+    the budget and alert history.
+    """
+    since = datetime.combine(now.date().replace(day=1), datetime.min.time()) \
+        - relativedelta(months=1)
+    cursor.execute("""
+        SELECT b.branch_id, b.business_id, MAX(bg.created_at)
+        FROM branches b
+        JOIN budget bg ON bg.branch_id = b.branch_id AND bg.status = 1
+        WHERE b.status = 1 AND bg.created_at >= ?
+        GROUP BY b.branch_id, b.business_id
+    """, (since,))
+    allocated = cursor.fetchall()
+    if not allocated:
+        return []
+
+    cursor.execute("""
+        SELECT branch_id, MAX(created_at) FROM alerts
+        WHERE alert_type = 'budget_reminder' AND created_at >= ?
+        GROUP BY branch_id
+    """, (since,))
+    reminded = {row[0]: _as_datetime(row[1]) for row in cursor.fetchall()}
+
+    due = []
+    for branch_id, business_id, last_budget in allocated:
+        # Due from the start of the same day next month, as the old rows were dated
+        due_at = datetime.combine(_as_datetime(last_budget).date(), datetime.min.time()) \
+            + relativedelta(months=1)
+        last = reminded.get(branch_id)
+        if due_at <= now and (last is None or last < due_at):
+            due.append((branch_id, business_id))
+    return due
+
+
+def budget_reminders(cursor, now):
+    due = due_budget_reminders(cursor, now)
+    if not due:
+        return "0 reminders", None
+
+    cursor.fast_executemany = True
+    cursor.executemany("""
+        INSERT INTO alerts (branch_id, utility_bill_id, alert_type, severity, message, created_at)
+        VALUES (?, NULL, 'budget_reminder', 'medium', ?, ?)
+    """, [(branch_id, REMINDER_MESSAGE, now) for branch_id, _ in due])
+    by_business = {}
+    for branch_id, business_id in due:
+        rollup.record_alert(cursor, branch_id, now.year, now.month)
+        by_business.setdefault(business_id, []).append(
+            (branch_id, None, 'budget_reminder', 'medium', REMINDER_MESSAGE))
+
+    def after_commit():
+        metrics.alert_created('budget_reminder', len(due))
+        for business_id, alerts in by_business.items():
+            cache.data_changed(business_id)
+            events.alerts_created(business_id, alerts)
+
+    return f"{len(due)} reminders", after_commit
+
+
+jobs_cli = AppGroup('jobs', help="Inspect and run scheduled jobs.")
+
+
+@jobs_cli.command('list')
+def list_command():
+    """Show every scheduled job with its next run and last result."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        _ensure_rows(cursor, _now())
+        conn.commit()
+        cursor.execute("""
+            SELECT name, interval_seconds, next_run_at, last_run_at, last_status, locked_by
+            FROM scheduled_jobs ORDER BY name
+        """)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    for name, interval, next_run, last_run, status, locked_by in rows:
+        lock = f", locked by {locked_by}" if locked_by else ""
+        click.echo(f"{name}: every {interval}s, next {next_run}, last {last_run} ({status}){lock}")
+
+
+@jobs_cli.command('run')
+@click.argument('name')
+def run_command(name):
+    """Run a job now, whether or not it is due."""
+    if name not in _jobs:
+        raise click.BadParameter(f"unknown job {name!r}", param_hint="NAME")
+    status = run_job(name, force=True)
+    if status is None:
+        click.echo(f"{name} is running in another process.")
+        raise SystemExit(1)
+    click.echo(f"{name}: {status}")
+
+
+def init_app(app):
+    global enabled, tick
+    enabled = config.flag(app, "SCHEDULER_ENABLED", "1")
+    tick = float(config.setting(app, "SCHEDULER_TICK", 30))
+    job("budget_reminders", int(config.setting(app, "BUDGET_REMINDER_INTERVAL", 3600)))(budget_reminders)
+    app.cli.add_command(jobs_cli)
+    if enabled:
+        app.before_request(_ensure_started)
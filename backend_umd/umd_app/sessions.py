@@ -0,0 +1,319 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+# Server-side sessions. The cookie only carries a random session id; the
+# session data lives in a store shared by every worker, so an admin can end
+# all of a user's sessions (invalidate_user) when their role or branch
+# changes and the next request sees a logged-out session instead of a stale
+# session['user'].
+#
+# SESSION_TYPE picks the store:
+#   sqlite  a SQLite file under SESSION_FILE_DIR (default) - shared by all
+#           workers on one host
+#   redis   a Redis-compatible server (SESSION_REDIS_URL) - shared by workers
+#           on any number of hosts
+#   memory  per-process dict - only for a single worker / tests
+#   cookie  Flask's signed cookie sessions (no server-side invalidation)
+#
+# Sessions expire after PERMANENT_SESSION_LIFETIME without use. Each worker
+# runs a daemon thread, started with its first request, that deletes expired
+# sessions every SESSION_SWEEP_INTERVAL seconds.
+
+# Seconds between expiry refreshes of an unchanged session, so reads don't
+# turn into a store write on every request
+TOUCH_INTERVAL = 60
+
+_serializer = TaggedJSONSerializer()
+
+
+def _user_id(data):
+    user = data.get('user')
+    return user.get('user_id') if isinstance(user, dict) else None
+
+
+class ServerSideSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.expires = expires
+        self.loaded_user_id = _user_id(self)
+        self.modified = False
+
+
+class MemoryStore:
+    def __init__(self):
+        self._sessions = {}
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            item = self._sessions.get(sid)
+        if item is None or item[2] < time.time():
+            return None
+        return item[0], item[2]
+
+    def set(self, sid, data, user_id, expires):
+        with self._lock:
+            self._unlink(sid)
+            self._sessions[sid] = (data, user_id, expires)
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(sid)
+
+    def _unlink(self, sid):
+        item = self._sessions.pop(sid, None)
+        if item is not None and item[1] is not None:
+            sids = self._by_user.get(item[1])
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._by_user[item[1]]
+
+    def delete(self, sid):
+        with self._lock:
+            self._unlink(sid)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            sids = list(self._by_user.get(user_id, ()))
+            for sid in sids:
+                self._unlink(sid)
+        return len(sids)
+
+    def sweep(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, item in self._sessions.items() if item[2] < now]
+            for sid in expired:
+                self._unlink(sid)
+        return len(expired)
+
+
+class SQLiteStore:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                user_id INTEGER,
+                data TEXT NOT NULL,
+                expires REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_user ON sessions (user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_expires ON sessions (expires)")
+
+    def _conn(self):
+        # One connection per thread; autocommit, every call is one statement
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute(
+            "SELECT data, expires FROM sessions WHERE sid = ? AND expires >= ?",
+            (sid, time.time())).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def set(self, sid, data, user_id, expires):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, user_id, data, expires) VALUES (?, ?, ?, ?)",
+            (sid, user_id, data, expires))
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def delete_user(self, user_id):
+        return self._conn().execute("DELETE FROM sessions WHERE user_id = ?", (user_id,)).rowcount
+
+    def sweep(self):
+        return self._conn().execute("DELETE FROM sessions WHERE expires < ?", (time.time(),)).rowcount
+
+
+class RedisStore:
+    # Session keys carry their own TTL, so Redis expires them itself; the
+    # sweep only prunes dead ids from the per-user index sets
+
+    def __init__(self, url=None, client=None, prefix="umd:session:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url or "redis://localhost:6379/0")
+        self._client = client
+        self._prefix = prefix
+
+    def _key(self, sid):
+        return self._prefix + sid
+
+    def _user_key(self, user_id):
+        return f"{self._prefix}user:{user_id}"
+
+    def get(self, sid):
+        raw = self._client.get(self._key(sid))
+        if raw is None:
+            return None
+        expires, _, data = raw.decode().partition(":")
+        return data, float(expires)
+
+    def set(self, sid, data, user_id, expires):
+        ttl = max(1, int(expires - time.time()))
+        pipe = self._client.pipeline()
+        pipe.set(self._key(sid), f"{expires}:{data}", ex=ttl)
+        if user_id is not None:
+            pipe.sadd(self._user_key(user_id), sid)
+            pipe.expire(self._user_key(user_id), ttl)
+        pipe.execute()
+
+    def delete(self, sid):
+        self._client.delete(self._key(sid))
+
+    def delete_user(self, user_id):
+        user_key = self._user_key(user_id)
+        sids = [sid.decode() for sid in self._client.smembers(user_key)]
+        if sids:
+            self._client.delete(*[self._key(sid) for sid in sids])
+        self._client.delete(user_key)
+        return len(sids)
+
+    def sweep(self):
+        pruned = 0
+        for user_key in self._client.scan_iter(self._prefix + "user:*"):
+            for sid in self._client.smembers(user_key):
+                if not self._client.exists(self._key(sid.decode())):
+                    pruned += self._client.srem(user_key, sid)
+        return pruned
+
+
+class ServerSideSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            try:
+                item = self.store.get(sid)
+            except Exception as e:
+                print("Session lookup failed:", e)
+                item = None
+            if item is not None:
+                data, expires = item
+                return ServerSideSession(_serializer.loads(data), sid=sid, expires=expires)
+        return ServerSideSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if not session:
+            if not session.new:
+                self.store.delete(session.sid)
+            if session.modified or not session.new:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        user_id = _user_id(session)
+        if not session.new and user_id != session.loaded_user_id:
+            # Logging in (or switching user) gets a fresh id, so an id planted
+            # before login can't be used to ride the new session
+            self.store.delete(session.sid)
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        touch = (session.expires is not None and app.config["SESSION_REFRESH_EACH_REQUEST"]
+                 and session.expires - now < lifetime - TOUCH_INTERVAL)
+        if not (session.new or session.modified or touch):
+            return
+
+        expires = now + lifetime
+        self.store.set(session.sid, _serializer.dumps(dict(session)), user_id, expires)
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app))
+
+
+_store = None
+_sweep_interval = 300.0
+_sweeper_pid = None
+_sweeper_lock = threading.Lock()
+
+
+def invalidate_user(user_id):
+    """Log a user out everywhere; returns the number of sessions removed."""
+    if _store is None or not user_id:
+        return 0
+    try:
+        return _store.delete_user(user_id)
+    except Exception as e:
+        # The change itself already committed; the session ends at expiry
+        print("Session invalidation failed:", e)
+        return 0
+
+
+def _sweep_forever(store, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            store.sweep()
+        except Exception as e:
+            print("Session sweep failed:", e)
+
+
+def _ensure_started():
+    # Started lazily, on the first request each process serves, so every
+    # worker of a preforking server sweeps (not just a master that loaded the
+    # app before forking)
+    global _sweeper_pid
+    if _sweeper_pid == os.getpid():
+        return
+    with _sweeper_lock:
+        if _sweeper_pid == os.getpid():
+            return
+        threading.Thread(target=_sweep_forever, args=(_store, _sweep_interval),
+                         name="session-sweeper", daemon=True).start()
+        _sweeper_pid = os.getpid()
+
+
+def init_app(app):
+    global _store, _sweep_interval
+    kind = app.config.get("SESSION_TYPE", os.getenv("SESSION_TYPE", "sqlite")).lower()
+    if kind == "cookie":
+        _store = None
+        return
+    if kind == "sqlite":
+        folder = app.config.get("SESSION_FILE_DIR", os.getenv("SESSION_FILE_DIR", "./flask_sessions"))
+        _store = SQLiteStore(os.path.join(folder, "sessions.sqlite3"))
+    elif kind == "redis":
+        _store = RedisStore(app.config.get("SESSION_REDIS_URL", os.getenv("SESSION_REDIS_URL")))
+    elif kind == "memory":
+        _store = MemoryStore()
+    else:
+        raise ValueError(f"Unknown SESSION_TYPE '{kind}' (expected sqlite, redis, memory or cookie)")
+
+    app.session_interface = ServerSideSessionInterface(_store)
+    _sweep_interval = float(app.config.get("SESSION_SWEEP_INTERVAL",
+                                           os.getenv("SESSION_SWEEP_INTERVAL", 300)))
+    if _sweep_interval > 0:
+        app.before_request(_ensure_started)
@@ -19,7 +19,34 @@ const DashboardLayout = ({ children, dashboardType }) => {
     }, [navigate]);
 
     useEffect(() => {
-        fetchUnreadAlerts();
+        // Live unread count: pushed over Server-Sent Events, or long-polled
+        // where EventSource is not available
+        if (window.EventSource) {
+            const source = new EventSource('http://localhost:5000/api/alert/stream', { withCredentials: true });
+            source.addEventListener('unread_count', (e) => {
+                setUnreadCount(JSON.parse(e.data).unread_count);
+            });
+            return () => source.close();
+        }
+
+        let stopped = false;
+        const poll = async () => {
+            let since = null;
+            while (!stopped) {
+                try {
+                    const res = await API.get('/alert/poll', { params: since ? { since } : {}, withCredentials: true });
+                    res.data.events
+                        .filter(event => event.type === 'unread_count')
+                        .forEach(event => setUnreadCount(event.unread_count));
+                    since = res.data.cursor;
+                } catch (err) {
+                    console.error("Failed to fetch unread alerts count");
+                    await new Promise(resolve => setTimeout(resolve, 5000));
+                }
+            }
+        };
+        poll();
+        return () => { stopped = true; };
     }, []);
 
     const handleLogout = () => {
@@ -30,15 +57,6 @@ const DashboardLayout = ({ children, dashboardType }) => {
             });
     };
 
-    const fetchUnreadAlerts = async () => {
-        try {
-            const res = await API.get('/alert/unread-count', { withCredentials: true });
-            setUnreadCount(res.data.unread_count);
-        } catch (err) {
-            console.error("Failed to fetch unread alerts count");
-        }
-    };
-
     if (!user) return null;
 
     const roleId = user.role_id;
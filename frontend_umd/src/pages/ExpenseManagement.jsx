@@ -43,6 +43,10 @@ const ExpenseManagement = () => {
         fetchFilters();
     }, []);
 
+    useEffect(() => {
+        setPage(1);
+    }, [filterBranchId, filterYear, filterMonth, filterUtilityTypeId]);
+
     useEffect(() => {
         fetchExpenses();
     }, [page, filterBranchId, filterYear, filterMonth, filterUtilityTypeId, refresh]);
@@ -68,7 +72,10 @@ const ExpenseManagement = () => {
             }, { withCredentials: true });
 
             setExpenses(res.data.expenses);
-            setTotalPages(res.data.total_pages || 1);
+            // Only the first page carries total_pages
+            if (res.data.total_pages !== undefined) {
+                setTotalPages(res.data.total_pages);
+            }
         } catch (err) {
             toast.error('Failed to fetch expenses.');
         }